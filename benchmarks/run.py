@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+from synthetic import ROOT, generate
+from filter_commodities import process_all_files
+from port_call_frame import load_calls, VesselLookup
+from vessel_registry import VesselRegistry
+from sentiment import load_articles, score_articles
+from features import build_features, commodity_features
+from reference import load_reference
+from lags import shift_features, LagView
+from correlations import lag_correlations, rolling_correlations, feature_columns
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CORRELATION_LAGS = list(range(13))
+REGRESSION_THRESHOLD = 1.2
+
+
+# Every stage reads its inputs from `ctx` and stores its outputs there for the later stages.
+# It returns the number of rows it processed
+def parse_commodities(ctx):
+    cache_dir = tempfile.mkdtemp(dir=ctx["work_dir"])
+    with redirect_stdout(io.StringIO()):
+        df = process_all_files(os.path.join(ctx["data_dir"], "commodities"), os.path.join(ctx["work_dir"], "commodities.csv"), cache_dir=cache_dir)
+    shutil.rmtree(cache_dir)
+    ctx["commodities"] = df
+    return len(df)
+
+
+def load_port_calls(ctx):
+    ctx["calls"] = load_calls(os.path.join(ctx["data_dir"], "port_calls.csv"))
+    return len(ctx["calls"])
+
+
+# Bulk responses -> vessel registry -> attributes of every call, joined by MMSI
+def merge_vessels(ctx):
+    registry = VesselRegistry(path=os.path.join(ctx["work_dir"], "registry.parquet"))
+    for path in sorted(glob.glob(os.path.join(ctx["data_dir"], "vessels", "bulk_*.json"))):
+        with open(path, "r") as f:
+            registry.upsert(pd.DataFrame(json.load(f)["data"]))
+    vessels = registry.get(pd.unique(ctx["calls"]["mmsi"]))
+    merged = VesselLookup(vessels).attach(ctx["calls"])
+    ctx["vessels"] = vessels
+    return len(merged)
+
+
+def score_sentiment(ctx):
+    news_dir = os.path.join(ctx["data_dir"], "news")
+    articles = pd.concat([
+        load_articles(os.path.join(news_dir, "articles.csv"), "yicai"),
+        load_articles(os.path.join(news_dir, "mediastack.csv"), "mediastack"),
+    ], ignore_index=True)
+    cache_dir = tempfile.mkdtemp(dir=ctx["work_dir"])
+    ctx["sentiment"] = score_articles(articles, cache_dir=cache_dir)
+    shutil.rmtree(cache_dir)
+    return len(articles)
+
+
+def build_weekly_features(ctx):
+    matrix = build_features(ctx["calls"], ctx["vessels"], ctx["commodities"], ctx["sentiment"])
+    ctx["matrix"] = matrix
+    ctx["prices"] = commodity_features(ctx["commodities"], load_reference()).sort_index()
+    return len(matrix)
+
+
+def generate_lags(ctx):
+    prices = ctx["prices"]
+    shifted = shift_features(prices, lags=range(1, 13), leads=(1, 2, 3), windows=(4, 12))
+    view = LagView(prices, max_lag=12, max_lead=3)
+    stack = view.stack(range(13))
+    return shifted.shape[0] * shifted.shape[1] + stack.size
+
+
+def correlate(ctx):
+    matrix = ctx["matrix"]
+    features = matrix[feature_columns(matrix, ctx["prices"].columns)]
+    tensor = lag_correlations(features, ctx["prices"], CORRELATION_LAGS)
+    rolling_correlations(features, ctx["prices"], 1, 12)
+    return tensor.size
+
+
+STAGES = {
+    "parse_commodities": parse_commodities,
+    "load_port_calls": load_port_calls,
+    "merge_vessels": merge_vessels,
+    "score_sentiment": score_sentiment,
+    "build_features": build_weekly_features,
+    "generate_lags": generate_lags,
+    "correlate": correlate,
+}
+
+# Stages that do part of their work in worker processes, which tracemalloc does not see
+POOLED_STAGES = {"parse_commodities", "score_sentiment"}
+
+
+def measure(stage, ctx, repeat, memory):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = STAGES[stage](ctx)
+        seconds.append(time.perf_counter() - started)
+
+    result = {"stage": stage, "rows": int(rows), "seconds": min(seconds), "runs": seconds}
+    if memory:
+        tracemalloc.start()
+        STAGES[stage](ctx)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        result["parent_process_only"] = stage in POOLED_STAGES
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(scales, stages, repeat=1, memory=True, seed=0):
+    results = []
+    for scale in scales:
+        data_dir = generate(scale, seed)
+        ctx = {"data_dir": data_dir, "work_dir": tempfile.mkdtemp(prefix=f"bench_{scale}x_")}
+        try:
+            for stage in stages:
+                result = {"scale": scale, **measure(stage, ctx, repeat, memory)}
+                print(f"{scale:>4}x  {stage:<18} {result['seconds']:9.3f}s  {result.get('peak_mb', float('nan')):9.1f} MB  {result['rows']} rows")
+                results.append(result)
+        finally:
+            shutil.rmtree(ctx["work_dir"], ignore_errors=True)
+    return results
+
+
+# Ratio of the new to the old time of every (stage, scale) measured in both runs
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+    old = {(r["stage"], r["scale"]): r for r in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = old.get((result["stage"], result["scale"]))
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else np.inf
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{result['scale']:>4}x  {result['stage']:<18} {before['seconds']:9.3f}s -> {result['seconds']:9.3f}s  x{ratio:.2f}{flag}")
+        if flag:
+            regressions.append((result["stage"], result["scale"], ratio))
+    return regressions
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Time and memory-profile every pipeline stage on synthetic data")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES),
+                        help="Later stages use the outputs of earlier ones, so keep the order")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results/<time>_<revision>.json)")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": run(args.scales, args.stages, args.repeat, not args.no_memory, args.seed),
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%dT%H%M%S}_{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(json.load(f), report)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from vessel_sink import VESSEL_SCHEMA  # noqa: E402
+
+MAPPING_DIR = os.path.join(ROOT, "data", "mapping")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Volume of the real data at scale 1 (see notebooks/showcase.ipynb)
+PORT_CALLS = 143_203
+VESSELS = 8_741
+WEEKS = 99
+CONTRACTS_PER_ASSET = 10
+ARTICLES = 4_483
+MEDIASTACK_ARTICLES = 4_000
+BULK_SIZE = 100
+
+# The newest week of every generated history; scaling adds weeks further back
+LAST_WEEK = pd.Timestamp("2024-12-16")
+CHUNK_ROWS = 1_000_000
+
+TEXT_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+TEXT_WORDS = ["上涨", "下跌", "增长", "风险", "利好", "回落", "铜价", "港口", "非洲", "贸易", "一带一路", "期货"]
+EN_WORDS = ["markets", "rally", "growth", "port", "trade", "war", "fears", "losses", "africa", "china", "strong", "weak", "the", "of", "and"]
+
+
+def weeks(scale):
+    return pd.date_range(end=LAST_WEEK, periods=WEEKS * scale, freq="W-MON")
+
+
+def ports():
+    df = pd.read_csv(os.path.join(MAPPING_DIR, "ports_countries.csv"))
+    df["unloco"] = [f"{country[:2].upper()}{name.replace(' ', '')[:3].upper()}" for name, country in zip(df["port_name"], df["country_name"])]
+    df["port_id"] = np.arange(len(df)) + 1000
+    return df
+
+
+def vessel_mmsis(scale, rng):
+    return np.sort(rng.choice(np.arange(200_000_000, 800_000_000), size=VESSELS * scale, replace=False))
+
+
+def random_text(rng, chars, words, length):
+    pieces = rng.choice(list(chars), size=length).tolist()
+    for position in rng.integers(0, length, size=max(1, length // 40)):
+        pieces[position] = words[rng.integers(len(words))]
+    return "".join(pieces)
+
+
+# port_calls.csv with the columns of the port-calls API, written in chunks
+def write_port_calls(path, scale, rng, mmsis):
+    port_table = ports()
+    start = weeks(scale)[0].value // 10 ** 9
+    end = (LAST_WEEK + pd.Timedelta(days=7)).value // 10 ** 9
+    total = PORT_CALLS * scale
+
+    for offset in range(0, total, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, total - offset)
+        port = rng.integers(len(port_table), size=n)
+        seconds = np.sort(rng.integers(start, end, size=n))
+        time_utc = pd.to_datetime(seconds, unit="s")
+        vessel = rng.integers(len(mmsis), size=n)
+        df = pd.DataFrame({
+            "event": np.where(rng.random(n) < 0.5, "arrival", "departure"),
+            "time_utc": time_utc.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "time_local": (time_utc + pd.Timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "mmsi": mmsis[vessel],
+            "imo": np.where(rng.random(n) < 0.6, 9_000_000 + vessel, 0),
+            "vessel_name": np.char.add("VESSEL ", vessel.astype(str)),
+            "port_id": port_table["port_id"].to_numpy()[port],
+            "unloco": port_table["unloco"].to_numpy()[port],
+            "port_name": port_table["port_name"].to_numpy()[port],
+        })
+        df["imo"] = df["imo"].replace(0, pd.NA)
+        df.to_csv(path, mode="w" if offset == 0 else "a", header=offset == 0, index=False)
+
+
+# One random value per VESSEL_SCHEMA field, drawn for `n` vessels
+def vessel_column(field, n, rng, vessel_types, flags):
+    if field.name == "vessel_type":
+        return rng.choice(vessel_types, size=n).tolist()
+    if field.name == "flag":
+        return rng.choice(flags, size=n).tolist()
+    if field.name == "built":
+        return rng.integers(1960, 2025, size=n).tolist()
+    if pa.types.is_integer(field.type):
+        return rng.integers(0, 100, size=n).tolist()
+    if pa.types.is_floating(field.type):
+        return np.round(rng.random(n) * 300, 2).tolist()
+    if pa.types.is_timestamp(field.type):
+        stamps = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86400, size=n), unit="s")
+        return stamps.strftime("%Y-%m-%dT%H:%M:%SZ" if field.type.tz else "%Y-%m-%dT%H:%M:%S").tolist()
+    return [f"X{value}" for value in rng.integers(0, 10_000, size=n)]
+
+
+# Extended /vessel/bulk responses as the API returns them: {"status": ..., "data": [...]}
+def write_vessel_bulk(directory, rng, mmsis):
+    os.makedirs(directory, exist_ok=True)
+    vessel_types = pd.read_csv(os.path.join(MAPPING_DIR, "vessel_types.csv"))["Class"].to_numpy()
+    countries = pd.read_csv(os.path.join(MAPPING_DIR, "countries.csv"), sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    flags = countries["ISO-alpha2 Code"].to_numpy()
+
+    for i in range(0, len(mmsis), BULK_SIZE):
+        chunk = mmsis[i:i + BULK_SIZE]
+        columns = {field.name: vessel_column(field, len(chunk), rng, vessel_types, flags) for field in VESSEL_SCHEMA}
+        columns["mmsi"] = chunk.tolist()
+        data = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        with open(os.path.join(directory, f"bulk_{i // BULK_SIZE:06d}.json"), "w") as f:
+            json.dump({"status": "success", "data": data}, f)
+
+
+# SHFE weekly reports named <week start>--<week end>.txt, laid out like the downloaded data.txt
+def write_shfe_reports(directory, scale, rng):
+    os.makedirs(directory, exist_ok=True)
+    assets = pd.read_csv(os.path.join(MAPPING_DIR, "assets_dict.csv"))
+    prices = rng.uniform(2_000, 80_000, size=len(assets))
+
+    for start in weeks(scale):
+        end = start + pd.Timedelta(days=6)
+        prices *= np.exp(rng.normal(0, 0.02, size=len(prices)))
+        lines = ["Shanghai Futures Exchange weekly report", "Species,Open,High,...", ""]
+        for (code, name), price in zip(assets[["code", "name"]].itertuples(index=False), prices):
+            lines.append(f"Product: {name}")
+            for month in range(CONTRACTS_PER_ASSET):
+                delivery = start + pd.DateOffset(months=month + 1)
+                close = price * (1 + 0.002 * month)
+                open_ = close * (1 + rng.normal(0, 0.01))
+                high, low = max(open_, close) * 1.01, min(open_, close) * 0.99
+                volume = int(rng.integers(10, 200_000))
+                lines.append(
+                    f"{code}{delivery:%y%m}   ,{open_:.0f},{high:.0f},{low:.0f},{close:.0f},{close - open_:.0f},"
+                    f"{int(rng.integers(100, 200_000))},{int(rng.integers(-5000, 5000))},{close:.0f},{volume},{volume * close / 1e4:.2f},"
+                )
+            lines.append(f"Subtotal,,,,,,,,,{CONTRACTS_PER_ASSET},")
+        lines.append("Total,,,,,,,,,,")
+        with open(os.path.join(directory, f"{start:%Y-%m-%d}--{end:%Y-%m-%d}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+# Articles in the layouts of news.py (yicai) and news_old.py (Mediastack)
+def write_news(directory, scale, rng):
+    os.makedirs(directory, exist_ok=True)
+    start = weeks(scale)[0].value // 10 ** 9
+    end = (LAST_WEEK + pd.Timedelta(days=7)).value // 10 ** 9
+
+    n = ARTICLES * scale
+    published = pd.to_datetime(np.sort(rng.integers(start, end, size=n)), unit="s")
+    ids = np.arange(100_000_000, 100_000_000 + n)
+    pd.DataFrame({
+        "id": ids,
+        "url": [f"https://www.yicai.com/news/{i}.html" for i in ids],
+        "title": [random_text(rng, TEXT_CHARS, TEXT_WORDS, 20) for _ in range(n)],
+        "datetime": published.strftime("%Y-%m-%d %H:%M"),
+        "text": [random_text(rng, TEXT_CHARS, TEXT_WORDS, int(rng.integers(200, 800))) for _ in range(n)],
+    }).to_csv(os.path.join(directory, "articles.csv"), index=False)
+
+    n = MEDIASTACK_ARTICLES * scale
+    published = pd.to_datetime(np.sort(rng.integers(start, end, size=n)), unit="s")
+    pd.DataFrame({
+        "author": "staff",
+        "title": [" ".join(rng.choice(EN_WORDS, size=8)) for _ in range(n)],
+        "description": [" ".join(rng.choice(EN_WORDS, size=int(rng.integers(10, 60)))) for _ in range(n)],
+        "url": [f"https://example.com/{i}" for i in range(n)],
+        "source": "example",
+        "image": "",
+        "category": "general",
+        "language": "en",
+        "country": rng.choice(["us", "gb", "fr", "ae"], size=n),
+        "published_at": published.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+    }).to_csv(os.path.join(directory, "mediastack.csv"), index=False)
+
+
+# Generate (or reuse) the data set of one scale; returns its directory
+def generate(scale, seed=0, root=DATA_DIR):
+    directory = os.path.join(root, f"scale_{scale}")
+    marker = os.path.join(directory, "_generated.json")
+    if os.path.exists(marker):
+        with open(marker, "r") as f:
+            if json.load(f) == {"scale": scale, "seed": seed}:
+                return directory
+
+    rng = np.random.default_rng(seed + scale)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    mmsis = vessel_mmsis(scale, rng)
+    write_port_calls(os.path.join(directory, "port_calls.csv"), scale, rng, mmsis)
+    write_vessel_bulk(os.path.join(directory, "vessels"), rng, mmsis)
+    write_shfe_reports(os.path.join(directory, "commodities"), scale, rng)
+    write_news(os.path.join(directory, "news"), scale, rng)
+
+    with open(marker, "w") as f:
+        json.dump({"scale": scale, "seed": seed}, f)
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic inputs at multiples of the real data volume")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        print(f"Scale {scale}x: {generate(scale, args.seed)}")
@@ -1,18 +1,20 @@
 import os
 import time
 import logging
+from multiprocessing import Process
+import telemetry
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select
-from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
+from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException, TimeoutException
 
 # Logging
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - %(processName)s - %(levelname)s - %(message)s",
     handlers=[
         logging.FileHandler("logs/commodities.log"),  # Log to a file
         logging.StreamHandler()  # Log to the console
@@ -23,89 +25,143 @@ logging.basicConfig(
 DOWNLOAD_DIR = os.path.abspath("./downloads/commodities")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-chrome_opts = Options()
-prefs = {
-    "download.default_directory": DOWNLOAD_DIR,
-    "download.prompt_for_download": False,
-    "download.directory_upgrade": True,
-    "safebrowsing.enabled": True,
-}
-chrome_opts.add_experimental_option("prefs", prefs)
-
-driver = webdriver.Chrome(options=chrome_opts)
+# Number of browsers working in parallel, each on its own range of months
+WORKERS = int(os.getenv("SHFE_WORKERS", "4"))
+DOWNLOAD_TIMEOUT = 30
 
 # Base URL
 base_url = "https://tsite.shfe.com.cn/eng/reports/statistical/weekly/"
-driver.get(base_url)
-
-
-driver.implicitly_wait(10)
-
 
-def download_table(file_name):
+TABLE_XPATH = "/html/body/div[3]/div[2]/div[1]/div[1]/div/div/div/table"
+DATE_XPATH = "/html/body/div[3]/div[2]/div[2]/div[1]/div[1]/div[1]/div[2]"
+MONTH_XPATH = "/html/body/div[3]/div[2]/div[1]/div[1]/div/div/div/div/div/select[1]"
+
+# List of months in order
+months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+# Headless Chrome that downloads into its own directory, so workers never pick up each other's data.txt
+def make_driver(download_dir):
+    chrome_opts = Options()
+    chrome_opts.add_argument("--headless=new")
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+    }
+    chrome_opts.add_experimental_option("prefs", prefs)
+
+    # Explicit waits only: an implicit wait would stall on every calendar row without data
+    driver = webdriver.Chrome(options=chrome_opts)
+    driver.get(base_url)
+    return driver
+
+
+# Wait until Chrome has finished writing the file: it exists, there is no .crdownload
+# partial next to it and its size has stopped changing
+def wait_for_download(path, timeout=DOWNLOAD_TIMEOUT, poll=0.2):
+    deadline = time.monotonic() + timeout
+    last_size = -1
+    while time.monotonic() < deadline:
+        if os.path.exists(path) and not os.path.exists(path + ".crdownload"):
+            size = os.path.getsize(path)
+            if size > 0 and size == last_size:
+                return True
+            last_size = size
+        time.sleep(poll)
+    return False
+
+
+def download_table(driver, worker_dir, file_name):
+    default_file_path = os.path.join(worker_dir, "data.txt")  # Default file name
     try:
+        # A leftover from an interrupted download would be mistaken for this week's file
+        if os.path.exists(default_file_path):
+            os.remove(default_file_path)
+
         # Wait for the download button to be present
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CLASS_NAME, "sqs_Contract_TXT"))
         )
         driver.find_element(By.CLASS_NAME, "sqs_Contract_TXT").click()
 
-        time.sleep(5)
-
-        # Rename the downloaded file
-        default_file_path = os.path.join(DOWNLOAD_DIR, "data.txt")  # Default file name
+        # Move the downloaded file to the shared directory, named by date
         new_file_path = os.path.join(DOWNLOAD_DIR, f"{file_name}.txt")  # Rename to date
-        if os.path.exists(default_file_path):
-            os.rename(default_file_path, new_file_path)
-            logging.info(f"File renamed to: {new_file_path}")
+        if wait_for_download(default_file_path):
+            os.replace(default_file_path, new_file_path)
+            logging.info(f"File saved to: {new_file_path}")
         else:
             logging.error(f"Default file '{default_file_path}' not found.")
     except Exception as e:
         logging.error(f"Error downloading table: {e}")
 
 
-def get_date():
+def read_date(driver):
+    date = driver.find_element(By.XPATH, DATE_XPATH).text.strip().replace("Date: ", "")
+    return date.replace("/", "-")  # Replace slashes with dashes for file naming
+
+
+# Date of the selected week; after a click we wait for it to differ from the previous one
+def get_date(driver, previous=None):
     try:
         # Wait for the date element to be present
-        date_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "/html/body/div[3]/div[2]/div[2]/div[1]/div[1]/div[1]/div[2]")
-            )
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.XPATH, DATE_XPATH))
         )
-        date = date_element.text.strip().replace("Date: ", "")
+        if previous is not None:
+            try:
+                WebDriverWait(driver, 10).until(lambda d: read_date(d) != previous)
+            except TimeoutException:
+                logging.warning(f"Date did not change after {previous}")
+
+        date = read_date(driver)
         logging.info(f"Date found: {date}")
-        return date.replace("/", "-")  # Replace slashes with dashes for file naming
+        return date
     except Exception as e:
         logging.error(f"Error retrieving date: {e}")
         return "unknown_date"
 
 
-def navigate_calendar():
+# Download every week of the month shown in the calendar. `previous` is the date shown before
+# the first click (carried over from the previous month), so the first click of a month also waits
+# for the date to change instead of reading the last week of the previous month; returns the last date
+def navigate_calendar(driver, worker_dir, previous=None):
     try:
         # Locate the table containing rows
-        table = driver.find_element(
-            By.XPATH, "/html/body/div[3]/div[2]/div[1]/div[1]/div/div/div/table"
+        table = WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.XPATH, TABLE_XPATH))
         )
+        if previous is None:
+            try:
+                previous = read_date(driver)
+            except NoSuchElementException:
+                pass
         rows = table.find_elements(By.TAG_NAME, "tr")
 
         for i in range(len(rows)):
             try:
                 # Re-fetch the table and rows to avoid stale element issues
-                table = driver.find_element(
-                    By.XPATH, "/html/body/div[3]/div[2]/div[1]/div[1]/div/div/div/table"
-                )
+                table = driver.find_element(By.XPATH, TABLE_XPATH)
                 rows = table.find_elements(By.TAG_NAME, "tr")
 
                 # Find the specific row and click the element with class "has-data"
                 row = rows[i]
-                button = row.find_element(By.CLASS_NAME, "has-data")
-                button.click()
-
-                # Get the date and use it to name the downloaded file
-                date = get_date()
-                download_table(date)
-
-                time.sleep(2)
+                buttons = row.find_elements(By.CLASS_NAME, "has-data")
+                if not buttons:
+                    continue
+                buttons[0].click()
+
+                # Get the date and skip it if this week is already on disk
+                date = get_date(driver, previous)
+                previous = date
+                if os.path.exists(os.path.join(DOWNLOAD_DIR, f"{date}.txt")):
+                    logging.info(f"{date} already downloaded, skipping")
+                    continue
+
+                with telemetry.span("shfe_download") as span:
+                    download_table(driver, worker_dir, date)
+                    span.set(week=date, saved=os.path.exists(os.path.join(DOWNLOAD_DIR, f"{date}.txt")))
 
             except NoSuchElementException:
                 logging.warning(f"No clickable element found in row {i}. Skipping...")
@@ -116,49 +172,75 @@ def navigate_calendar():
 
     except Exception as e:
         logging.error(f"Error navigating calendar: {e}")
+    return previous
 
 
-def change_month():
+def select_month(driver, month):
     try:
         # Locate the dropdown menu
         dropdown = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "/html/body/div[3]/div[2]/div[1]/div[1]/div/div/div/div/div/select[1]")
-            )
+            EC.presence_of_element_located((By.XPATH, MONTH_XPATH))
         )
-        select = Select(dropdown)
-
-        # Get the current selected month
-        current_month = select.first_selected_option.text.strip()
-        logging.info(f"Current month: {current_month}")
+        table = driver.find_element(By.XPATH, TABLE_XPATH)
 
-        # List of months in order
-        months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-
-        # Find the index of the current month and calculate the next month
-        current_index = months.index(current_month)
-        next_index = (current_index + 1) % len(months)  # Wrap around to "Jan" after "Dec"
-        next_month = months[next_index]
+        select = Select(dropdown)
+        if select.first_selected_option.text.strip() == month:
+            return
 
-        # Select the next month
-        select.select_by_visible_text(next_month)
-        logging.info(f"Changed to next month: {next_month}")
+        select.select_by_visible_text(month)
+        logging.info(f"Changed to month: {month}")
 
-        time.sleep(2)
+        # The calendar is re-rendered for the new month
+        try:
+            WebDriverWait(driver, 5).until(EC.staleness_of(table))
+        except TimeoutException:
+            pass
 
     except Exception as e:
         logging.error(f"Error changing month: {e}")
 
 
-# Main loop to navigate through all months and download files
-def main():
+# One browser downloading the weeks of `month_indices` (e.g. [3, 4, 5] for Apr-Jun)
+def worker(worker_id, month_indices):
+    worker_dir = os.path.join(DOWNLOAD_DIR, f".worker_{worker_id}")
+    os.makedirs(worker_dir, exist_ok=True)
+    telemetry.configure("commodities", instance=f"worker-{worker_id}")
+
+    driver = make_driver(worker_dir)
     try:
-        for _ in range(12):  # Loop through all 12 months
-            navigate_calendar()
-            change_month()
+        previous = None
+        for index in month_indices:
+            select_month(driver, months[index])
+            previous = navigate_calendar(driver, worker_dir, previous)
     finally:
         driver.quit()
+        # Process children exit without running atexit handlers
+        telemetry.flush()
+
+
+# Split the 12 months into contiguous, disjoint ranges
+def split_months(workers):
+    workers = max(1, min(workers, len(months)))
+    size, extra = divmod(len(months), workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+# Main: navigate through all months with parallel browsers and download files
+def main():
+    processes = [
+        Process(target=worker, args=(i, month_indices), name=f"worker-{i}")
+        for i, month_indices in enumerate(split_months(WORKERS))
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
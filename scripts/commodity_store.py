@@ -0,0 +1,116 @@
+import os
+import sys
+import logging
+import numpy as np
+import pandas as pd
+from reference import load_reference
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+INPUT_FILE = os.path.join(DATA_DIR, "commodities", "commodities_cleaned.csv")
+STORE_FILE = os.path.join(DATA_DIR, "commodities", "commodities.parquet")
+
+# Report columns -> store columns
+COLUMN_NAMES = {
+    "Species": "contract",
+    "Weekly Opening Price": "open",
+    "High": "high",
+    "Low": "low",
+    "Weekly Close": "close",
+    "Net Change": "net_change",
+    "Open Interest": "open_interest",
+    "O.I Change": "oi_change",
+    "Weekly Volume": "weekly_volume",
+    "Volume": "volume",
+    "Turnover": "turnover",
+    "Week Start": "week_start",
+    "Week End": "week_end",
+}
+
+FLOAT_COLUMNS = ["open", "high", "low", "close", "net_change", "weekly_volume", "volume", "turnover"]
+INT_COLUMNS = ["open_interest", "oi_change"]
+
+
+# Decode contract codes (cu2406 -> COPPER, delivery 2024-06) and type every column once.
+# The result is sorted by (asset, week_start, contract_month, contract)
+def build_store(raw, reference=None):
+    reference = reference or load_reference()
+
+    df = raw.rename(columns=COLUMN_NAMES)
+    df = df[[column for column in COLUMN_NAMES.values() if column in df.columns]].copy()
+
+    df["contract"] = df["contract"].astype("string").str.strip()
+    parts = df["contract"].str.extract(r"^(?P<asset_code>[a-z]+)(?P<yy>\d{2})(?P<mm>\d{2})$")
+    df["asset_code"] = parts["asset_code"].astype("category")
+    df["asset"] = reference.asset.map(parts["asset_code"]).cat.reorder_categories(sorted(reference.asset.categories))
+    df["contract_month"] = pd.to_datetime("20" + parts["yy"] + "-" + parts["mm"] + "-01", errors="coerce")
+
+    unknown = df.loc[df["asset"].isna(), "contract"].unique()
+    if len(unknown):
+        logging.warning(f"Dropping {len(unknown)} contracts with unknown asset codes: {list(unknown)[:10]}")
+        df = df[df["asset"].notna()]
+
+    for column in FLOAT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    for column in INT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+    df["week_start"] = pd.to_datetime(df["week_start"])
+    df["week_end"] = pd.to_datetime(df["week_end"])
+    df["contract"] = df["contract"].astype("category")
+
+    columns = ["asset", "asset_code", "contract", "contract_month", "week_start", "week_end"]
+    df = df[columns + [column for column in df.columns if column not in columns]]
+    df = df.sort_values(["asset", "week_start", "contract_month", "contract"], kind="stable", ignore_index=True)
+    return df
+
+
+def write_store(df, path=STORE_FILE):
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False, row_group_size=8192)
+    os.replace(tmp_path, path)
+    logging.info(f"Commodity store with {len(df)} rows saved to {path}")
+
+
+# In-memory view of the store. Rows are sorted by (asset, week_start, contract), so
+# "all contracts of an asset for a range of weeks" is two binary searches and a slice
+class CommodityStore:
+    def __init__(self, df):
+        self.df = df
+        self.assets = df["asset"].cat.categories
+        self._asset_codes = df["asset"].cat.codes.to_numpy()
+        self._weeks = df["week_start"].to_numpy()
+
+        # Row range of every asset: asset i occupies rows [bounds[i], bounds[i + 1])
+        self._bounds = np.searchsorted(self._asset_codes, np.arange(len(self.assets) + 1))
+
+    @classmethod
+    def load(cls, path=STORE_FILE):
+        return cls(pd.read_parquet(path))
+
+    def _rows(self, asset, start=None, end=None):
+        i = self.assets.get_loc(asset)
+        lo, hi = self._bounds[i], self._bounds[i + 1]
+
+        weeks = self._weeks[lo:hi]
+        if start is not None:
+            lo += np.searchsorted(weeks, np.datetime64(pd.Timestamp(start)), side="left")
+            weeks = self._weeks[lo:hi]
+        if end is not None:
+            hi = lo + np.searchsorted(weeks, np.datetime64(pd.Timestamp(end)), side="right")
+        return lo, hi
+
+    # All contracts of `asset` with week_start in [start, end]
+    def query(self, asset, start=None, end=None, columns=None):
+        lo, hi = self._rows(asset, start, end)
+        df = self.df.iloc[lo:hi]
+        return df if columns is None else df[columns]
+
+    def query_many(self, assets, start=None, end=None, columns=None):
+        frames = [self.query(asset, start, end, columns) for asset in assets]
+        return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    input_file = sys.argv[1] if len(sys.argv) > 1 else INPUT_FILE
+    write_store(build_store(pd.read_csv(input_file)))
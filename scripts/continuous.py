@@ -0,0 +1,149 @@
+import os
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from commodity_store import STORE_FILE, build_store
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+OUTPUT_FILE = os.path.join(DATA_DIR, "commodities", "continuous.csv")
+
+# Roll rules for the front-month series:
+#   calendar       nearest contract whose delivery month starts more than `roll_days` after the week
+#   open_interest  contract with the largest open interest that week
+#   volume         contract with the largest volume that week
+# Liquidity rules never roll back to an earlier delivery month (monotonic)
+ROLL_RULES = ("calendar", "open_interest", "volume")
+RULE_COLUMNS = {"open_interest": "open_interest", "volume": "volume"}
+ADJUSTMENTS = ("none", "difference", "ratio")
+KEYS = ["asset", "week_start"]
+
+
+# Store rows as plain float columns, sorted by (asset, week_start, contract_month)
+def contracts_frame(store):
+    df = store[["asset", "contract", "contract_month", "week_start", "close", "open_interest", "volume"]].copy()
+    df["open_interest"] = df["open_interest"].astype("float64")
+    df["asset"] = df["asset"].cat.remove_unused_categories()
+    return df.sort_values(["asset", "week_start", "contract_month"], kind="stable", ignore_index=True)
+
+
+# Row of the selected contract for every (asset, week) under one rule, as a Series indexed by KEYS
+def select_rows(df, rule, roll_days=0):
+    if rule == "calendar":
+        eligible = df["contract_month"] - pd.Timedelta(days=roll_days) > df["week_start"]
+        return df[eligible].groupby(KEYS, observed=True).head(1).set_index(KEYS)["row"]
+    if rule not in RULE_COLUMNS:
+        raise ValueError(f"Unknown roll rule {rule!r}, expected one of {ROLL_RULES}")
+
+    # Delivery-month contracts are being closed out, so their liquidity is no signal
+    value = df[RULE_COLUMNS[rule]].where(df["contract_month"] > df["week_start"]).fillna(-1)
+    rows = df.loc[value.groupby([df["asset"], df["week_start"]], observed=True).idxmax().to_numpy(), KEYS + ["contract_month", "row"]]
+
+    # Monotonic: once rolled forward, stay on the latest delivery month reached so far
+    rows["target"] = rows.groupby("asset", observed=True)["contract_month"].cummax()
+    later = df.set_index(KEYS + ["contract_month"])["row"]
+    target = later.reindex(pd.MultiIndex.from_frame(rows[KEYS + ["target"]])).to_numpy()
+    rows["row"] = np.where(np.isnan(target), rows["row"], target).astype(np.int64)
+    return rows.set_index(KEYS)["row"]
+
+
+# Front-month series of every asset in one pass per rule in use. `asset_rules` overrides `rule`
+# for single assets. The back-adjusted close removes the jump at every roll: "difference" shifts
+# earlier prices by the gap, "ratio" scales them
+def front_month(store, rule="calendar", roll_days=0, adjust="difference", asset_rules=None):
+    if adjust not in ADJUSTMENTS:
+        raise ValueError(f"Unknown adjustment {adjust!r}, expected one of {ADJUSTMENTS}")
+    df = contracts_frame(store)
+    df["row"] = np.arange(len(df))
+
+    asset_rules = asset_rules or {}
+    rules = df["asset"].map({asset: asset_rules.get(asset, rule) for asset in df["asset"].cat.categories})
+    rules = rules.astype(str).to_numpy()
+    rows = pd.concat([select_rows(df[rules == name], name, roll_days) for name in sorted(set(rules))]).sort_index()
+
+    front = df.loc[rows.to_numpy(), KEYS + ["contract", "contract_month", "close", "open_interest", "volume"]].reset_index(drop=True)
+    previous = front.groupby("asset", observed=True)["contract"].shift()
+    front["rolled"] = previous.notna() & (front["contract"] != previous)
+
+    # Close of the contract rolled out of, in the roll week
+    closes = df.set_index(KEYS + ["contract"])["close"]
+    old_close = closes.reindex(pd.MultiIndex.from_arrays([front["asset"], front["week_start"], previous.astype(object)])).to_numpy()
+    gap = np.where(front["rolled"] & ~np.isnan(old_close), front["close"] - old_close, 0.0)
+    ratio = np.where(front["rolled"] & ~np.isnan(old_close) & (old_close > 0), front["close"] / old_close, 1.0)
+
+    # Every roll adjusts all earlier weeks of its asset: reverse cumulative sum/product, excluding the roll week
+    by_asset = front["asset"].to_numpy(dtype=object)
+    if adjust == "difference":
+        later = pd.Series(gap[::-1]).groupby(by_asset[::-1]).cumsum().to_numpy()[::-1] - gap
+        front["adjusted_close"] = front["close"] + later
+    elif adjust == "ratio":
+        later = pd.Series(ratio[::-1]).groupby(by_asset[::-1]).cumprod().to_numpy()[::-1] / ratio
+        front["adjusted_close"] = front["close"] * later
+    else:
+        front["adjusted_close"] = front["close"]
+    return front
+
+
+# Open-interest- and volume-weighted closes of every (asset, week); weeks where the weights sum to
+# zero get NaN. Delivery-month contracts are left out unless `include_delivery`
+def weighted_closes(store, include_delivery=False):
+    df = contracts_frame(store)
+    if not include_delivery:
+        df = df[df["contract_month"] > df["week_start"]]
+    out = {}
+    for name, column in (("oi_weighted_close", "open_interest"), ("volume_weighted_close", "volume")):
+        weights = df[column].fillna(0).clip(lower=0)
+        sums = pd.DataFrame({"value": df["close"] * weights, "weight": weights.where(df["close"].notna(), 0)})
+        grouped = sums.groupby([df["asset"], df["week_start"]], observed=True).sum()
+        out[name] = grouped["value"] / grouped["weight"].replace(0, np.nan)
+    return pd.DataFrame(out)
+
+
+# All continuous series, one row per (asset, week)
+def continuous_series(store, rule="calendar", roll_days=0, adjust="difference", asset_rules=None, include_delivery=False):
+    front = front_month(store, rule, roll_days, adjust, asset_rules).set_index(KEYS)
+    front.columns = [column if column in ("rolled", "adjusted_close") else f"front_{column}" for column in front.columns]
+    return front.join(weighted_closes(store, include_delivery), how="outer")
+
+
+# One series as a week x asset frame, the layout of commodity_features
+def wide(series, column):
+    out = series[column].unstack("asset")
+    out.columns = out.columns.astype(object)
+    return out
+
+
+def load_store(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return build_store(pd.read_csv(path))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Build continuous front-month, OI- and volume-weighted series of every SHFE asset")
+    parser.add_argument("source", nargs="?", default=STORE_FILE, help="Commodity store (Parquet) or a cleaned commodities CSV")
+    parser.add_argument("--rule", default="calendar", choices=ROLL_RULES)
+    parser.add_argument("--asset-rule", nargs="*", default=[], metavar="ASSET=RULE", help="Roll rule overrides, e.g. GOLD=open_interest")
+    parser.add_argument("--roll-days", type=int, default=0, help="Calendar rule: roll this many days before the delivery month")
+    parser.add_argument("--adjust", default="difference", choices=ADJUSTMENTS)
+    parser.add_argument("--include-delivery", action="store_true", help="Weight delivery-month contracts too")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--wide", help="Write only this column as a week x asset table (e.g. adjusted_close)")
+    args = parser.parse_args()
+
+    asset_rules = dict(item.split("=", 1) for item in args.asset_rule)
+    unknown = set(asset_rules.values()) - set(ROLL_RULES)
+    if unknown:
+        parser.error(f"Unknown roll rules: {', '.join(sorted(unknown))}")
+
+    series = continuous_series(load_store(args.source), args.rule, args.roll_days, args.adjust, asset_rules, args.include_delivery)
+    rolls = int(series["rolled"].sum())
+    out = wide(series, args.wide) if args.wide else series
+    out.to_csv(args.output)
+    logging.info(f"{len(series)} asset-weeks ({rolls} rolls) saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
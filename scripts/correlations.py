@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from lags import LagView
+from reference import load_reference
+from features import DATA_DIR, commodity_features, read_matrix, OUTPUT_FILE
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache", "correlations")
+IMAGES_DIR = os.path.join(DATA_DIR, "..", "misc", "images")
+MIN_PERIODS = 3
+
+
+# Column-wise z-scores ignoring NaNs. Pearson correlation does not change, but the moment sums
+# below stay O(n) instead of O(n * price^2), so float64 cancellation is not an issue
+def standardize(values):
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(values, axis=-2, keepdims=True)
+        std = np.nanstd(values, axis=-2, keepdims=True)
+        return (values - mean) / np.where(std > 0, std, np.nan)
+
+
+# Pairwise-complete Pearson correlation between the columns of a (..., n, p) and b (..., n, q),
+# batched over the leading axes: every moment is one matmul of masked matrices
+def masked_corr(a, b, min_periods=MIN_PERIODS):
+    ma, mb = ~np.isnan(a), ~np.isnan(b)
+    a0, b0 = np.where(ma, a, 0.0), np.where(mb, b, 0.0)
+    fa, fb = ma.astype(np.float64), mb.astype(np.float64)
+
+    def t(x):
+        return np.swapaxes(x, -1, -2)
+
+    n = t(fa) @ fb
+    sa, sb = t(a0) @ fb, t(fa) @ b0
+    saa, sbb = t(a0 * a0) @ fb, t(fa) @ (b0 * b0)
+    sab = t(a0) @ b0
+    return _pearson(n, sa, sb, saa, sbb, sab, min_periods)
+
+
+def _pearson(n, sa, sb, saa, sbb, sab, min_periods):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sab - sa * sb / n
+        var_a = saa - sa * sa / n
+        var_b = sbb - sb * sb / n
+        r = cov / np.sqrt(var_a * var_b)
+    r[(n < min_periods) | ~(var_a > 1e-12 * n) | ~(var_b > 1e-12 * n)] = np.nan
+    return np.clip(r, -1, 1)
+
+
+# Feature columns of final_df: everything that is not an asset price or one of its lags
+def feature_columns(matrix, assets):
+    pattern = re.compile(r"^(?:%s)(?:_lag\d+)?$" % "|".join(re.escape(asset) for asset in assets))
+    return [column for column in matrix.columns if not pattern.match(column)]
+
+
+# Prices k report weeks after every week of `weeks` for each k in `lags` (k = 0 is the week
+# itself), as a (lags, weeks, assets) array. Same convention as the `_lag{k}` columns of final_df
+def lagged_prices(prices, weeks, lags):
+    view = LagView(prices, max_lead=max(max(lags), 0), max_lag=max(-min(lags), 0), dtype=np.float64)
+    positions = prices.index.get_indexer(weeks)
+    if (positions < 0).any():
+        raise ValueError(f"{(positions < 0).sum()} weeks have no commodity report")
+    return view.stack([-k for k in lags])[:, positions, :]
+
+
+# Correlation of every feature with every asset price at every lag: a (features, assets, lags) tensor
+def lag_correlations(features, prices, lags, min_periods=MIN_PERIODS):
+    x = standardize(features.to_numpy(dtype=np.float64))
+    y = standardize(lagged_prices(prices, features.index, lags))
+    return masked_corr(x[None], y, min_periods).transpose(1, 2, 0)
+
+
+# Full (features + assets) x (features + assets) matrix of every lag, the layout of the
+# Lag{k}_correlation_heatmap.png images: a (lags, columns, columns) tensor
+def lag_matrices(features, prices, lags, min_periods=MIN_PERIODS):
+    x = standardize(features.to_numpy(dtype=np.float64))
+    y = standardize(lagged_prices(prices, features.index, lags))
+    z = np.concatenate([np.broadcast_to(x, (len(lags),) + x.shape), y], axis=2)
+    return masked_corr(z, z, min_periods)
+
+
+# Correlation of every feature with every asset over the trailing `window` weeks ending at each
+# row, as a (weeks, features, assets) tensor. Moments are cumulative sums, so every window is a
+# difference of two rows and the cost does not depend on the window length
+def rolling_correlations(features, prices, lag, window, min_periods=MIN_PERIODS):
+    x = features.to_numpy(dtype=np.float64)
+    y = lagged_prices(prices, features.index, [lag])[0]
+    x, y = standardize(x), standardize(y)
+
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    fx, fy = mx.astype(np.float64), my.astype(np.float64)
+
+    def windowed(a, b):
+        sums = np.cumsum(np.einsum("nf,na->nfa", a, b), axis=0)
+        sums = np.concatenate([np.zeros((1,) + sums.shape[1:]), sums])
+        start = np.maximum(np.arange(1, len(a) + 1) - window, 0)
+        return sums[1:] - sums[start]
+
+    return _pearson(
+        windowed(fx, fy), windowed(x0, fy), windowed(fx, y0),
+        windowed(x0 * x0, fy), windowed(fx, y0 * y0), windowed(x0, y0), min_periods,
+    )
+
+
+def input_hash(features, prices):
+    digest = hashlib.sha1()
+    for frame in (features, prices):
+        digest.update("\x1f".join(map(str, frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Correlation results of one (features, prices) input, persisted to <cache_dir>/<input hash>.npz.
+# Each lag and each (lag, window) pair is computed once; asking for new lags or windows only
+# computes the missing ones, and a changed input gets a new file
+class CorrelationCache:
+    def __init__(self, features, prices, cache_dir=CACHE_DIR, min_periods=MIN_PERIODS):
+        self.features = features
+        self.prices = prices
+        self.min_periods = min_periods
+        self.path = os.path.join(cache_dir, f"{input_hash(features, prices)}.npz")
+        self.arrays = dict(np.load(self.path)) if os.path.exists(self.path) else {}
+        self._dirty = False
+
+    def _missing(self, kind, lags):
+        return [k for k in lags if f"{kind}_{k}" not in self.arrays]
+
+    # (features, assets, lags) tensor
+    def lags(self, lags):
+        missing = self._missing("lag", lags)
+        if missing:
+            tensor = lag_correlations(self.features, self.prices, missing, self.min_periods)
+            for i, k in enumerate(missing):
+                self.arrays[f"lag_{k}"] = tensor[:, :, i]
+            self._dirty = True
+        return np.stack([self.arrays[f"lag_{k}"] for k in lags], axis=2)
+
+    # (weeks, features, assets) tensor of rolling correlations at one lag
+    def rolling(self, lag, window):
+        name = f"rolling_{lag}_{window}"
+        if name not in self.arrays:
+            self.arrays[name] = rolling_correlations(self.features, self.prices, lag, window, self.min_periods)
+            self._dirty = True
+        return self.arrays[name]
+
+    # Heatmap matrix of one lag as a labelled frame (lag 0 columns are the plain asset names)
+    def matrix(self, lag):
+        missing = self._missing("matrix", [lag])
+        if missing:
+            self.arrays[f"matrix_{lag}"] = lag_matrices(self.features, self.prices, missing, self.min_periods)[0]
+            self._dirty = True
+        suffix = f"_lag{lag}" if lag else ""
+        labels = list(self.features.columns) + [f"{asset}{suffix}" for asset in self.prices.columns]
+        return pd.DataFrame(self.arrays[f"matrix_{lag}"], index=labels, columns=labels)
+
+    def frame(self, lags):
+        tensor = self.lags(lags)
+        index = pd.MultiIndex.from_product([self.features.columns, self.prices.columns], names=["feature", "asset"])
+        return pd.DataFrame(tensor.reshape(-1, len(lags)), index=index, columns=[f"lag{k}" for k in lags])
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **self.arrays)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def plot_heatmap(matrix, title, path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(30, 20))
+    sns.heatmap(matrix, cmap="vlag", center=0, mask=np.eye(len(matrix), dtype=bool), xticklabels=True, yticklabels=True)
+    plt.title(title, fontsize=20)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Feature x asset x lag correlations of the weekly feature matrix")
+    parser.add_argument("--matrix", default=OUTPUT_FILE)
+    parser.add_argument("--commodities", default=os.path.join(DATA_DIR, "commodities", "commodities_cleaned.csv"))
+    parser.add_argument("--lags", type=int, nargs="+", default=[0, 1, 2, 3])
+    parser.add_argument("--windows", type=int, nargs="*", default=[], help="Rolling windows (weeks) to compute for every lag")
+    parser.add_argument("--output", help="CSV for the (feature, asset) x lag table")
+    parser.add_argument("--plot", nargs="?", const=IMAGES_DIR, help="Write Lag{k}_correlation_heatmap.png to this directory")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    prices = commodity_features(pd.read_csv(args.commodities), load_reference()).sort_index()
+    matrix = read_matrix(args.matrix)
+    features = matrix[feature_columns(matrix, prices.columns)]
+
+    started = time.perf_counter()
+    cache = CorrelationCache(features, prices, args.cache_dir)
+    table = cache.frame(args.lags)
+    for window in args.windows:
+        for lag in args.lags:
+            cache.rolling(lag, window)
+    logging.info(f"Correlations for lags {args.lags} ready in {time.perf_counter() - started:.3f}s")
+
+    if args.output:
+        table.to_csv(args.output)
+    if args.plot:
+        for lag in args.lags:
+            plot_heatmap(cache.matrix(lag), f"Lag {lag} correlation matrix", os.path.join(args.plot, f"Lag{lag}_correlation_heatmap.png"))
+    cache.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import re
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "cache", "dedup_index.npz")
+
+SHINGLE_SIZE = 5  # characters: yicai texts have no word boundaries
+NUM_PERM = 128
+BANDS = 16  # 16 bands of 8 rows: pairs above ~0.7 Jaccard become candidates
+THRESHOLD = 0.8
+CHUNK_SIZE = 5000
+SEED = 42
+
+# Columns that make up the text of an article, per source
+TEXT_COLUMNS = {
+    "yicai": ["title", "text"],
+    "mediastack": ["description"],
+}
+
+# Column that identifies an article across reruns, per source. Row numbers are not stable:
+# news_old.py rebuilds data/news.csv in month order and refetched pages land in earlier months
+ID_COLUMNS = {
+    "yicai": "id",
+    "mediastack": "url",
+}
+
+KEY_SCHEME = 2  # saved with the index; older indexes were keyed by row number
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", str(text).lower()).strip()
+
+
+# Hashes of all character k-grams of a text, as unique uint64 values. Code points are combined
+# with a polynomial hash over a sliding window, so there is no Python loop over shingles
+def shingle_hashes(text, k=SHINGLE_SIZE):
+    codes = np.frombuffer(normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return codes
+    if len(codes) < k:
+        codes = np.concatenate([codes, np.zeros(k - len(codes), dtype=np.uint64)])
+    powers = np.uint64(1000003) ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        hashes = sliding_window_view(codes, k) @ powers
+    return np.unique(hashes)
+
+
+# MinHash over a multiply-shift hash family: h_i(x) = (a_i * x + b_i) >> 32 with odd a_i
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    # (num_perm,) uint32 signature, or None for an empty text
+    def signature(self, text):
+        shingles = shingle_hashes(text)
+        if len(shingles) == 0:
+            return None
+        with np.errstate(over="ignore"):
+            hashed = (self.a[:, None] * shingles[None, :] + self.b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+# LSH index of MinHash signatures. Only signatures and band buckets are kept (about 0.6 KB per
+# indexed article), never texts; a lookup touches one bucket per band instead of every article
+class NearDuplicateIndex:
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD, seed=SEED):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.seed = seed
+        self.keys = []
+        self.previous = set()
+        self.signatures = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, key, signature):
+        position = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(position)
+
+    # Key of the most similar indexed article with estimated Jaccard similarity >= threshold
+    def query(self, text=None, signature=None):
+        signature = self.hasher.signature(text) if signature is None else signature
+        if signature is None:
+            return None
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        if not candidates:
+            return None
+
+        candidates = sorted(candidates)
+        similarity = (np.stack([self.signatures[i] for i in candidates]) == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        return self.keys[candidates[best]] if similarity[best] >= self.threshold else None
+
+    # Index an article unless it duplicates one already indexed; returns the key of that original.
+    # Duplicates are not indexed, so memory grows with the number of distinct stories. An article
+    # indexed under the same key in an earlier run is an original, not a duplicate of itself; a
+    # second row with that key in the same run is checked like any other
+    def add(self, key, text):
+        if key in self.previous:
+            self.previous.discard(key)
+            return None
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        original = self.query(signature=signature)
+        if original is None:
+            self._insert(key, signature)
+        return original
+
+    def save(self, path=INDEX_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        signatures = np.stack(self.signatures) if self.signatures else np.empty((0, self.hasher.num_perm), dtype=np.uint32)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, keys=np.array(self.keys, dtype=str), signatures=signatures,
+                params=np.array([self.hasher.num_perm, self.bands, self.seed]), threshold=self.threshold,
+                key_scheme=KEY_SCHEME,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        data = np.load(path)
+        if "key_scheme" not in data or int(data["key_scheme"]) != KEY_SCHEME:
+            raise ValueError(f"{path} uses an older key scheme")
+        num_perm, bands, seed = (int(value) for value in data["params"])
+        index = cls(num_perm, bands, float(data["threshold"]), seed)
+        for key, signature in zip(data["keys"].tolist(), data["signatures"]):
+            index._insert(key, signature)
+        index.previous = set(index.keys)
+        return index
+
+
+def article_texts(chunk, source):
+    columns = TEXT_COLUMNS[source]
+    return chunk[columns].fillna("").astype(str).agg("\n".join, axis=1)
+
+
+# Stable index keys: the source's id column, or a hash of the text for rows without one
+def article_keys(chunk, source, texts):
+    column = ID_COLUMNS[source]
+    ids = chunk[column] if column in chunk.columns else pd.Series(np.nan, index=chunk.index)
+    hashes = texts.map(lambda text: "sha1-" + hashlib.sha1(normalize(text).encode("utf-8")).hexdigest())
+    return (f"{source}:" + ids.fillna(hashes).astype(str)).tolist()
+
+
+# Stream a news CSV through the index in chunks, writing the rows that are not near-duplicates
+# of anything seen before (in this file, earlier files or earlier runs) to `output_file`
+def dedup_file(index, path, source, output_file, chunksize=CHUNK_SIZE):
+    name = os.path.basename(path)
+    kept = dropped = 0
+    header = True
+    tmp_path = output_file + ".tmp"
+    for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize):
+        texts = article_texts(chunk, source)
+        keys = article_keys(chunk, source, texts)
+        keep = np.ones(len(chunk), dtype=bool)
+        for i, (key, text) in enumerate(zip(keys, texts)):
+            if index.add(key, text) is not None:
+                keep[i] = False
+        chunk[keep].to_csv(tmp_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        kept += int(keep.sum())
+        dropped += int((~keep).sum())
+    os.replace(tmp_path, output_file)
+    logging.info(f"{name}: kept {kept} articles, dropped {dropped} near-duplicates")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Drop near-duplicate news articles with a persistent MinHash/LSH index")
+    parser.add_argument("--yicai", nargs="*", default=[], help="CSVs with title and text columns (news.py)")
+    parser.add_argument("--mediastack", nargs="*", default=[], help="CSVs with a description column (news_old.py)")
+    parser.add_argument("--output-dir", required=True, help="Deduplicated copies are written here under the same names")
+    parser.add_argument("--index", default=INDEX_FILE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--fresh", action="store_true", help="Start from an empty index")
+    args = parser.parse_args()
+
+    index = None
+    if os.path.exists(args.index) and not args.fresh:
+        try:
+            index = NearDuplicateIndex.load(args.index)
+            index.threshold = args.threshold
+            logging.info(f"Loaded an index of {len(index)} articles from {args.index}")
+        except ValueError as e:
+            logging.warning(f"{e}, rebuilding the index from scratch")
+    if index is None:
+        index = NearDuplicateIndex(threshold=args.threshold)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    inputs = [(path, "yicai") for path in args.yicai] + [(path, "mediastack") for path in args.mediastack]
+    for path, source in inputs:
+        dedup_file(index, path, source, os.path.join(args.output_dir, os.path.basename(path)))
+
+    index.save(args.index)
+    logging.info(f"Index of {len(index)} articles saved to {args.index}")
+
+
+if __name__ == "__main__":
+    main()
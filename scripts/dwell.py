@@ -0,0 +1,237 @@
+import os
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import telemetry
+from port_call_frame import load_calls
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+OUTPUT_FILE = os.path.join(DATA_DIR, "port_congestion.csv")
+
+ARRIVAL, DEPARTURE = 0, 1
+STATUSES = ["complete", "in_port", "no_departure", "no_arrival"]
+
+# Repeats of the same event within this window are one event reported twice. An arrival whose
+# next departure is further away than MAX_DWELL lost its departure (and that departure its arrival)
+DUPLICATE_WINDOW = pd.Timedelta(hours=6)
+MAX_DWELL = pd.Timedelta(days=30)
+
+# Weeks run Monday to Sunday (features.week_start); 1970-01-05 is the first Monday of the epoch
+WEEK = pd.Timedelta(days=7).value
+EPOCH_MONDAY = pd.Timestamp("1970-01-05").value
+HOUR = pd.Timedelta(hours=1).value
+
+
+def week_index(ns):
+    return (ns - EPOCH_MONDAY) // WEEK
+
+
+def week_starts(index):
+    return pd.to_datetime(index * WEEK + EPOCH_MONDAY)
+
+
+# Events as flat arrays: vessel, port code, time (int64 ns, naive UTC) and event code. Rows that
+# are neither an arrival nor a departure, or lack a vessel or a time, are dropped
+def event_arrays(calls, port="port_name"):
+    event = calls["event"].astype(str).str.lower().to_numpy()
+    codes = np.where(event == "arrival", ARRIVAL, np.where(event == "departure", DEPARTURE, -1)).astype(np.int8)
+
+    times = calls["time_utc"]
+    if not pd.api.types.is_datetime64_any_dtype(times) or getattr(times.dt, "tz", None) is not None:
+        times = pd.to_datetime(times, utc=True, format="ISO8601").dt.tz_localize(None)
+    times = times.to_numpy(dtype="datetime64[ns]")
+    missing_time = np.isnat(times)
+    times = times.view(np.int64)
+
+    mmsi = pd.to_numeric(calls["mmsi"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+    port_codes, ports = pd.factorize(calls[port], sort=True)
+
+    keep = (codes >= 0) & (mmsi > 0) & (port_codes >= 0) & ~missing_time
+    return mmsi[keep], port_codes[keep].astype(np.int32), times[keep], codes[keep], pd.Index(ports)
+
+
+# Pair every arrival with its departure: one sort by (vessel, port, time, event), then scans that
+# compare each event with its neighbour. One row per call:
+#   complete      arrival and departure
+#   in_port       arrival without a departure yet, less than `max_dwell` before `until`, and
+#                 the vessel's last event at any port (a vessel seen elsewhere later has left)
+#   no_departure  arrival whose departure is missing
+#   no_arrival    departure whose arrival is missing (e.g. before the start of the log)
+# `until` (default: the last event) is when the log ends
+def pair_calls(calls, port="port_name", duplicate_window=DUPLICATE_WINDOW, max_dwell=MAX_DWELL, until=None):
+    mmsi, ports, times, events, names = event_arrays(calls, port)
+    until = pd.Timestamp(until).value if until is not None else (times.max() if len(times) else 0)
+
+    order = np.lexsort((events, times, ports, mmsi))
+    mmsi, ports, times, events = mmsi[order], ports[order], times[order], events[order]
+
+    # Drop repeats: same vessel, port and event as the previous row, within the window
+    same = np.zeros(len(times), dtype=bool)
+    same[1:] = (mmsi[1:] == mmsi[:-1]) & (ports[1:] == ports[:-1])
+    repeat = np.zeros(len(times), dtype=bool)
+    repeat[1:] = same[1:] & (events[1:] == events[:-1]) & (times[1:] - times[:-1] <= duplicate_window.value)
+    keep = ~repeat
+    mmsi, ports, times, events = mmsi[keep], ports[keep], times[keep], events[keep]
+
+    n = len(times)
+    next_same = np.zeros(n, dtype=bool)
+    next_same[:-1] = (mmsi[1:] == mmsi[:-1]) & (ports[1:] == ports[:-1])
+    next_event = np.append(events[1:], -1)
+    next_time = np.append(times[1:], 0)
+
+    # Time of each vessel's last event at any port; rows are grouped by vessel, not sorted by time
+    vessel_start = np.ones(n, dtype=bool)
+    vessel_start[1:] = mmsi[1:] != mmsi[:-1]
+    vessel_last = np.maximum.reduceat(times, np.flatnonzero(vessel_start)) if n else times
+    seen_later = vessel_last[np.cumsum(vessel_start) - 1] > times
+
+    arrival = events == ARRIVAL
+    paired = arrival & next_same & (next_event == DEPARTURE) & (next_time - times <= max_dwell.value)
+    departure_paired = np.zeros(n, dtype=bool)
+    departure_paired[1:] = paired[:-1]
+
+    status = np.full(n, -1, dtype=np.int8)
+    status[paired] = 0
+    last = arrival & ~next_same
+    status[last & ~seen_later & (until - times <= max_dwell.value)] = 1
+    status[arrival & (status < 0)] = 2
+    status[(events == DEPARTURE) & ~departure_paired] = 3
+
+    rows = status >= 0
+    arrival_ns = np.where(arrival, times, np.iinfo(np.int64).min)[rows]
+    departure_ns = np.where(paired, next_time, np.where(events == DEPARTURE, times, np.iinfo(np.int64).min))[rows]
+    out = pd.DataFrame({
+        "mmsi": mmsi[rows],
+        port: pd.Categorical.from_codes(ports[rows], categories=names),
+        "arrival": arrival_ns.view("datetime64[ns]"),
+        "departure": departure_ns.view("datetime64[ns]"),
+        "status": pd.Categorical.from_codes(status[rows], categories=STATUSES),
+    })
+    out["dwell_hours"] = (out["departure"] - out["arrival"]).dt.total_seconds() / 3600
+    return out
+
+
+# Occupancy intervals of the calls: complete calls from arrival to departure, calls still in port
+# until the end of the log. Calls with a missing event have no known interval
+def intervals(pairs, codes, until):
+    in_port = (pairs["status"] == "in_port").to_numpy()
+    usable = (pairs["status"] == "complete").to_numpy() | in_port
+    start = pairs["arrival"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    end = np.where(in_port, until, pairs["departure"].to_numpy(dtype="datetime64[ns]").view(np.int64))
+    return codes[usable], start[usable], end[usable]
+
+
+# Per port and week: arrivals, departures, completed calls with their mean and median dwell
+# (by departure week), calls with a missing event, vessel-hours spent in port, the average number
+# of vessels in port (vessel-hours / 168) and the peak number of vessels in port at once.
+# Calls spanning a week boundary contribute to every week they overlap
+def port_week_metrics(pairs, until=None):
+    port = pairs.columns[1]
+    ports = pairs[port].cat.categories
+    arrival = pairs["arrival"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    departure = pairs["departure"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    known_arrival = ~np.isnat(pairs["arrival"].to_numpy())
+    known_departure = ~np.isnat(pairs["departure"].to_numpy())
+    if until is None:
+        until = max(arrival[known_arrival].max(initial=0), departure[known_departure].max(initial=0))
+    else:
+        until = pd.Timestamp(until).value
+    codes = pairs[port].cat.codes.to_numpy()
+
+    def counts(mask, weeks, name):
+        return pd.Series(1, index=pd.MultiIndex.from_arrays([codes[mask], weeks[mask]]), name=name).groupby(level=[0, 1]).sum()
+
+    complete = (pairs["status"] == "complete").to_numpy()
+    unpaired = (pairs["status"].isin(["no_departure", "no_arrival"])).to_numpy()
+    arrival_week = week_index(arrival)
+    departure_week = week_index(departure)
+    parts = [
+        counts(known_arrival, arrival_week, "arrivals"),
+        counts(known_departure, departure_week, "departures"),
+        counts(unpaired, np.where(known_arrival, arrival_week, departure_week), "unpaired_calls"),
+    ]
+    dwell = pd.Series(pairs["dwell_hours"].to_numpy()[complete], index=pd.MultiIndex.from_arrays([codes[complete], departure_week[complete]]))
+    grouped = dwell.groupby(level=[0, 1])
+    parts.append(grouped.size().rename("completed_calls"))
+    parts.append(grouped.mean().rename("mean_dwell_hours"))
+    parts.append(grouped.median().rename("median_dwell_hours"))
+
+    # Split every interval at week boundaries: one piece per week it overlaps
+    port_codes, start, end = intervals(pairs, codes, until)
+    first, last = week_index(start), week_index(np.maximum(end - 1, start))
+    spans = last - first + 1
+    piece = np.repeat(np.arange(len(start)), spans)
+    piece_week = first[piece] + (np.arange(len(piece)) - np.repeat(np.cumsum(spans) - spans, spans))
+    week_begin = piece_week * WEEK + EPOCH_MONDAY
+    hours = (np.minimum(end[piece], week_begin + WEEK) - np.maximum(start[piece], week_begin)) / HOUR
+    index = pd.MultiIndex.from_arrays([port_codes[piece], piece_week])
+    occupancy = pd.DataFrame({"vessel_hours": hours, "carried_in": start[piece] < week_begin}, index=index).groupby(level=[0, 1]).sum()
+    occupancy["vessels_in_port"] = occupancy["vessel_hours"] / 168
+
+    # Peak: sweep over +1 (arrival) / -1 (end) events sorted by port and time, ends first on ties.
+    # Every port's events sum to zero, so a running sum over all ports is each port's occupancy
+    sweep_port = np.concatenate([port_codes, port_codes])
+    sweep_time = np.concatenate([start, end])
+    delta = np.concatenate([np.ones(len(start), dtype=np.int64), -np.ones(len(end), dtype=np.int64)])
+    order = np.lexsort((delta, sweep_time, sweep_port))
+    level = np.cumsum(delta[order])
+    rising = delta[order] > 0
+    peaks = pd.Series(level[rising], index=pd.MultiIndex.from_arrays([sweep_port[order][rising], week_index(sweep_time[order][rising])]))
+    peaks = peaks.groupby(level=[0, 1]).max().rename("peak_vessels_in_port")
+
+    metrics = pd.concat(parts + [occupancy, peaks], axis=1)
+    metrics["peak_vessels_in_port"] = np.fmax(metrics["peak_vessels_in_port"], metrics["carried_in"])
+    count_columns = ["arrivals", "departures", "completed_calls", "unpaired_calls", "vessel_hours", "vessels_in_port", "peak_vessels_in_port"]
+    metrics[count_columns] = metrics[count_columns].fillna(0)
+    metrics = metrics.drop(columns="carried_in").sort_index()
+
+    metrics.index = pd.MultiIndex.from_arrays(
+        [ports[metrics.index.get_level_values(0)], week_starts(metrics.index.get_level_values(1).to_numpy())],
+        names=[port, "week_start"],
+    )
+    int_columns = ["arrivals", "departures", "completed_calls", "unpaired_calls", "peak_vessels_in_port"]
+    metrics[int_columns] = metrics[int_columns].astype("int64")
+    return metrics[count_columns[:4] + ["mean_dwell_hours", "median_dwell_hours"] + count_columns[4:]]
+
+
+# The port metrics summed over ports per week: calls, vessels in port and the mean dwell of all
+# completed calls, in the layout of the weekly feature matrix (indexed by week start)
+def weekly_congestion(metrics):
+    weekly = metrics.assign(dwell_total=metrics["mean_dwell_hours"].fillna(0) * metrics["completed_calls"]).groupby(level="week_start")
+    out = weekly[["arrivals", "departures", "completed_calls", "unpaired_calls", "vessels_in_port", "dwell_total"]].sum()
+    out["mean_dwell_hours"] = out["dwell_total"] / out["completed_calls"].replace(0, np.nan)
+    return out.drop(columns="dwell_total")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Pair port-call arrivals with departures and compute per-port weekly congestion")
+    parser.add_argument("source", nargs="?", default=os.path.join(DATA_DIR, "port_calls.csv"), help="port_calls.csv, Parquet or a port call store directory")
+    parser.add_argument("--port", default="port_name", help="Column identifying the port")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Per-port, per-week metrics")
+    parser.add_argument("--calls-output", help="Also write one row per call with its dwell time")
+    parser.add_argument("--until", help="End of the log (default: the last event)")
+    args = parser.parse_args()
+
+    telemetry.configure("dwell")
+    calls = load_calls(args.source)
+    with telemetry.span("dwell_pairing") as span:
+        pairs = pair_calls(calls, args.port, until=args.until)
+        span.add_rows(len(calls))
+    logging.info(f"{len(calls)} events -> {len(pairs)} calls: {pairs['status'].value_counts().to_dict()}")
+
+    with telemetry.span("dwell_port_weeks") as span:
+        metrics = port_week_metrics(pairs, args.until)
+        span.add_rows(len(pairs))
+
+    metrics.to_csv(args.output)
+    logging.info(f"{len(metrics)} port-weeks saved to {args.output}")
+    if args.calls_output:
+        pairs.to_csv(args.calls_output, index=False)
+        logging.info(f"{len(pairs)} calls saved to {args.calls_output}")
+
+
+if __name__ == "__main__":
+    main()
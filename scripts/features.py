@@ -0,0 +1,248 @@
+import os
+import json
+import glob
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import telemetry
+from lags import shift_features
+from reference import load_reference
+from port_call_frame import VesselLookup, load_calls
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+OUTPUT_FILE = os.path.join(DATA_DIR, "final_df.csv")
+
+LAGS = (1, 2, 3)
+BUILT_YEAR_BINS = [1925, 1950, 1975, 2000, 2025]
+BUILT_YEAR_LABELS = ["1925-1949", "1950-1974", "1975-1999", "2000-2024"]
+UNSPECIFIED_GROUP = "Unspecified/Others"
+
+
+# Monday of the week a timestamp falls in; weeks run Monday to Sunday like the SHFE reports
+def week_start(timestamps):
+    timestamps = pd.to_datetime(timestamps, utc=True).dt.tz_localize(None)
+    return timestamps.dt.to_period("W-SUN").dt.start_time
+
+
+def week_label(starts):
+    starts = pd.DatetimeIndex(starts)
+    ends = starts + pd.Timedelta(days=6)
+    return starts.strftime("%Y-%m-%d") + " to " + ends.strftime("%Y-%m-%d")
+
+
+# Weekly counts of every category of `column`, one output column per category
+def weekly_counts(df, column, prefix, categories=None):
+    counts = df.groupby(["week_start", column], observed=True).size().unstack(fill_value=0)
+    if categories is not None:
+        counts = counts.reindex(columns=categories, fill_value=0)
+    counts.columns = [f"{prefix}_{category}" for category in counts.columns]
+    return counts
+
+
+# Port-call and vessel features: category counts per week and vessel averages per week
+def port_call_features(port_calls, vessels, reference):
+    calls = port_calls[["mmsi", "event", "port_name", "time_utc"]].copy()
+    calls["week_start"] = week_start(calls["time_utc"])
+
+    vessel_columns = ["vessel_type", "flag", "built", "gt", "avg_sog", "size_a", "size_b", "size_c", "size_d"]
+    calls = VesselLookup(vessels, vessel_columns).attach(calls)
+
+    calls["PortCountry"] = reference.port_country.map(calls["port_name"])
+    calls["EventType"] = calls["event"].str.lower()
+    calls["VesselTypeGroup"] = reference.vessel_group.map(calls["vessel_type"]).fillna(UNSPECIFIED_GROUP)
+    calls["VesselFlagRegion"] = reference.flag_region.map(calls["flag"])
+    calls["VesselBuiltYear"] = pd.cut(calls["built"], BUILT_YEAR_BINS, right=False, labels=BUILT_YEAR_LABELS)
+    calls["area"] = (calls["size_a"] + calls["size_b"]) * (calls["size_c"] + calls["size_d"])
+
+    parts = [
+        weekly_counts(calls, "PortCountry", "PortCountry", reference.port_country.categories),
+        weekly_counts(calls, "EventType", "EventType", ["arrival", "departure"]),
+        weekly_counts(calls, "VesselTypeGroup", "VesselTypeGroup", reference.vessel_group.categories),
+        weekly_counts(calls, "VesselFlagRegion", "VesselFlagRegion", reference.flag_region.categories),
+        weekly_counts(calls, "VesselBuiltYear", "VesselBuiltYear", BUILT_YEAR_LABELS),
+    ]
+    averages = calls.groupby("week_start")[["area", "gt", "avg_sog"]].mean()
+    averages.columns = ["VesselAvgArea", "VesselAvgGt", "VesselAvgSog"]
+    parts.append(averages)
+
+    return pd.concat(parts, axis=1).fillna({column: 0 for part in parts[:-1] for column in part.columns})
+
+
+# Weekly price of every asset: mean weekly close over all its delivery months
+def commodity_features(commodities, reference):
+    df = commodities[["Weekly Close"]].copy()
+    df["asset"] = reference.contract_assets(commodities["Species"])
+    df["week_start"] = pd.to_datetime(commodities["Week Start"])
+    prices = df.pivot_table(index="week_start", columns="asset", values="Weekly Close", aggfunc="mean", observed=False)
+    prices.columns = prices.columns.astype(object)
+    return prices.reindex(columns=list(reference.asset.categories))
+
+
+# Weekly mean sentiment from a frame with `datetime` and `sentiment_score` columns
+def sentiment_features(sentiment):
+    df = pd.DataFrame({
+        "week_start": week_start(sentiment["datetime"]),
+        "sentiment_score": sentiment["sentiment_score"].astype("float64"),
+    })
+    return df.groupby("week_start")[["sentiment_score"]].mean()
+
+
+# `{asset}_lag{k}` is the price k report weeks after the row's week, i.e. the horizon the port
+# features of that week are matched against (a lead in lags.py terms). Shifts run over the full
+# weekly price history and are stored as float32
+def lag_features(prices, weeks, lags=LAGS):
+    return shift_features(prices, leads=lags, names={"lead": "{column}_lag{k}"}).reindex(weeks)
+
+
+# Feature matrix for `weeks` (default: every week with both port calls and a commodity report),
+# indexed by week start
+def build_features(port_calls, vessels, commodities, sentiment=None, weeks=None, reference=None, lags=LAGS):
+    reference = reference or load_reference()
+    prices = commodity_features(commodities, reference).sort_index()
+
+    if weeks is not None:
+        weeks = pd.DatetimeIndex(weeks)
+        port_calls = port_calls[week_start(port_calls["time_utc"]).isin(weeks).to_numpy()]
+
+    calls = port_call_features(port_calls, vessels, reference)
+    weeks = weeks if weeks is not None else calls.index.intersection(prices.index).sort_values()
+    calls = calls.reindex(weeks)
+
+    if sentiment is not None:
+        score = sentiment_features(sentiment).reindex(weeks)
+    else:
+        score = pd.DataFrame({"sentiment_score": np.nan}, index=weeks)
+
+    matrix = pd.concat([calls, score, prices.reindex(weeks), lag_features(prices, weeks, lags)], axis=1)
+    matrix.index.name = "week_start"
+    return matrix
+
+
+# Per-week fingerprint of every input, so a refresh can tell which weeks changed
+def input_fingerprints(port_calls, vessels, commodities, sentiment=None):
+    fingerprints = {}
+
+    def add(source, weeks, frame):
+        hashes = pd.util.hash_pandas_object(frame, index=False).astype("uint64")
+        sums = hashes.groupby(weeks.to_numpy()).sum()
+        for week, value in sums.items():
+            fingerprints.setdefault(str(pd.Timestamp(week).date()), {})[source] = str(value)
+
+    calls = port_calls.reset_index(drop=True)
+    weeks = week_start(calls["time_utc"])
+    add("port_calls", weeks, calls)
+
+    # A changed vessel affects every week it called in
+    vessels = vessels.drop_duplicates(subset="mmsi", keep="last").set_index("mmsi")
+    vessel_hash = pd.Series(pd.util.hash_pandas_object(vessels, index=False).to_numpy(), index=vessels.index)
+    add("vessels", weeks, calls[["mmsi"]].assign(vessel=calls["mmsi"].map(vessel_hash)))
+
+    add("commodities", pd.to_datetime(commodities["Week Start"]), commodities.reset_index(drop=True))
+    if sentiment is not None:
+        sentiment = sentiment.reset_index(drop=True)
+        add("sentiment", week_start(sentiment["datetime"]), sentiment)
+    return fingerprints
+
+
+def changed_weeks(old, new):
+    weeks = set(old) | set(new)
+    return sorted(pd.Timestamp(week) for week in weeks if old.get(week) != new.get(week))
+
+
+# Recompute only the rows of weeks whose inputs changed, plus the lag columns of the rows that
+# look ahead into a changed week. Lags are refreshed from the full price history
+def update_features(matrix, port_calls, vessels, commodities, sentiment=None, changed=(), reference=None, lags=LAGS):
+    reference = reference or load_reference()
+    changed = pd.DatetimeIndex(sorted(changed))
+    if changed.empty:
+        return matrix
+
+    prices = commodity_features(commodities, reference).sort_index()
+    port_weeks = pd.DatetimeIndex(week_start(port_calls["time_utc"]).unique())
+    all_weeks = port_weeks.intersection(prices.index).sort_values()
+    recompute = changed.intersection(all_weeks)
+
+    fresh = build_features(port_calls, vessels, commodities, sentiment, weeks=recompute, reference=reference, lags=lags)
+    matrix = matrix.reindex(index=all_weeks, columns=matrix.columns.union(fresh.columns, sort=False))
+    matrix.loc[fresh.index, fresh.columns] = fresh
+
+    # Positions in the report-week history; a change at position p affects rows p - max(lags) .. p
+    positions = prices.index.searchsorted(changed)
+    rows = {
+        prices.index[p - k]
+        for p in positions
+        for k in range(max(lags) + 1)
+        if 0 <= p - k < len(prices.index)
+    }
+    lag_weeks = pd.DatetimeIndex(sorted(rows)).intersection(all_weeks)
+    lagged = lag_features(prices, lag_weeks, lags)
+    matrix.loc[lag_weeks, lagged.columns] = lagged
+
+    logging.info(f"Recomputed {len(recompute)} weeks and the lags of {len(lag_weeks)} weeks")
+    return matrix
+
+
+def read_matrix(path=OUTPUT_FILE):
+    matrix = pd.read_csv(path, index_col=0)
+    matrix.index = pd.to_datetime(matrix.pop("week").str.slice(0, 10))
+    matrix.index.name = "week_start"
+    return matrix
+
+
+# Same layout as the notebook-built final_df.csv: a positional index and a "week" label column
+def write_matrix(matrix, path=OUTPUT_FILE):
+    labels = pd.Series(week_label(matrix.index), name="week")
+    out = pd.concat([labels, matrix.reset_index(drop=True)], axis=1)
+    out.to_csv(path)
+    logging.info(f"Feature matrix with {len(out)} weeks saved to {path}")
+
+
+def load_vessels(paths):
+    frames = [pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path) for path in paths]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Build or refresh the weekly feature matrix (data/final_df.csv)")
+    parser.add_argument("--port-calls", default=os.path.join(DATA_DIR, "port_calls.csv"))
+    parser.add_argument("--vessels", nargs="+", default=sorted(glob.glob(os.path.join(DATA_DIR, "vessels", "vessels_[0-9]*.csv"))))
+    parser.add_argument("--commodities", default=os.path.join(DATA_DIR, "commodities", "commodities_cleaned.csv"))
+    parser.add_argument("--sentiment", help="CSV with datetime and sentiment_score columns")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--full", action="store_true", help="Rebuild every week instead of only the changed ones")
+    args = parser.parse_args()
+
+    telemetry.configure("features")
+    with telemetry.span("features_load") as span:
+        port_calls = load_calls(args.port_calls)
+        vessels = load_vessels(args.vessels)
+        commodities = pd.read_csv(args.commodities)
+        sentiment = pd.read_csv(args.sentiment) if args.sentiment else None
+        span.add_rows(len(port_calls) + len(vessels) + len(commodities) + (0 if sentiment is None else len(sentiment)))
+
+    # Per-week fingerprints of the inputs the matrix was built from, used to find changed weeks
+    state_file = os.path.splitext(args.output)[0] + ".state.json"
+    fingerprints = input_fingerprints(port_calls, vessels, commodities, sentiment)
+
+    with telemetry.span("features_build") as span:
+        if args.full or not (os.path.exists(args.output) and os.path.exists(state_file)):
+            matrix = build_features(port_calls, vessels, commodities, sentiment)
+            span.set(mode="full")
+        else:
+            with open(state_file, "r") as f:
+                previous = json.load(f)
+            changed = changed_weeks(previous, fingerprints)
+            matrix = update_features(read_matrix(args.output), port_calls, vessels, commodities, sentiment, changed)
+            span.set(mode="update", changed_weeks=len(changed))
+        span.add_rows(len(matrix))
+
+    write_matrix(matrix, args.output)
+    with open(state_file, "w") as f:
+        json.dump(fingerprints, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,61 @@
 import os
+import io
 import re
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import telemetry
+
+# Contract rows look like "cu2406   ,80020,80380,79410,...", everything else is headers and totals
+ROW_PATTERN = re.compile(rb"^[ \t]*[a-z]{2,3}\d{4}[ \t]+,\d+.*$", re.MULTILINE)
+
+COLUMNS = [
+    "Species", "Weekly Opening Price", "High", "Low", "Weekly Close",
+    "Net Change", "Open Interest", "O.I Change", "Weekly Volume", "Volume", "Turnover"
+]
+DTYPES = {
+    "Species": "string",
+    "Weekly Opening Price": "float64",
+    "High": "float64",
+    "Low": "float64",
+    "Weekly Close": "float64",
+    "Net Change": "float64",
+    "Open Interest": "Int64",
+    "O.I Change": "Int64",
+    "Weekly Volume": "float64",
+    "Volume": "float64",
+    "Turnover": "float64",
+}
 
 def filter_relevant_rows(input_file, week_start, week_end):
-    pattern = re.compile(r"^[a-z]{2,3}\d{4}\s+,\d+.*$")
-    filtered_rows = []
+    with open(input_file, "rb") as infile:
+        content = infile.read()
 
-    with open(input_file, "r") as infile:
-        for line in infile:
-            if pattern.match(line.strip()):
-                row = line.strip().split(",")
-                row.append(week_start)
-                row.append(week_end)
-                filtered_rows.append(row)
+    # One regex pass over the whole file, then a single C-level CSV parse of the matched rows
+    rows = b"\n".join(match.group(0).strip() for match in ROW_PATTERN.finditer(content))
+    if not rows:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in DTYPES.items()})
 
-    return filtered_rows
+    # Crude oil (sc) rows carry an extra 10th field ("0" or blank) before Volume and Turnover.
+    # Rows are read with one spare column: where it holds a value, the row has the extra field
+    df = pd.read_csv(
+        io.BytesIO(rows),
+        header=None,
+        names=COLUMNS + ["Spare"],
+        usecols=range(len(COLUMNS) + 1),
+        dtype={**DTYPES, "Spare": "float64"},
+        skipinitialspace=True,
+    )
+    spare = df.pop("Spare")
+    shifted = spare.notna()
+    df.loc[shifted, "Volume"] = df.loc[shifted, "Turnover"]
+    df.loc[shifted, "Turnover"] = spare[shifted]
+    df["Species"] = df["Species"].str.strip()
+    df["Week Start"] = pd.to_datetime(week_start, errors="coerce")
+    df["Week End"] = pd.to_datetime(week_end, errors="coerce")
+
+    return df
 
 def extract_dates_from_filename(filename):
     # Example: "2024-01-01--2024-01-07.txt" -> ("2024-01-01", "2024-01-07")
@@ -23,42 +64,76 @@ def extract_dates_from_filename(filename):
         return match.group(1), match.group(2)  # week_start, week_end
     return "Unknown", "Unknown"
 
-def process_all_files(input_dir, output_file):
-    all_data = []
+# The file name carries the week, so it is part of the key together with the content
+def file_hash(file_path):
+    digest = hashlib.sha1(os.path.basename(file_path).encode())
+    with open(file_path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+# Parse one report and store the typed result in the cache (runs in a worker process)
+def parse_file(file_path, cache_path):
+    started = time.perf_counter()
+    filename = os.path.basename(file_path)
+    week_start, week_end = extract_dates_from_filename(filename)
+    df = filter_relevant_rows(file_path, week_start, week_end)
 
-    # Iterate through all files in the input directory
-    for filename in os.listdir(input_dir):
+    tmp_path = cache_path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return filename, len(df), time.perf_counter() - started
+
+def process_all_files(input_dir, output_file, cache_dir=None, max_workers=None):
+    cache_dir = cache_dir or os.path.join(input_dir, ".parsed")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Content hash of every report; only reports without a cached parse are parsed again
+    cache_paths = {}
+    for filename in sorted(os.listdir(input_dir)):
         file_path = os.path.join(input_dir, filename)
         if os.path.isfile(file_path) and filename.endswith(".txt"):
-            print(f"Processing file: {filename}")
-            week_start, week_end = extract_dates_from_filename(filename)
-            filtered_rows = filter_relevant_rows(file_path, week_start, week_end)
-            all_data.extend(filtered_rows)
-
-    # Convert the data to a DataFrame and save as CSV
-    if all_data:
-        # Dynamically determine the number of columns
-        max_columns = max(len(row) for row in all_data)
-        columns = [
-            "Species", "Weekly Opening Price", "High", "Low", "Weekly Close",
-            "Net Change", "Open Interest", "O.I Change", "Weekly Volume", "Volume", "Turnover", "Week Start", "Week End"
-        ]
-        # Extend column names if there are extra columns
-        if len(columns) < max_columns:
-            columns.extend([f"Extra_Column_{i}" for i in range(len(columns), max_columns)])
-
-        df = pd.DataFrame(all_data, columns=columns)
+            cache_paths[file_path] = os.path.join(cache_dir, f"{file_hash(file_path)}.parquet")
+
+    to_parse = {path: cache for path, cache in cache_paths.items() if not os.path.exists(cache)}
+    print(f"{len(to_parse)} of {len(cache_paths)} files changed since the last run")
+
+    if to_parse:
+        with telemetry.span("shfe_parse") as span, ProcessPoolExecutor(max_workers=max_workers) as executor:
+            span.set(files=len(to_parse), cached=len(cache_paths) - len(to_parse))
+            for filename, rows, seconds in executor.map(parse_file, to_parse.keys(), to_parse.values()):
+                telemetry.record("shfe_parse_file", seconds, rows, fields={"file": filename})
+                span.add_rows(rows)
+                print(f"Processed file: {filename} ({rows} rows)")
+
+    # Drop cached parses of files that were changed or removed
+    current = {os.path.basename(cache) for cache in cache_paths.values()}
+    for name in os.listdir(cache_dir):
+        if name not in current:
+            os.remove(os.path.join(cache_dir, name))
+
+    frames = [pd.read_parquet(cache) for cache in cache_paths.values()]
+    frames = [df for df in frames if not df.empty]
+
+    # Save the combined typed data as CSV
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        df = df.sort_values(["Week Start", "Species"], kind="stable", ignore_index=True)
         df.to_csv(output_file, index=False)
         print(f"Filtered data saved to: {output_file}")
-    else:
-        print("No relevant data found.")
+        return df
+
+    print("No relevant data found.")
+    return None
+
+if __name__ == "__main__":
+    # Paths
+    input_dir = "./downloads/commodities"
+    output_file = "./data/commodities.csv"
 
-# Paths
-input_dir = "./downloads/commodities"
-output_file = "./data/commodities.csv"
+    telemetry.configure("filter_commodities")
 
-# Ensure the output directory exists
-os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    # Ensure the output directory exists
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
-# Process all files
-process_all_files(input_dir, output_file)
\ No newline at end of file
+    # Process all files
+    process_all_files(input_dir, output_file)
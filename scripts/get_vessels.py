@@ -1,15 +1,24 @@
 import os
+import glob
+from datetime import datetime
 import pandas as pd
-import requests
-from time import sleep
 from dotenv import load_dotenv
 import logging
+import telemetry
+from http_utils import TokenBucket, make_session
+from port_call_frame import load_calls
+from vessel_registry import VesselRegistry
+from vessel_sink import VesselChunkWriter
 
 # Load environment variables
 load_dotenv()
 api_key = os.getenv("API_KEY")
 secret = os.getenv("SECRET")
 
+# Bulk requests per second and the API root (scripts/mock_api.py stands in for it offline)
+RATE_LIMIT = float(os.getenv("VESSELS_RATE_LIMIT", "2"))
+BASE_URL = os.getenv("MYSHIPTRACKING_BASE_URL", "https://api.myshiptracking.com/api/v2")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,45 +33,78 @@ logging.basicConfig(
 OUTPUT_FILE = os.path.abspath("../data/vessels/vessels_info.csv")
 os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
 
+# Port calls whose vessels are looked up: a CSV or a port call store directory
+PORT_CALLS = os.getenv("PORT_CALLS_FILE", "../data/port_calls.csv")
+
+# Every run streams its raw bulk responses to its own Parquet file
+BULK_DIR = os.path.abspath("../data/vessels/bulk")
+
+# Shards collected by notebooks/get_fleet.ipynb, imported into an empty registry
+LEGACY_SHARDS = sorted(glob.glob("../data/vessels/vessels_[0-9]*.csv"))
+
+# Fields used by the analysis; vessels are only re-requested when one of these has expired
+REQUIRED_FIELDS = [
+    "vessel_type", "ais_type", "size_a", "size_b", "size_c", "size_d",
+    "flag", "gt", "dwt", "built", "avg_sog", "max_sog",
+]
+
 # Function to convert JSON data to a DataFrame
 def to_df(json_data):
     data = json_data.get("data", [])
     new_df = pd.DataFrame(data)
     return new_df
 
+limiter = TokenBucket(RATE_LIMIT, capacity=1)
+session = make_session(pool_size=1, headers={"Authorization": f"Bearer {api_key}"}, limiter=limiter)
+
 # Function to make API requests
 def make_request(mmsi_list):
-    url = f"https://api.myshiptracking.com/api/v2/vessel/bulk?mmsi={mmsi_list}&response=extended"
-    headers = {
-        "Authorization": f"Bearer {api_key}"
-    }
-    response = requests.get(url, headers=headers)
+    url = f"{BASE_URL}/vessel/bulk?mmsi={mmsi_list}&response=extended"
+    limiter.acquire()
+    response = session.get(url)
     if not response.ok:
         logging.error(f"Error: {response.status_code}, {response.text}")
     return response.json()
 
-# Load vessel data
-port_calls = pd.read_csv("../data/port_calls.csv")
-vessels_list = port_calls.mmsi.unique().tolist()
+def main():
+    telemetry.configure("vessels")
+    registry = VesselRegistry()
+    if len(registry) == 0:
+        for path in LEGACY_SHARDS:
+            registry.seed_from_csv(path)
+
+    # Load vessel data
+    port_calls = load_calls(PORT_CALLS)
+    vessels_list = port_calls.mmsi[port_calls.mmsi > 0].unique().tolist()
+
+    # Only unseen or expired vessels are requested, in full chunks of 100
+    batches = registry.batches(vessels_list, fields=REQUIRED_FIELDS)
+    logging.info(f"{sum(map(len, batches))} of {len(vessels_list)} vessels to refresh in {len(batches)} requests")
+
+    run_file = os.path.join(BULK_DIR, f"vessels_{datetime.now():%Y%m%dT%H%M%S}.parquet")
+    with VesselChunkWriter(run_file) as writer:
+        for i, chunk in enumerate(batches):
+            mmsi_list = ",".join(map(str, chunk))
 
-# Initialize an empty DataFrame
-combined_df = pd.DataFrame()
+            with telemetry.span("vessel_bulk") as span:
+                span.set(chunk=i, requested=len(chunk))
+                data = make_request(mmsi_list)
+                if data:
+                    new_df = to_df(data)
+                    writer.write(new_df)
+                    registry.upsert(new_df)
+                    span.add_rows(len(new_df))
+                else:
+                    logging.warning(f"Chunk {chunk}: no data")
 
-# Process vessels in chunks of 100
-for i in range(0, len(vessels_list), 100):
-    chunk = vessels_list[i:i+100]
-    mmsi_list = ",".join(map(str, chunk))
+            logging.info(f"Chunk {chunk}: DONE")
 
-    data = make_request(mmsi_list)
-    if data:
-        new_df = to_df(data)
-        combined_df = pd.concat([combined_df, new_df], ignore_index=True)
-    else:
-        logging.warning(f"Chunk {chunk}: no data")
+    with telemetry.span("vessel_registry_save"):
+        registry.save()
 
-    sleep(0.5)
-    logging.info(f"Chunk {chunk}: DONE")
+    # Save the vessels seen in port calls to a single CSV file
+    registry.get(vessels_list).to_csv(OUTPUT_FILE, index=False)
+    logging.info(f"Data saved to {OUTPUT_FILE}")
 
-# Save the final combined DataFrame to a single CSV file
-combined_df.to_csv(OUTPUT_FILE, index=False)
-logging.info(f"Data saved to {OUTPUT_FILE}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
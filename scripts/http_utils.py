@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+import telemetry
+
+# Record/replay: HTTP_MODE=record saves every final response to the cassette store,
+# HTTP_MODE=replay serves requests from it without touching the network (live is the default)
+HTTP_MODE = os.getenv("HTTP_MODE", "live")
+CASSETTE_DIR = os.path.abspath(os.getenv("HTTP_CASSETTE_DIR", "./cassettes"))
+
+# Query parameters that carry credentials: never part of a cassette key or stored URL
+SECRET_PARAMS = {"access_key", "api_key", "apikey", "key", "token"}
+
+
+# Token bucket shared by all worker threads: `rate` requests per second on average,
+# with bursts of up to `capacity` requests
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Retry that takes a token from `limiter` before every re-send, after the backoff: retries inside
+# the adapter count against the same rate as the first attempts made by the callers
+class LimitedRetry(Retry):
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.limiter = self.limiter
+        return retry
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+
+# Session with pooled keep-alive connections and exponential backoff on 429/5xx.
+# Retry honours the Retry-After header sent with 429 responses and takes a token from
+# `limiter` (the caller's TokenBucket) before each re-send. `mode` (default HTTP_MODE)
+# switches the session to recording or replaying cassettes
+def make_session(pool_size=10, retries=5, backoff_factor=1.0, headers=None, mode=None, cassette_dir=None, limiter=None):
+    retry = LimitedRetry(
+        limiter=limiter,
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    mode = mode or HTTP_MODE
+    if mode == "live":
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    else:
+        adapter = CassetteAdapter(mode, cassette_dir or CASSETTE_DIR, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(record_response)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+# Per-endpoint request count, latency and the retries urllib3 spent before the final response
+# (replayed responses have no retry history)
+def record_response(response, *args, **kwargs):
+    parts = urlsplit(response.url)
+    endpoint = f"{parts.netloc}{parts.path}"
+    history = getattr(getattr(response.raw, "retries", None), "history", ())
+    telemetry.count("http_requests_total", endpoint=endpoint, status=response.status_code)
+    telemetry.observe("http_request_seconds", response.elapsed.total_seconds(), endpoint=endpoint)
+    if history:
+        telemetry.count("http_retries_total", len(history), endpoint=endpoint)
+        telemetry.count("http_rate_limited_total", sum(entry.status == 429 for entry in history), endpoint=endpoint)
+
+
+class CassetteMiss(requests.exceptions.RequestException):
+    pass
+
+
+def redact_url(url):
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in SECRET_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def cassette_key(request):
+    digest = hashlib.sha1(f"{request.method} {redact_url(request.url)}".encode())
+    body = request.body or b""
+    digest.update(body.encode() if isinstance(body, str) else body)
+    return digest.hexdigest()
+
+
+# Transport adapter that records responses to (or replays them from) <cassette_dir>/<key>.json.
+# Retries happen below the recorder, so only final responses are stored
+class CassetteAdapter(HTTPAdapter):
+    def __init__(self, mode, cassette_dir=CASSETTE_DIR, **kwargs):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def _path(self, request):
+        return os.path.join(self.cassette_dir, f"{cassette_key(request)}.json")
+
+    def send(self, request, **kwargs):
+        path = self._path(request)
+        if self.mode == "replay":
+            if not os.path.exists(path):
+                raise CassetteMiss(f"No recorded response for {request.method} {redact_url(request.url)}", request=request)
+            with open(path, "r", encoding="utf-8") as f:
+                return self._response(request, json.load(f))
+
+        response = super().send(request, **kwargs)
+        if response.status_code != 429 and response.status_code < 500:
+            self._save(path, request, response)
+        return response
+
+    def _save(self, path, request, response):
+        record = {
+            "method": request.method,
+            "url": redact_url(request.url),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _response(request, record):
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.reason = record.get("reason")
+        response.headers = CaseInsensitiveDict(record["headers"])
+        response.headers.pop("Content-Encoding", None)
+        response._content = base64.b64decode(record["body"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Output column names; `k` is the number of rows shifted, or the window length for rolling means
+NAMES = {
+    "lag": "{column}_lag{k}",
+    "lead": "{column}_lead{k}",
+    "roll": "{column}_roll{k}",
+}
+
+
+def _padded(values, before, after, dtype):
+    buffer = np.full((before + len(values) + after, values.shape[1]), np.nan, dtype=dtype)
+    buffer[before:before + len(values)] = values
+    return buffer
+
+
+# Lags, leads and trailing rolling means of `columns` of a week-indexed frame, in one pass.
+# The inputs are copied once into a NaN-padded float32 buffer; every lag/lead block is a
+# slice of it written straight into a single preallocated output array
+def shift_features(frame, columns=None, lags=(), leads=(), windows=(), dtype=np.float32, names=None):
+    names = {**NAMES, **(names or {})}
+    columns = list(frame.columns if columns is None else columns)
+    values = frame[columns].to_numpy(dtype=dtype)
+    n, m = values.shape
+
+    blocks = [("lag", k) for k in lags] + [("lead", k) for k in leads] + [("roll", k) for k in windows]
+    out = np.empty((n, m * len(blocks)), dtype=dtype)
+
+    before = max(lags, default=0)
+    after = max(leads, default=0)
+    buffer = _padded(values, before, after, dtype)
+
+    # Rolling means from cumulative sums (in float64 to keep the differences exact enough).
+    # Like pandas rolling(k).mean(), a window with any NaN (or fewer than k rows) gives NaN
+    if windows:
+        filled = np.where(np.isnan(values), 0, values).astype(np.float64)
+        sums = np.vstack([np.zeros((1, m)), np.cumsum(filled, axis=0)])
+        counts = np.vstack([np.zeros((1, m)), np.cumsum(~np.isnan(values), axis=0)])
+
+    for i, (kind, k) in enumerate(blocks):
+        target = out[:, i * m:(i + 1) * m]
+        if kind == "lag":
+            target[:] = buffer[before - k:before - k + n]
+        elif kind == "lead":
+            target[:] = buffer[before + k:before + k + n]
+        else:
+            start = np.maximum(np.arange(n) + 1 - k, 0)
+            total = sums[1:] - sums[start]
+            count = counts[1:] - counts[start]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                target[:] = np.where(count == k, total / k, np.nan)
+
+    labels = [names[kind].format(column=column, k=k) for kind, k in blocks for column in columns]
+    return pd.DataFrame(out, index=frame.index, columns=labels, copy=False)
+
+
+# Lazy access to shifted copies of a frame. All lags in [-max_lead, max_lag] share one
+# NaN-padded buffer; lag(k) is a view into it, so trying lags 0-12 costs one buffer, not 13 copies
+class LagView:
+    def __init__(self, frame, columns=None, max_lag=0, max_lead=0, dtype=np.float32):
+        self.columns = list(frame.columns if columns is None else columns)
+        self.index = frame.index
+        self.max_lag = max_lag
+        self.max_lead = max_lead
+        self.buffer = _padded(frame[self.columns].to_numpy(dtype=dtype), max_lag, max_lead, dtype)
+        self.n = len(frame)
+
+    # Values k rows earlier (negative k: rows later), as a read-only view of shape (n, columns)
+    def lag(self, k):
+        if not -self.max_lead <= k <= self.max_lag:
+            raise ValueError(f"lag {k} is outside [-{self.max_lead}, {self.max_lag}]")
+        start = self.max_lag - k
+        view = self.buffer[start:start + self.n]
+        view.flags.writeable = False
+        return view
+
+    def lead(self, k):
+        return self.lag(-k)
+
+    # Several lags at once as a (len(lags), n, columns) array. Evenly spaced lags (0..12, 1, 3, 5..)
+    # come back as a strided view over the buffer; any other selection is gathered into a copy
+    def stack(self, lags):
+        for k in lags:
+            self.lag(k)
+        positions = self.max_lag - np.asarray(lags)
+        windows = sliding_window_view(self.buffer, self.n, axis=0)  # (positions, columns, n)
+        steps = np.diff(positions)
+        if len(positions) == 1 or (steps[0] != 0 and (steps == steps[0]).all()):
+            step = int(steps[0]) if len(positions) > 1 else 1
+            selected = windows[positions[0]::step][:len(positions)]
+        else:
+            selected = windows[positions]
+        return selected.transpose(0, 2, 1)
+
+    # A DataFrame over lag(k) without copying the values
+    def frame(self, k, names=None):
+        kind, shift = ("lag", k) if k >= 0 else ("lead", -k)
+        template = {**NAMES, **(names or {})}[kind]
+        columns = [template.format(column=column, k=shift) for column in self.columns]
+        return pd.DataFrame(self.lag(k), index=self.index, columns=columns, copy=False)
@@ -0,0 +1,241 @@
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import pyarrow as pa
+from http_utils import TokenBucket
+from vessel_sink import VESSEL_SCHEMA
+
+# Local stand-in for the MyShipTracking and Mediastack APIs, for measuring fetcher throughput
+# without spending quota. Responses are generated deterministically from the request, so a
+# re-run sees the same data. Start it and point the fetchers at it:
+#   python mock_api.py --port 8000 --latency 0.2 --rate 5
+#   MYSHIPTRACKING_BASE_URL=http://localhost:8000/api/v2 MEDIASTACK_BASE_URL=http://localhost:8000/v1 python port_calls.py
+BULK_LIMIT = 100
+PAGE_LIMIT = 100
+
+CALLS_PER_DAY = 20
+ARTICLES_PER_DAY = 40
+EN_WORDS = ["markets", "rally", "growth", "port", "trade", "war", "fears", "losses", "africa", "china", "strong", "weak"]
+
+
+def seeded(*parts):
+    return random.Random(zlib.crc32("|".join(map(str, parts)).encode()))
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def port_calls(unloco, fromdate, todate):
+    start, end = parse_time(fromdate), parse_time(todate)
+    rng = seeded("calls", unloco, fromdate, todate)
+    port_id = zlib.crc32(unloco.encode()) % 100_000
+    n = int((end - start).total_seconds() / 86400 * CALLS_PER_DAY)
+    calls = []
+    for offset in sorted(rng.uniform(0, (end - start).total_seconds()) for _ in range(n)):
+        time_utc = start + timedelta(seconds=offset)
+        vessel = rng.randrange(10_000)
+        calls.append({
+            "event": rng.choice(["arrival", "departure"]),
+            "time_utc": time_utc.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "time_local": time_utc.strftime("%Y-%m-%dT%H:%M:%S"),
+            "mmsi": 200_000_000 + vessel,
+            "imo": 9_000_000 + vessel if rng.random() < 0.6 else None,
+            "vessel_name": f"VESSEL {vessel}",
+            "port_id": port_id,
+            "unloco": unloco,
+            "port_name": unloco,
+        })
+    return calls
+
+
+# One extended vessel record with every VESSEL_SCHEMA field
+def vessel(mmsi):
+    rng = seeded("vessel", mmsi)
+    record = {}
+    for field in VESSEL_SCHEMA:
+        if pa.types.is_integer(field.type):
+            record[field.name] = rng.randrange(100)
+        elif pa.types.is_floating(field.type):
+            record[field.name] = round(rng.uniform(0, 300), 2)
+        elif pa.types.is_timestamp(field.type):
+            record[field.name] = (datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(365 * 86400))).strftime("%Y-%m-%dT%H:%M:%SZ")
+        else:
+            record[field.name] = f"X{rng.randrange(10_000)}"
+    record.update({"mmsi": mmsi, "vessel_type": rng.choice(["Bulk Carrier", "Container Ship", "Crude Oil Tanker"]),
+                   "flag": rng.choice(["PA", "LR", "MH", "CN"]), "built": rng.randrange(1960, 2025)})
+    return record
+
+
+# Every article of a date window; the news endpoint serves slices of it
+def articles(date, categories, countries):
+    start, end = (datetime.fromisoformat(value) for value in date.split(","))
+    rng = seeded("news", date, categories, countries)
+    countries = (countries or "us").split(",")
+    out = []
+    for day in range((end - start).days + 1):
+        published = start + timedelta(days=day)
+        for i in range(ARTICLES_PER_DAY):
+            out.append({
+                "author": "staff",
+                "title": " ".join(rng.choices(EN_WORDS, k=8)),
+                "description": " ".join(rng.choices(EN_WORDS, k=rng.randrange(10, 60))),
+                "url": f"https://example.com/{published:%Y%m%d}/{i}",
+                "source": "example",
+                "image": None,
+                "category": (categories or "general").split(",")[0],
+                "language": "en",
+                "country": rng.choice(countries),
+                "published_at": (published + timedelta(seconds=rng.randrange(86400))).strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            })
+    return out
+
+
+class MockAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, rate=None, quota=0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.limiter = TokenBucket(rate) if rate else None
+        self.quota = quota
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+    # Token bucket without waiting: an empty bucket is a 429 and the seconds until the next token
+    def admit(self):
+        if self.limiter is None:
+            return 0
+        bucket = self.limiter
+        with bucket.lock:
+            now = time.monotonic()
+            bucket.tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0
+            return (1 - bucket.tokens) / bucket.rate
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+            return self.stats[key]
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+
+        if parts.path == "/_stats":
+            return self.send_json(200, server.stats)
+
+        requests_seen = server.count("requests")
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+        wait = server.admit()
+        if wait:
+            server.count("rate_limited")
+            error = {"code": "rate_limit_reached", "message": "Too many requests"}
+            body = {"error": error} if parts.path.startswith("/v1/") else {"status": "error", **error}
+            return self.send_json(429, body, {"Retry-After": str(max(1, round(wait)))})
+
+        try:
+            if parts.path == "/api/v2/port/calls":
+                return self.port_calls(params)
+            if parts.path == "/api/v2/vessel/bulk":
+                return self.vessel_bulk(params)
+            if parts.path == "/v1/news":
+                return self.news(params, requests_seen)
+        except (KeyError, ValueError) as e:
+            server.count("errors")
+            return self.send_json(400, {"status": "error", "code": "invalid_request", "message": str(e)})
+        self.send_json(404, {"status": "error", "code": "not_found", "message": parts.path})
+
+    def authorized(self):
+        if self.headers.get("Authorization", "").startswith("Bearer "):
+            return True
+        self.server.count("errors")
+        self.send_json(401, {"status": "error", "code": "unauthorized", "message": "Missing bearer token"})
+        return False
+
+    def port_calls(self, params):
+        if self.authorized():
+            self.send_json(200, {"status": "success", "data": port_calls(params["unloco"], params["fromdate"], params["todate"])})
+
+    def vessel_bulk(self, params):
+        if not self.authorized():
+            return
+        mmsis = [int(mmsi) for mmsi in params["mmsi"].split(",") if mmsi]
+        if len(mmsis) > BULK_LIMIT:
+            self.server.count("errors")
+            return self.send_json(400, {"status": "error", "code": "too_many_vessels", "message": f"At most {BULK_LIMIT} MMSIs per request"})
+        self.send_json(200, {"status": "success", "data": [vessel(mmsi) for mmsi in mmsis]})
+
+    # Mediastack reports errors in the body; a spent quota is final
+    def news(self, params, requests_seen):
+        if not params.get("access_key"):
+            self.server.count("errors")
+            return self.send_json(401, {"error": {"code": "missing_access_key", "message": "No access key"}})
+        if self.server.quota and requests_seen > self.server.quota:
+            self.server.count("errors")
+            return self.send_json(429, {"error": {"code": "usage_limit_reached", "message": "Monthly quota spent"}})
+
+        limit = min(int(params.get("limit", 25)), PAGE_LIMIT)
+        offset = int(params.get("offset", 0))
+        data = articles(params["date"], params.get("categories", ""), params.get("countries", ""))
+        page = data[offset:offset + limit]
+        self.send_json(200, {
+            "pagination": {"limit": limit, "offset": offset, "count": len(page), "total": len(data)},
+            "data": page,
+        })
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the MyShipTracking and Mediastack APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Standard deviation of the delay")
+    parser.add_argument("--rate", type=float, help="Requests per second before answering 429 (default: unlimited)")
+    parser.add_argument("--quota", type=int, default=0, help="Mediastack requests before usage_limit_reached (0 = none)")
+    args = parser.parse_args()
+
+    server = MockAPI((args.host, args.port), args.latency, args.jitter, args.rate, args.quota)
+    logging.info(f"Serving on http://{args.host}:{args.port} (latency {args.latency}s, rate {args.rate or 'unlimited'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"Stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
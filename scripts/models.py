@@ -0,0 +1,302 @@
+import os
+import time
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import telemetry
+from correlations import feature_columns
+from features import DATA_DIR, OUTPUT_FILE as MATRIX_FILE, read_matrix
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache", "models")
+OUTPUT_FILE = os.path.join(DATA_DIR, "model_scores.csv")
+
+# Walk-forward validation: the first fold trains on MIN_TRAIN weeks, every fold tests the next
+# STEP weeks and the training window grows by STEP weeks per fold
+MIN_TRAIN = 26
+STEP = 4
+HORIZONS = [1]
+MODELS = ["naive", "drift", "ridge:alpha=1", "ridge:alpha=10", "ridge:alpha=100"]
+
+FOLD_KEY = ["target", "horizon", "model", "train_end", "test_start", "test_end"]
+
+
+# Every model predicts the price change over the horizon; the forecast is the current price plus
+# that change. A model is fit(x, y, **params) -> predict(x), on float64 arrays without NaNs
+
+# Price stays where it is (random walk)
+def fit_naive(x, y):
+    return lambda x: np.zeros(len(x))
+
+
+# Mean change of the training window (random walk with drift)
+def fit_drift(x, y):
+    drift = y.mean() if len(y) else 0.0
+    return lambda x: np.full(len(x), drift)
+
+
+# Ridge regression on z-scored features. With more features than weeks the dual form solves an
+# n x n system instead of a p x p one
+def fit_ridge(x, y, alpha=1.0):
+    mean, std = x.mean(axis=0), x.std(axis=0)
+    std[std == 0] = 1.0
+    z = (x - mean) / std
+    intercept = y.mean()
+    if alpha <= 0:
+        beta = np.linalg.lstsq(z, y - intercept, rcond=None)[0]
+    elif len(z) < z.shape[1]:
+        beta = z.T @ np.linalg.solve(z @ z.T + alpha * np.eye(len(z)), y - intercept)
+    else:
+        beta = np.linalg.solve(z.T @ z + alpha * np.eye(z.shape[1]), z.T @ (y - intercept))
+    return lambda x: intercept + ((x - mean) / std) @ beta
+
+
+FITTERS = {"naive": fit_naive, "drift": fit_drift, "ridge": fit_ridge}
+
+
+# "ridge:alpha=10" -> ("ridge", {"alpha": 10.0}). The canonical spelling names the model in the
+# cache, so "ridge:alpha=10" and "ridge:alpha=10.0" share their folds
+def parse_model(spec):
+    name, _, arguments = spec.partition(":")
+    if name not in FITTERS:
+        raise ValueError(f"Unknown model {name!r}, expected one of {sorted(FITTERS)}")
+    params = {}
+    for argument in filter(None, arguments.split(",")):
+        key, _, value = argument.partition("=")
+        params[key.strip()] = float(value)
+    key = name + (":" + ",".join(f"{k}={v!r}" for k, v in sorted(params.items())) if params else "")
+    return key, name, params
+
+
+# Expanding-window folds over `n` weeks as (train_end, test_start, test_end) row positions. The
+# target of row i is only known h weeks later, so a fold testing from `test_start` trains on the
+# rows before test_start - h + 1
+def walk_forward(n, horizon, min_train=MIN_TRAIN, step=STEP):
+    first = min_train + horizon - 1
+    return [(start - horizon + 1, start, min(start + step, n)) for start in range(first, n, step)]
+
+
+# Shared, read-only feature matrix of the worker processes
+_MATRIX = None
+_FEATURES = None
+
+
+def attach(path, features):
+    global _MATRIX, _FEATURES
+    _MATRIX = np.load(path, mmap_mode="r")
+    _FEATURES = np.asarray(features)
+
+
+# The matrix is written once per input as a .npy file and memory-mapped by every worker, so a task
+# only carries column positions and folds
+def write_shared(values, path):
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(values, dtype=np.float64))
+    os.replace(tmp_path, path)
+    return path
+
+
+def impute(values, means):
+    return np.where(np.isnan(values), means, values)
+
+
+# Fit and predict the given folds of one (target, horizon, model) on the shared matrix (runs in a
+# worker process). Missing features are filled with their training mean
+def run_task(task):
+    started = time.perf_counter()
+    target, horizon, key, name, params, target_column, base_column, folds = task
+    x = np.asarray(_MATRIX[:, _FEATURES])
+    base = np.asarray(_MATRIX[:, base_column])
+    change = np.asarray(_MATRIX[:, target_column]) - base
+
+    rows = []
+    for train_end, test_start, test_end in folds:
+        train = np.flatnonzero(np.isfinite(change[:train_end]))
+        means = np.nanmean(x[train], axis=0) if len(train) else np.zeros(x.shape[1])
+        means = np.where(np.isfinite(means), means, 0.0)
+
+        test = np.arange(test_start, test_end)
+        predicted = np.full(len(test), np.nan)
+        if len(train):
+            predict = FITTERS[name](impute(x[train], means), change[train], **params)
+            predicted = base[test] + predict(impute(x[test], means))
+        for row, value in zip(test, predicted):
+            rows.append((target, horizon, key, train_end, test_start, test_end, row, base[row] + change[row], value, base[row]))
+    return (target, horizon, key, name), rows, time.perf_counter() - started
+
+
+def input_key(frame):
+    digest = hashlib.sha1("\x1f".join(map(str, frame.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Fold predictions of one feature matrix, persisted to <cache_dir>/<input key>.parquet: one row per
+# test week of every fitted fold. Asking for new targets, horizons or models only fits their folds,
+# and a changed matrix gets a new file
+class FoldCache:
+    COLUMNS = FOLD_KEY + ["row", "actual", "predicted", "base"]
+
+    def __init__(self, key, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, f"{key}.parquet")
+        self.shared_path = os.path.join(cache_dir, f"{key}.npy")
+        self.df = pd.read_parquet(self.path) if os.path.exists(self.path) else pd.DataFrame(columns=self.COLUMNS)
+        self.done = set(self.df[FOLD_KEY].itertuples(index=False, name=None))
+        self._pending = []
+        self._dirty = False
+
+    def missing(self, target, horizon, model, folds):
+        return [fold for fold in folds if (target, horizon, model, *fold) not in self.done]
+
+    def update(self, rows):
+        self._pending.extend(rows)
+        self.done.update(row[:len(FOLD_KEY)] for row in rows)
+        self._dirty = True
+
+    def _flush(self):
+        if self._pending:
+            new = pd.DataFrame(self._pending, columns=self.COLUMNS)
+            self.df = new if self.df.empty else pd.concat([self.df, new], ignore_index=True)
+            self._pending = []
+
+    def get(self, targets, horizons, models):
+        self._flush()
+        df = self.df
+        return df[df["target"].isin(targets) & df["horizon"].isin(horizons) & df["model"].isin(models)].reset_index(drop=True)
+
+    def save(self):
+        if not self._dirty:
+            return
+        self._flush()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        self.df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+# Asset prices of final_df: columns that come with `_lag{k}` lead columns
+def target_assets(matrix):
+    return [column for column in matrix.columns if f"{column}_lag1" in matrix.columns]
+
+
+# Walk-forward predictions of every (target, horizon, model) as one row per test week, indexed by
+# week. Only folds missing from the cache are fitted, across a process pool sharing the matrix
+def cross_validate(matrix, targets=None, horizons=HORIZONS, models=MODELS, min_train=MIN_TRAIN, step=STEP, cache_dir=CACHE_DIR, max_workers=None):
+    assets = target_assets(matrix)
+    targets = targets or assets
+    unknown = sorted(set(targets) - set(assets))
+    if unknown:
+        raise ValueError(f"No price columns with leads for {unknown}")
+    beyond = sorted({h for asset in targets for h in horizons if f"{asset}_lag{h}" not in matrix.columns})
+    if beyond:
+        raise ValueError(f"Horizons beyond the leads of the matrix: {beyond}")
+
+    features = [column for column in feature_columns(matrix, assets) if pd.api.types.is_numeric_dtype(matrix[column])]
+    columns = features + [column for column in matrix.columns if column not in features and pd.api.types.is_numeric_dtype(matrix[column])]
+    position = {column: i for i, column in enumerate(columns)}
+    frame = matrix[columns].astype("float64")
+    cache = FoldCache(input_key(frame), cache_dir)
+
+    specs = [parse_model(spec) for spec in models]
+    tasks = []
+    for target in targets:
+        for horizon in horizons:
+            folds = walk_forward(len(frame), horizon, min_train, step)
+            for key, name, params in specs:
+                pending = cache.missing(target, horizon, key, folds)
+                if pending:
+                    tasks.append((target, horizon, key, name, params, position[f"{target}_lag{horizon}"], position[target], pending))
+    logging.info(f"{len(targets)} targets x {len(horizons)} horizons x {len(specs)} models: {len(tasks)} to fit, {len(features)} features")
+
+    if tasks:
+        shared = write_shared(frame.to_numpy(), cache.shared_path)
+        feature_positions = list(range(len(features)))
+        with telemetry.span("models_cross_validate") as span:
+            span.set(tasks=len(tasks), workers=max_workers)
+            if len(tasks) == 1 or max_workers == 1:
+                attach(shared, feature_positions)
+                collect(map(run_task, tasks), cache, span)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=attach, initargs=(shared, feature_positions)) as executor:
+                    collect(executor.map(run_task, tasks), cache, span)
+        cache.save()
+
+    predictions = cache.get(targets, horizons, [key for key, _, _ in specs])
+    predictions.insert(0, "week_start", frame.index[predictions["row"].astype(int)])
+    return predictions.drop(columns="row").set_index("week_start")
+
+
+def collect(results, cache, span):
+    for (target, horizon, key, name), rows, seconds in results:
+        telemetry.record("model_fit", seconds, len(rows), fields={"target": target, "horizon": horizon, "config": key}, model=name)
+        cache.update(rows)
+        span.add_rows(len(rows))
+
+
+# Out-of-sample scores of every (target, horizon, model): RMSE and MAE of the price, share of
+# weeks with the right direction of the move, and skill against the naive forecast (1 - RMSE ratio)
+def scores(predictions):
+    scored = predictions.dropna(subset=["actual", "predicted"])
+    error = scored["predicted"] - scored["actual"]
+    moved = np.sign(scored["actual"] - scored["base"])
+    frame = pd.DataFrame({
+        "target": scored["target"], "horizon": scored["horizon"], "model": scored["model"],
+        "train_end": scored["train_end"], "squared_error": error ** 2, "absolute_error": error.abs(),
+        "hit": (np.sign(scored["predicted"] - scored["base"]) == moved) & (moved != 0),
+    })
+    grouped = frame.groupby(["target", "horizon", "model"])
+    out = grouped.agg(
+        folds=("train_end", "nunique"),
+        predictions=("squared_error", "size"),
+        rmse=("squared_error", "mean"),
+        mae=("absolute_error", "mean"),
+        hit_rate=("hit", "mean"),
+    )
+    out["rmse"] = np.sqrt(out["rmse"])
+    naive = out.xs("naive", level="model")["rmse"] if "naive" in out.index.get_level_values("model") else None
+    if naive is not None:
+        reference = naive.reindex(out.index.droplevel("model")).to_numpy()
+        out["skill"] = 1 - out["rmse"] / np.where(reference > 0, reference, np.nan)
+    return out.sort_values(["target", "horizon", "rmse"])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Walk-forward validation of price models for every SHFE asset of the feature matrix")
+    parser.add_argument("--matrix", default=MATRIX_FILE)
+    parser.add_argument("--targets", nargs="*", help="Assets to model (default: every asset with leads)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=HORIZONS, help="Weeks ahead, must have _lag{k} columns")
+    parser.add_argument("--models", nargs="+", default=MODELS, help="Model configurations, e.g. ridge:alpha=10")
+    parser.add_argument("--min-train", type=int, default=MIN_TRAIN, help="Weeks in the first training window")
+    parser.add_argument("--step", type=int, default=STEP, help="Weeks per test fold")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Scores per (asset, horizon, model)")
+    parser.add_argument("--predictions", help="Also write every out-of-sample prediction")
+    args = parser.parse_args()
+
+    telemetry.configure("models")
+    matrix = read_matrix(args.matrix)
+    try:
+        predictions = cross_validate(matrix, args.targets, args.horizons, args.models, args.min_train, args.step, args.cache_dir, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    table = scores(predictions)
+    table.to_csv(args.output)
+    logging.info(f"Scores of {len(table)} (asset, horizon, model) combinations saved to {args.output}")
+    if args.predictions:
+        predictions.to_csv(args.predictions)
+        logging.info(f"{len(predictions)} predictions saved to {args.predictions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 import os
+import re
+import csv
+import json
 import time
 import logging
+import argparse
 import pandas as pd
+import telemetry
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
 
 # Configure logging
 logging.basicConfig(
@@ -19,41 +23,99 @@ logging.basicConfig(
     ]
 )
 
-# Set up Selenium WebDriver
-options = Options()
-options.add_argument("--headless")  # Run in headless mode
-driver = webdriver.Chrome(options=options)
+# The crawl starts at the newest article of the news listing (or at NEWS_START_URL) and walks
+# back in time through the "next article" links
+latest_url = os.getenv("NEWS_LATEST_URL", "https://www.yicai.com/news/")
+start_url = os.getenv("NEWS_START_URL")
 
-# Base URL
-base_url = "https://www.yicai.com/news/101916631.html"
-driver.get(base_url)
-
-# Output paths
+# Output paths: an append-only article log and the cursor used to resume after a crash.
+# Together they hold the crawl state: the cursor knows the last URL, the log the seen article ids
 output_csv = "downloads/news/articles.csv"
-backup_csv = "downloads/news/articles_backup.csv"
+cursor_file = "downloads/news/crawl_cursor.json"
+
+FIELDS = ["id", "url", "title", "datetime", "text"]
+
+TITLE_XPATH = '/html/body/div[2]/div[2]/div[2]/div[3]/h1'
+DATETIME_XPATH = '/html/body/div[2]/div[2]/div[2]/div[3]/p[1]/em'
+NEXT_XPATH = '/html/body/div[2]/div[2]/div[2]/div[3]/div/a[1]'
+
+# Passes in a row that end on the same article before the crawl gives up: at the oldest article
+# there is no next link to click
+MAX_NEXT_FAILURES = 5
+
+
+def article_id(url):
+    match = re.search(r"/(\d+)\.html", url)
+    return match.group(1) if match else url
+
+
+# URL of the newest article linked from the listing page; article ids grow over time
+def latest_article_url(driver):
+    driver.get(latest_url)
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*=".html"]'))
+    )
+    links = [link.get_attribute("href") or "" for link in driver.find_elements(By.CSS_SELECTOR, 'a[href*=".html"]')]
+    articles = [url for url in links if re.search(r"/news/\d+\.html", url)]
+    if not articles:
+        raise RuntimeError(f"No article links on {latest_url}")
+    return max(articles, key=lambda url: int(article_id(url)))
+
+
+def load_cursor():
+    if not os.path.exists(cursor_file):
+        return None
+    with open(cursor_file, "r") as f:
+        return json.load(f)
+
+
+def save_cursor(cursor):
+    tmp_path = cursor_file + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cursor, f)
+    os.replace(tmp_path, cursor_file)
 
-# Ensure output directories exist
-os.makedirs(os.path.dirname(output_csv), exist_ok=True)
 
-# Initialize data storage
-all_data = []
+# Ids of articles already in the log (only the id column is read)
+def load_seen_ids():
+    if not os.path.exists(output_csv):
+        return set()
+    if "id" not in pd.read_csv(output_csv, nrows=0).columns:
+        raise ValueError(f"{output_csv} was written by the old crawler, move it away before crawling")
+    return set(pd.read_csv(output_csv, usecols=["id"], dtype=str)["id"])
 
-# Function to parse an article
-def parse_article():
+
+# Appends one article per line; the file is never rewritten
+class ArticleLog:
+    def __init__(self, path):
+        new_file = not os.path.exists(path)
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        if new_file:
+            self.writer.writeheader()
+
+    def append(self, article):
+        self.writer.writerow(article)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Function to parse the article currently open in the browser
+def parse_article(driver):
     try:
         # Wait for and extract the title
         WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/h1'))
+            EC.presence_of_element_located((By.XPATH, TITLE_XPATH))
         )
-        title = driver.find_element(By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/h1').text
+        title = driver.find_element(By.XPATH, TITLE_XPATH).text
 
         # Wait for and extract the datetime
         WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/p[1]/em'))
+            EC.presence_of_element_located((By.XPATH, DATETIME_XPATH))
         )
-        datetime = driver.find_element(By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/p[1]/em').text
-        if counter % 10 == 0:
-            logging.info(f"Oldest date is {datetime}")
+        datetime = driver.find_element(By.XPATH, DATETIME_XPATH).text
 
         # Wait for and extract the article text
         WebDriverWait(driver, 10).until(
@@ -61,54 +123,123 @@ def parse_article():
         )
         text = driver.find_element(By.ID, 'multi-text').text
 
-        # Click the next article link
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/div/a[1]'))
-        )
-        driver.find_element(By.XPATH, '/html/body/div[2]/div[2]/div[2]/div[3]/div/a[1]').click()
-
-        # Return the parsed data
-        return {"title": title, "datetime": datetime, "text": text}
+        url = driver.current_url
+        return {"id": article_id(url), "url": url, "title": title, "datetime": datetime, "text": text}
     except Exception as e:
-        logging.error(f"Error parsing article")
+        logging.error(f"Error parsing article: {e}")
         return None
 
-# Main loop
-counter = 1
-try:
-    while True:
-        try:
-            # logging.info(f"Processing article #{counter}")
-            time.sleep(1)
-
-            article_data = parse_article()
-            if article_data:
-                all_data.append(article_data)
-
-
-                # Backup every 100 articles
-                if counter % 10 == 0:
-                    df = pd.DataFrame(all_data)
-                    df.to_csv(backup_csv, index=False)
-                    logging.info(f"Backup saved after {counter} articles.")
-
-                    current_url = driver.current_url
-                    logging.info(f"Link to the last article: {current_url}")
-
-                counter += 1
-            else:
-                logging.warning("Failed to parse article. Retrying...")
-                time.sleep(5)  # Additional sleep on failure
-        except Exception as e:
-            logging.error(f"Error in processing article")
-            time.sleep(5)  # Sleep before retrying
-except KeyboardInterrupt:
-    logging.info("Script interrupted by user.")
-    driver.quit()
-finally:
-    logging.info("Saving and quitting the WebDriver.")
-
-    df = pd.DataFrame(all_data)
-    df.to_csv(output_csv, index=False)
-
-    driver.quit()
\ No newline at end of file
+
+# Function to click the next (older) article link
+def go_next(driver):
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.XPATH, NEXT_XPATH))
+    )
+    driver.find_element(By.XPATH, NEXT_XPATH).click()
+
+
+# Crawl until an article older than stop_date is reached. We also stop at the first article that
+# is already in the log, except while resuming an interrupted crawl: from the cursor up to the
+# first new article, articles in the log are walked past
+def crawl(driver, stop_date=None, resume=True):
+    seen_ids = load_seen_ids()
+    cursor = load_cursor()
+    resuming = resume and cursor is not None and not cursor.get("finished", False)
+
+    if resuming:
+        logging.info(f"Resuming after {cursor['last_url']} ({len(seen_ids)} articles in the log)")
+        driver.get(cursor["last_url"])
+        go_next(driver)
+    else:
+        url = start_url or latest_article_url(driver)
+        logging.info(f"Starting at {url}")
+        driver.get(url)
+
+    log = ArticleLog(output_csv)
+    run_ids = set()
+    counter = 0
+    stuck = 0
+    try:
+        while True:
+            try:
+                time.sleep(1)
+
+                with telemetry.span("yicai_article"):
+                    article_data = parse_article(driver)
+                if not article_data:
+                    telemetry.count("yicai_articles_total", outcome="parse_failed")
+                    logging.warning("Failed to parse article. Retrying...")
+                    time.sleep(5)  # Additional sleep on failure
+                    continue
+
+                published = pd.to_datetime(article_data["datetime"], errors="coerce")
+                if stop_date is not None and pd.notna(published) and published < stop_date:
+                    logging.info(f"Reached {article_data['datetime']}, older than {stop_date:%Y-%m-%d}")
+                    break
+
+                # Still on the same page after a failed click
+                if article_data["id"] in run_ids:
+                    stuck += 1
+                    if stuck >= MAX_NEXT_FAILURES:
+                        logging.info(f"No next article after {article_data['url']} in {stuck} tries, stopping")
+                        break
+                    go_next(driver)
+                    continue
+                stuck = 0
+
+                if article_data["id"] in seen_ids:
+                    telemetry.count("yicai_articles_total", outcome="seen")
+                    if not resuming:
+                        logging.info(f"Article {article_data['id']} is already in the log, nothing new beyond it")
+                        break
+                else:
+                    log.append(article_data)
+                    telemetry.count("yicai_articles_total", outcome="saved")
+                    seen_ids.add(article_data["id"])
+                    counter += 1
+                    resuming = False
+                run_ids.add(article_data["id"])
+
+                save_cursor({"last_url": article_data["url"], "finished": False})
+                if counter and counter % 10 == 0:
+                    logging.info(f"{counter} articles saved, oldest date is {article_data['datetime']}")
+
+                go_next(driver)
+            except Exception as e:
+                logging.error(f"Error in processing article: {e}")
+                time.sleep(5)  # Sleep before retrying
+
+        cursor = load_cursor() or {}
+        save_cursor({**cursor, "finished": True})
+    finally:
+        log.close()
+        logging.info(f"{counter} new articles saved to {output_csv}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl yicai articles into an append-only log")
+    parser.add_argument("--stop-date", default=os.getenv("NEWS_STOP_DATE"), help="Stop at articles older than this date (YYYY-MM-DD)")
+    parser.add_argument("--no-resume", action="store_true", help="Start from the newest article even if the last crawl was interrupted")
+    args = parser.parse_args()
+    telemetry.configure("yicai_news")
+
+    # Ensure output directories exist
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+
+    # Set up Selenium WebDriver
+    options = Options()
+    options.add_argument("--headless")  # Run in headless mode
+    driver = webdriver.Chrome(options=options)
+
+    stop_date = pd.Timestamp(args.stop_date) if args.stop_date else None
+    try:
+        crawl(driver, stop_date=stop_date, resume=not args.no_resume)
+    except KeyboardInterrupt:
+        logging.info("Script interrupted by user.")
+    finally:
+        logging.info("Quitting the WebDriver.")
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
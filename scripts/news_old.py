@@ -1,9 +1,13 @@
 import os
-import pandas as pd
-import requests
-from time import sleep
+import csv
+import json
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import logging
+import telemetry
+from http_utils import TokenBucket, make_session
 
 load_dotenv()
 
@@ -18,34 +22,230 @@ logging.basicConfig(
 )
 
 api_key = os.getenv("MEDIASTACK_API_KEY")
-base_url = "https://api.mediastack.com/v1/news"
+# Point MEDIASTACK_BASE_URL at scripts/mock_api.py (e.g. http://localhost:8000/v1) to test offline
+base_url = os.getenv("MEDIASTACK_BASE_URL", "https://api.mediastack.com/v1") + "/news"
 
-# Function to fetch news data for a specific month
-def fetch_news_data(start_date, end_date, categories, countries, limit=100):
-    offset = 0
-    all_results = []
+# Requests per second allowed by the plan, parallel requests and an optional cap on the
+# number of requests spent by one run (0 = no cap)
+RATE_LIMIT = float(os.getenv("MEDIASTACK_RATE_LIMIT", "2"))
+MAX_WORKERS = int(os.getenv("MEDIASTACK_MAX_WORKERS", "6"))
+MAX_REQUESTS = int(os.getenv("MEDIASTACK_MAX_REQUESTS", "0"))
 
-    while True:
-        url = f"{base_url}?access_key={api_key}&date={start_date},{end_date}&categories={categories}&countries={countries}&limit={limit}&offset={offset}"
-        logging.info(f"Making request to {url}")
-        response = requests.get(url)
+# Fields of a Mediastack article, in the order they are written
+FIELDS = ["author", "title", "description", "url", "source", "image", "category", "language", "country", "published_at"]
 
-        if not response.ok:
-            logging.error(f"Error: {response.status_code}, {response.text}")
-            break
+limiter = TokenBucket(RATE_LIMIT)
+session = make_session(pool_size=MAX_WORKERS, limiter=limiter)
 
-        data = response.json()
-        if "data" not in data or not data["data"]:
-            logging.info("No more data to fetch.")
-            break
 
-        all_results.extend(data["data"])
-        offset += limit
+class QuotaExceeded(Exception):
+    pass
 
-    return all_results
+
+# JSON body of a response, or None when it is not JSON (e.g. the HTML page of a 502 from a proxy)
+def decode(response):
+    if "json" not in response.headers.get("Content-Type", ""):
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+# Function to fetch one page of news for a date window
+def fetch_page(start_date, end_date, categories, countries, limit, offset, retries=5):
+    params = {
+        "access_key": api_key,
+        "date": f"{start_date},{end_date}",
+        "categories": categories,
+        "countries": countries,
+        "limit": limit,
+        "offset": offset,
+    }
+    for attempt in range(retries):
+        limiter.acquire()
+        logging.info(f"Making request for {start_date} to {end_date}, offset {offset}")
+        with telemetry.span("mediastack_page", month=start_date[:7]) as span:
+            span.set(offset=offset, attempt=attempt)
+            response = session.get(base_url, params=params)
+            data = decode(response)
+            if isinstance(data, dict):
+                span.add_rows(len(data.get("data") or []))
+
+        # Mediastack reports plan limits in the body: the monthly quota is final,
+        # the per-second rate limit is worth waiting for
+        error = data.get("error") if isinstance(data, dict) else None
+        if error:
+            telemetry.count("mediastack_errors_total", code=error.get("code"))
+            if error.get("code") == "usage_limit_reached":
+                raise QuotaExceeded(error.get("message", "usage limit reached"))
+            if error.get("code") == "rate_limit_reached":
+                time.sleep(2 ** attempt)
+                continue
+            raise RuntimeError(f"Error: {response.status_code}, {error}")
+        if not response.ok or not isinstance(data, dict):
+            telemetry.count("mediastack_errors_total", code=f"http_{response.status_code}")
+            raise RuntimeError(f"Error: {response.status_code}, {response.text[:200]}")
+        return data
+
+    raise RuntimeError(f"Rate limited {retries} times for {start_date} to {end_date}, offset {offset}")
+
+
+# Streams the pages of one month to `<path>.tmp` as they arrive; `append` starts from a copy of
+# the file of an earlier run. The month file only changes on publish, so a run that is killed
+# or raises mid-month never leaves a truncated file that a later run would take as complete
+class MonthWriter:
+    def __init__(self, path, append=False):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.rows = 0
+        if append:
+            shutil.copyfile(path, self.tmp_path)
+        self.file = open(self.tmp_path, "a" if append else "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS, extrasaction="ignore")
+        if not append:
+            self.writer.writeheader()
+
+    def write(self, articles):
+        self.writer.writerows(articles)
+        self.rows += len(articles)
+
+    def publish(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+# Pages that failed or were never requested (quota, request cap), per month window. The next run
+# refetches only these pages and appends them to the month files; months without failed pages
+# whose file exists are complete and not requested again
+def failed_pages_file(output_dir):
+    return os.path.join(output_dir, "failed_pages.json")
+
+
+def load_failed_pages(output_dir):
+    path = failed_pages_file(output_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return {(start_date, end_date): sorted(offsets) for start_date, end_date, offsets in json.load(f)}
+
+
+def save_failed_pages(output_dir, failed):
+    path = failed_pages_file(output_dir)
+    if not failed:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump([[*window, sorted(offsets)] for window, offsets in sorted(failed.items())], f)
+    os.replace(tmp_path, path)
+
+
+# Fetch all months at once. The first page of a month tells the total, after which all
+# remaining offsets of that month are requested in parallel as well
+def fetch_news(months, categories, countries, output_dir, limit=100):
+    paths = {window: os.path.join(output_dir, f"news_{window[0]}_{window[1]}.csv") for window in months}
+    failed_before = load_failed_pages(output_dir)
+    requests = {}
+    for window, path in paths.items():
+        if window in failed_before and os.path.exists(path):
+            requests[window] = failed_before[window]
+        elif not os.path.exists(path):
+            requests[window] = [0]
+    retried = sum(len(offsets) for window, offsets in requests.items() if window in failed_before)
+    logging.info(f"{len(requests)} of {len(months)} months to fetch ({retried} failed pages of earlier runs)")
+
+    writers = {window: MonthWriter(paths[window], append=window in failed_before and os.path.exists(paths[window])) for window in requests}
+    failed = {}
+    outstanding = {window: 0 for window in requests}
+    remaining = dict(failed_before)
+    spent = 0
+    quota_left = True
+
+    def publish(window):
+        writer = writers.pop(window)
+        writer.publish()
+        logging.info(f"Data for {window[0]} to {window[1]} saved to {writer.path} ({writer.rows} new articles)")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pending = {}
+
+        def submit(window, offset):
+            nonlocal spent
+            if not quota_left or (MAX_REQUESTS and spent >= MAX_REQUESTS):
+                failed.setdefault(window, set()).add(offset)
+                return
+            spent += 1
+            outstanding[window] += 1
+            future = executor.submit(fetch_page, *window, categories, countries, limit, offset)
+            pending[future] = (window, offset)
+
+        for window, offsets in requests.items():
+            for offset in offsets:
+                submit(window, offset)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                window, offset = pending.pop(future)
+                outstanding[window] -= 1
+                try:
+                    data = future.result()
+                except QuotaExceeded as e:
+                    logging.error(f"API quota exhausted, no new requests will be made: {e}")
+                    quota_left = False
+                    failed.setdefault(window, set()).add(offset)
+                    continue
+                except Exception as e:
+                    logging.error(f"{window[0]} to {window[1]}, offset {offset} failed: {e}")
+                    failed.setdefault(window, set()).add(offset)
+                    continue
+
+                writers[window].write(data.get("data", []))
+
+                if offset == 0:
+                    total = data.get("pagination", {}).get("total", 0)
+                    logging.info(f"{window[0]} to {window[1]}: {total} articles")
+                    for next_offset in range(limit, total, limit):
+                        submit(window, next_offset)
+
+                # A month whose pages all landed is published right away; if its failed pages came
+                # from an earlier run, they are dropped from failed_pages.json after the file is in place
+                if outstanding[window] == 0 and window not in failed:
+                    publish(window)
+                    if remaining.pop(window, None) is not None:
+                        save_failed_pages(output_dir, remaining)
+
+    # Months left with failed pages: refetched months are published before failed_pages.json
+    # changes and new months after it, so an interruption in between can only cause pages to be
+    # fetched twice, never skipped. Failed pages of months outside this run are kept
+    for window in [window for window in writers if window in remaining]:
+        publish(window)
+    failed = {**{window: offsets for window, offsets in remaining.items() if window not in requests}, **failed}
+    save_failed_pages(output_dir, failed)
+    for window in list(writers):
+        publish(window)
+    if failed:
+        logging.warning(f"{sum(map(len, failed.values()))} pages not fetched, rerun to fetch them")
+
+    return list(paths.values())
+
+
+# Concatenate the month files line by line, without loading them into memory
+def combine_files(paths, output_file):
+    with open(output_file, "w", newline="", encoding="utf-8") as out:
+        out.write(",".join(FIELDS) + "\n")
+        for path in paths:
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                next(f)  # Skip the header
+                for line in f:
+                    out.write(line)
 
 # Main script
 if __name__ == "__main__":
+    telemetry.configure("mediastack_news")
+
     # Define parameters
     categories = "general,business,technology,health,science,entertainment"
     countries = "cn,eg,hk,ma,ng,za,tw"
@@ -80,23 +280,9 @@ if __name__ == "__main__":
     os.makedirs("./downloads/news", exist_ok=True)
     os.makedirs("./data", exist_ok=True)
 
-    all_news = []
-
-    for start_date, end_date in months:
-        logging.info(f"Fetching news for {start_date} to {end_date}")
-        news_data = fetch_news_data(start_date, end_date, categories, countries)
-        all_news.extend(news_data)
-
-        # Save temporary CSV for the current month
-        month_df = pd.DataFrame(news_data)
-        month_file = f"./downloads/news/news_{start_date}_{end_date}.csv"
-        month_df.to_csv(month_file, index=False)
-        logging.info(f"Temporary data for {start_date} to {end_date} saved to {month_file}")
-
-    # Convert all data to a single DataFrame
-    news_df = pd.DataFrame(all_news)
+    month_files = fetch_news(months, categories, countries, "./downloads/news")
 
     # Save to final CSV
     output_file = "./data/news.csv"
-    news_df.to_csv(output_file, index=False)
-    logging.info(f"All news data saved to {output_file}")
\ No newline at end of file
+    combine_files(month_files, output_file)
+    logging.info(f"All news data saved to {output_file}")
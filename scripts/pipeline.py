@@ -0,0 +1,337 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import telemetry
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+STATE_FILE = os.path.join(ROOT, "data", "cache", "pipeline.json")
+LOG_DIR = os.path.join(ROOT, "logs", "pipeline")
+
+# Vessel CSVs from before the bulk run files; spatial.py reads them by default
+LEGACY_VESSEL_SHARDS = sorted(os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "data", "vessels", "vessels_[0-9]*.csv")))
+
+
+# One step of the workflow: a script run as a subprocess with explicit inputs and outputs
+# (paths relative to the repository root). Fetch stages pull from the network, so their inputs
+# cannot be hashed: they run on every refresh (they are incremental themselves) unless --no-fetch
+class Stage:
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), cwd=ROOT, env=None, fetch=False):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cwd = cwd
+        self.env = env or {}
+        self.fetch = fetch
+
+    def command(self):
+        return [sys.executable, os.path.join(SCRIPTS_DIR, self.script), *self.args]
+
+
+# The scripts keep their own paths: most of them write under logs/, downloads/ and data/ relative
+# to the repository root, get_vessels.py relative to scripts/
+STAGES = [
+    # Commodities
+    Stage("shfe_reports", "commodities.py", outputs=["downloads/commodities"], fetch=True),
+    Stage("commodities", "filter_commodities.py", inputs=["downloads/commodities"], outputs=["data/commodities.csv"]),
+    Stage("commodity_store", "commodity_store.py", ["data/commodities.csv"],
+          inputs=["data/commodities.csv"], outputs=["data/commodities/commodities.parquet"]),
+    Stage("continuous", "continuous.py", ["data/commodities/commodities.parquet", "--output", "data/commodities/continuous.csv"],
+          inputs=["data/commodities/commodities.parquet"], outputs=["data/commodities/continuous.csv"]),
+
+    # Shipping
+    Stage("port_calls", "port_calls.py", outputs=["downloads/port-calls/store"], fetch=True),
+    Stage("vessels", "get_vessels.py", inputs=["downloads/port-calls/store"],
+          outputs=["data/vessels/vessels_info.csv", "data/vessels/bulk"], cwd=SCRIPTS_DIR,
+          env={"PORT_CALLS_FILE": os.path.join(ROOT, "downloads", "port-calls", "store")}, fetch=True),
+    Stage("dwell", "dwell.py", ["downloads/port-calls/store", "--output", "data/port_congestion.csv"],
+          inputs=["downloads/port-calls/store"], outputs=["data/port_congestion.csv"]),
+    Stage("proximity", "spatial.py", ["--output", "data/port_proximity.csv"],
+          inputs=["data/vessels/bulk", *LEGACY_VESSEL_SHARDS, "data/mapping/ports_coords.csv"], outputs=["data/port_proximity.csv"]),
+
+    # News
+    Stage("yicai_news", "news.py", outputs=["downloads/news/articles.csv"], fetch=True),
+    Stage("mediastack_news", "news_old.py", outputs=["data/news.csv"], fetch=True),
+    Stage("dedup", "dedup.py", ["--yicai", "downloads/news/articles.csv", "--mediastack", "data/news.csv", "--output-dir", "data/news_dedup"],
+          inputs=["downloads/news/articles.csv", "data/news.csv"], outputs=["data/news_dedup/articles.csv", "data/news_dedup/news.csv"]),
+    Stage("sentiment", "sentiment.py", ["--yicai", "data/news_dedup/articles.csv", "--mediastack", "data/news_dedup/news.csv", "--output", "data/sentiment.csv"],
+          inputs=["data/news_dedup/articles.csv", "data/news_dedup/news.csv"], outputs=["data/sentiment.csv"]),
+
+    # Merge
+    Stage("features", "features.py", [
+        "--port-calls", "downloads/port-calls/store", "--vessels", "data/vessels/vessels_info.csv",
+        "--commodities", "data/commodities.csv", "--sentiment", "data/sentiment.csv", "--output", "data/final_df.csv",
+    ], inputs=["downloads/port-calls/store", "data/vessels/vessels_info.csv", "data/commodities.csv", "data/sentiment.csv"],
+        outputs=["data/final_df.csv"]),
+    Stage("correlations", "correlations.py", ["--matrix", "data/final_df.csv", "--commodities", "data/commodities.csv", "--output", "data/correlations.csv"],
+          inputs=["data/final_df.csv", "data/commodities.csv"], outputs=["data/correlations.csv"]),
+    Stage("models", "models.py", ["--matrix", "data/final_df.csv", "--output", "data/model_scores.csv"],
+          inputs=["data/final_df.csv"], outputs=["data/model_scores.csv"]),
+]
+
+
+def contains(parent, path):
+    return path == parent or path.startswith(parent.rstrip("/") + "/")
+
+
+# Stage -> names of the stages producing its inputs (an input inside an output directory counts)
+def dependencies(stages):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"{output} is produced by both {producers[output]} and {stage.name}")
+            producers[output] = stage.name
+    return {
+        stage.name: sorted({
+            producer for output, producer in producers.items()
+            for path in stage.inputs if producer != stage.name and (contains(output, path) or contains(path, output))
+        })
+        for stage in stages
+    }
+
+
+def topological_order(deps):
+    order, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage dependency cycle through {name}")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in deps:
+        visit(name)
+    return order
+
+
+# The targets together with every stage they depend on
+def select(deps, targets):
+    selected = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(deps[name])
+    return selected
+
+
+# Content hashes of files, memoized by (size, mtime) so unchanged files are not read again
+class FileHasher:
+    def __init__(self, memo=None):
+        self.memo = memo or {}
+
+    def file(self, path):
+        stat = os.stat(path)
+        cached = self.memo.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.memo[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.memo[path][2]
+
+    # Files and directories starting with "." or "_" (caches, manifests, partial downloads)
+    # are not content
+    def path(self, path):
+        digest = hashlib.sha1()
+        if os.path.isfile(path):
+            digest.update(self.file(path).encode())
+        elif os.path.isdir(path):
+            for directory, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(name for name in dirnames if not name.startswith((".", "_")))
+                for name in sorted(filenames):
+                    if not name.startswith((".", "_")):
+                        file_path = os.path.join(directory, name)
+                        digest.update(os.path.relpath(file_path, path).encode())
+                        digest.update(self.file(file_path).encode())
+        else:
+            digest.update(b"missing")
+        return digest.hexdigest()
+
+
+# Local modules a script imports, followed recursively: a change to any of them reruns the stage
+def source_files(script):
+    files, stack = [], [script]
+    while stack:
+        name = stack.pop()
+        path = os.path.join(SCRIPTS_DIR, name)
+        if name in files or not os.path.exists(path):
+            continue
+        files.append(name)
+        with open(path, "r", encoding="utf-8") as f:
+            modules = re.findall(r"^(?:from|import)\s+(\w+)", f.read(), flags=re.MULTILINE)
+        stack.extend(f"{module}.py" for module in modules)
+    return sorted(files)
+
+
+# Everything that decides what a stage produces: its command, code and input contents
+def stage_key(stage, hasher):
+    digest = hashlib.sha1(json.dumps([stage.args, stage.env]).encode())
+    for name in source_files(stage.script):
+        digest.update(hasher.file(os.path.join(SCRIPTS_DIR, name)).encode())
+    for path in stage.inputs:
+        digest.update(path.encode())
+        digest.update(hasher.path(os.path.join(ROOT, path)).encode())
+    return digest.hexdigest()
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {"stages": {}, "files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Runs in a worker thread; output goes to logs/pipeline/<stage>.log
+def run_stage(stage):
+    os.makedirs(LOG_DIR, exist_ok=True)
+    os.makedirs(os.path.join(ROOT, "logs"), exist_ok=True)
+    started = time.monotonic()
+    with open(os.path.join(LOG_DIR, f"{stage.name}.log"), "w") as log:
+        result = subprocess.run(stage.command(), cwd=stage.cwd, env={**os.environ, **stage.env}, stdout=log, stderr=subprocess.STDOUT)
+    return result.returncode, time.monotonic() - started
+
+
+class Pipeline:
+    def __init__(self, stages=STAGES, state_file=STATE_FILE):
+        self.stages = {stage.name: stage for stage in stages}
+        self.deps = dependencies(stages)
+        self.order = topological_order(self.deps)
+        self.state_file = state_file
+        self.state = load_state(state_file)
+        self.hasher = FileHasher(self.state["files"])
+
+    def outputs_exist(self, stage):
+        return all(os.path.exists(os.path.join(ROOT, path)) for path in stage.outputs)
+
+    # "run" or the reason to skip, decided once the stage's dependencies have finished
+    def decide(self, stage, force, fetch):
+        if stage.name in force:
+            return "run", None
+        if stage.fetch:
+            if fetch or not self.outputs_exist(stage):
+                return "run", None
+            return "skip (no fetch)", None
+        key = stage_key(stage, self.hasher)
+        if self.state["stages"].get(stage.name, {}).get("key") == key and self.outputs_exist(stage):
+            return "skip (unchanged)", key
+        return "run", key
+
+    # Independent branches run in parallel, each stage as soon as its dependencies are done.
+    # A failed stage blocks its dependents but not the other branches
+    def run(self, targets=None, force=(), fetch=True, jobs=3, dry_run=False):
+        selected = select(self.deps, targets or self.order)
+        force = set(self.order if force is True else force)
+        remaining = [name for name in self.order if name in selected]
+        status = {}
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = {}
+            while remaining or pending:
+                for name in list(remaining):
+                    deps = [dep for dep in self.deps[name] if dep in selected]
+                    if any(status.get(dep) in ("failed", "blocked") for dep in deps):
+                        status[name] = "blocked"
+                        remaining.remove(name)
+                        logging.warning(f"{name}: blocked by a failed dependency")
+                        continue
+                    if not all(dep in status for dep in deps):
+                        continue
+                    remaining.remove(name)
+                    stage = self.stages[name]
+                    decision, key = self.decide(stage, force, fetch)
+                    if decision != "run" or dry_run:
+                        status[name] = decision if decision != "run" else "would run"
+                        logging.info(f"{name}: {status[name]}")
+                        if not dry_run:
+                            telemetry.count("pipeline_stage_skipped_total", stage=name)
+                        continue
+                    logging.info(f"{name}: running {' '.join(stage.command()[1:])}")
+                    pending[executor.submit(run_stage, stage)] = (name, key)
+
+                if not pending:
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = pending.pop(future)
+                    returncode, seconds = future.result()
+                    telemetry.record("pipeline_stage", seconds, status="error" if returncode else "ok", stage=name)
+                    if returncode:
+                        status[name] = "failed"
+                        logging.error(f"{name}: failed with exit code {returncode} after {seconds:.1f}s, see {os.path.join(LOG_DIR, name + '.log')}")
+                        continue
+                    status[name] = "done"
+                    logging.info(f"{name}: done in {seconds:.1f}s")
+                    # Fetch stages are keyed after the run, so their dependents see the new content
+                    stage = self.stages[name]
+                    self.state["stages"][name] = {"key": key or stage_key(stage, self.hasher), "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    save_state(self.state, self.state_file)
+
+        if not dry_run:
+            save_state(self.state, self.state_file)
+        return status
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Run the data pipeline, skipping stages whose inputs have not changed")
+    parser.add_argument("targets", nargs="*", help="Stages to bring up to date, with their dependencies (default: all)")
+    parser.add_argument("--jobs", type=int, default=3, help="Stages run at the same time")
+    parser.add_argument("--force", nargs="*", help="Rerun these stages (all selected ones if none are given)")
+    parser.add_argument("--no-fetch", action="store_true", help="Do not run the network stages, use what is on disk")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would run")
+    parser.add_argument("--list", action="store_true", help="List the stages and their dependencies")
+    args = parser.parse_args()
+
+    pipeline = Pipeline()
+    if args.list:
+        for name in pipeline.order:
+            stage = pipeline.stages[name]
+            print(f"{name:<16} {'fetch ' if stage.fetch else ''}after: {', '.join(pipeline.deps[name]) or '-'}")
+        return
+
+    unknown = [name for name in args.targets + (args.force or []) if name not in pipeline.stages]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    force = True if args.force == [] else (args.force or ())
+    if not args.dry_run:
+        telemetry.configure("pipeline")
+    status = pipeline.run(args.targets, force, not args.no_fetch, args.jobs, args.dry_run)
+    failed = [name for name, value in status.items() if value in ("failed", "blocked")]
+    if failed:
+        logging.error(f"Not completed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import telemetry
+from port_call_store import PortCallStore
+
+CHUNK_SIZE = 500_000
+
+# Compact in-memory layout of a port call. Identifiers fit in int32 (MMSI has 9 digits, IMO 7),
+# with 0 standing for a missing one (neither 0 is a valid number). `time_utc` is the only time
+# column: time_local carries no information beyond the port's UTC offset
+CALL_COLUMNS = ["event", "time_utc", "mmsi", "imo", "vessel_name", "port_id", "unloco", "port_name"]
+ID_COLUMNS = ["mmsi", "imo", "port_id"]
+
+# Vessel attributes joined onto calls, with their compact dtypes
+VESSEL_DTYPES = {
+    "vessel_type": "category",
+    "ais_type": "float32",
+    "flag": "category",
+    "built": "float32",
+    "gt": "float32",
+    "dwt": "float32",
+    "avg_sog": "float32",
+    "max_sog": "float32",
+    "size_a": "float32",
+    "size_b": "float32",
+    "size_c": "float32",
+    "size_d": "float32",
+}
+
+
+def compact_calls(df):
+    columns = [column for column in CALL_COLUMNS if column in df.columns]
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for column in columns:
+        values = df[column].reset_index(drop=True)
+        if column == "time_utc":
+            out[column] = pd.to_datetime(values, utc=True, format="ISO8601").dt.tz_localize(None)
+        elif column in ID_COLUMNS:
+            out[column] = pd.to_numeric(values, errors="coerce").fillna(0).astype("int32")
+        else:
+            out[column] = values.astype("category")
+    return out
+
+
+# Concatenate chunks whose categoricals were built independently
+def concat_chunks(chunks):
+    if not chunks:
+        return compact_calls(pd.DataFrame(columns=CALL_COLUMNS))
+    out = {}
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            out[column] = pd.Series(union_categoricals([chunk[column] for chunk in chunks]))
+        else:
+            out[column] = pd.Series(np.concatenate([chunk[column].to_numpy() for chunk in chunks]))
+    return pd.DataFrame(out)
+
+
+# Port calls from a CSV, compacted chunk by chunk so the raw object columns of the whole file
+# never exist at once
+def read_calls_csv(path, chunksize=CHUNK_SIZE):
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [column for column in CALL_COLUMNS if column in header]
+    with telemetry.span("port_calls_read") as span:
+        chunks = [
+            compact_calls(chunk)
+            for chunk in pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunksize)
+        ]
+        df = concat_chunks(chunks)
+        span.add_rows(len(df))
+        span.set(chunks=len(chunks))
+    logging.info(f"Read {len(df)} port calls from {path} ({df.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB)")
+    return df
+
+
+# Port calls from a CSV file or a PortCallStore directory
+def load_calls(source, chunksize=CHUNK_SIZE):
+    if os.path.isdir(source):
+        return compact_calls(PortCallStore(source).read())
+    if source.endswith(".parquet"):
+        return compact_calls(pd.read_parquet(source))
+    return read_calls_csv(source, chunksize)
+
+
+# Vessel attributes in arrays sorted by MMSI: attaching them to calls is a binary search per call
+# and one take per column, instead of a merge that copies the wide vessel frame onto every row
+class VesselLookup:
+    def __init__(self, vessels, columns=None):
+        columns = [column for column in (columns or VESSEL_DTYPES) if column in vessels.columns]
+        vessels = vessels.drop_duplicates(subset="mmsi", keep="last")
+        mmsi = pd.to_numeric(vessels["mmsi"], errors="coerce")
+        vessels, mmsi = vessels[mmsi.notna().to_numpy()], mmsi.dropna().to_numpy(dtype=np.int64)
+        order = np.argsort(mmsi, kind="stable")
+
+        # Every column ends with a missing value, which position -1 (unknown MMSI) picks up
+        self.mmsi = mmsi[order]
+        self.columns = {}
+        for column in columns:
+            values = vessels[column].iloc[order].reset_index(drop=True)
+            if VESSEL_DTYPES.get(column) == "category":
+                values = values.astype("category").array
+                self.columns[column] = (np.append(values.codes, -1), values.categories)
+            else:
+                values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=VESSEL_DTYPES.get(column, "float32"))
+                self.columns[column] = np.append(values, np.nan).astype(values.dtype)
+
+    def positions(self, mmsi):
+        mmsi = pd.to_numeric(pd.Series(mmsi), errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        positions = np.searchsorted(self.mmsi, mmsi)
+        positions = np.minimum(positions, max(len(self.mmsi) - 1, 0))
+        found = (self.mmsi[positions] == mmsi) if len(self.mmsi) else np.zeros(len(mmsi), dtype=bool)
+        return np.where(found, positions, -1)
+
+    # Vessel attributes of every call, aligned with `mmsi` (missing vessels get NaN)
+    def attributes(self, mmsi, columns=None, index=None):
+        positions = self.positions(mmsi)
+        out = {}
+        for column in columns or self.columns:
+            values = self.columns[column]
+            if isinstance(values, tuple):
+                codes, categories = values
+                out[column] = pd.Categorical.from_codes(codes[positions], categories=categories)
+            else:
+                out[column] = values[positions]
+        return pd.DataFrame(out, index=index)
+
+    def attach(self, calls, columns=None):
+        attributes = self.attributes(calls["mmsi"], columns, index=calls.index)
+        return pd.concat([calls, attributes], axis=1)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Convert port calls to a compact Parquet file with vessel attributes")
+    parser.add_argument("source", help="port_calls.csv or a port call store directory")
+    parser.add_argument("--vessels", nargs="*", default=[], help="Vessel CSV/Parquet files to join by MMSI")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    calls = load_calls(args.source, args.chunksize)
+    if args.vessels:
+        frames = [pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path) for path in args.vessels]
+        calls = VesselLookup(pd.concat(frames, ignore_index=True)).attach(calls)
+
+    calls.to_parquet(args.output, index=False)
+    logging.info(f"{len(calls)} port calls ({calls.memory_usage(deep=True).sum() / 2 ** 20:.1f} MB in memory) saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
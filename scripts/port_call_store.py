@@ -0,0 +1,140 @@
+import os
+import json
+import calendar
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Store layout: <root>/port=MGTOA/month=2024-01/part.parquet plus <root>/_manifest.json.
+# Files starting with "_" are ignored by the parquet dataset reader
+STORE_DIR = os.path.abspath("./downloads/port-calls/store")
+MANIFEST_NAME = "_manifest.json"
+
+# Fixed schema so that every partition can be read back as one dataset
+PORT_CALL_SCHEMA = pa.schema([
+    ("event", pa.string()),
+    ("time_utc", pa.string()),
+    ("time_local", pa.string()),
+    ("mmsi", pa.int64()),
+    ("imo", pa.int64()),
+    ("vessel_name", pa.string()),
+    ("port_id", pa.int64()),
+    ("unloco", pa.string()),
+    ("port_name", pa.string()),
+])
+
+
+def window_key(unloco, year, month):
+    return f"{unloco}/{year}-{month:02d}"
+
+
+def window_end(year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    return datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.utc)
+
+
+class PortCallStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest_path = os.path.join(self.root, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _partition_dir(self, unloco, year, month):
+        return os.path.join(self.root, f"port={unloco}", f"month={year}-{month:02d}")
+
+    # A window is stale if it was fetched before the month was over (calls could still arrive)
+    # or, when max_age is given, if it was fetched longer ago than that
+    def is_fresh(self, unloco, year, month, max_age=None, now=None):
+        entry = self.manifest.get(window_key(unloco, year, month))
+        if entry is None:
+            return False
+
+        now = now or datetime.now(timezone.utc)
+        fetched_at = datetime.fromisoformat(entry["fetched_at"])
+        if fetched_at <= window_end(year, month):
+            return False
+        if max_age is not None and now - fetched_at > max_age:
+            return False
+        return True
+
+    # (unloco, year, month) windows that are missing from the store or stale
+    def pending(self, unlocos, year, months=range(1, 13), max_age=None):
+        now = datetime.now(timezone.utc)
+        return [
+            (unloco, year, month)
+            for unloco in unlocos
+            for month in months
+            if datetime(year, month, 1, tzinfo=timezone.utc) <= now
+            and not self.is_fresh(unloco, year, month, max_age=max_age, now=now)
+        ]
+
+    # Write one fetched window, replacing any previous fetch of it, and record it in the manifest
+    def write(self, unloco, year, month, df):
+        part_dir = self._partition_dir(unloco, year, month)
+        part_path = os.path.join(part_dir, "part.parquet")
+
+        if df.empty:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        else:
+            df = df.reindex(columns=PORT_CALL_SCHEMA.names)
+            for name in ("mmsi", "imo", "port_id"):
+                df[name] = pd.to_numeric(df[name], errors="coerce").astype("Int64")
+            table = pa.Table.from_pandas(df, schema=PORT_CALL_SCHEMA, preserve_index=False)
+
+            os.makedirs(part_dir, exist_ok=True)
+            tmp_path = os.path.join(part_dir, "_part.parquet.tmp")
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, part_path)
+
+        self.manifest[window_key(unloco, year, month)] = {
+            "rows": len(df),
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._save_manifest()
+
+    # Consolidated read of the whole store (or a subset of ports/months) as one DataFrame
+    def read(self, unlocos=None, months=None, columns=None):
+        if not any(name.startswith("port=") for name in os.listdir(self.root)):
+            return pd.DataFrame(columns=columns or PORT_CALL_SCHEMA.names)
+
+        dataset = ds.dataset(
+            self.root,
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([("port", pa.string()), ("month", pa.string())]), flavor="hive"
+            ),
+        )
+
+        # Partition pruning: only the matching port/month directories are opened
+        expression = None
+        if unlocos is not None:
+            expression = ds.field("port").isin(list(unlocos))
+        if months is not None:
+            month_filter = ds.field("month").isin(list(months))
+            expression = month_filter if expression is None else expression & month_filter
+
+        table = dataset.to_table(columns=columns or PORT_CALL_SCHEMA.names, filter=expression)
+        df = table.to_pandas()
+        logging.info(f"Read {len(df)} port calls from {self.root}")
+        return df
+
+
+def read_port_calls(root=STORE_DIR, unlocos=None, months=None, columns=None):
+    return PortCallStore(root).read(unlocos=unlocos, months=months, columns=columns)
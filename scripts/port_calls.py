@@ -1,10 +1,12 @@
 import os
+import calendar
 import pandas as pd
-import json
-import requests
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import logging
+import telemetry
+from http_utils import TokenBucket, make_session
+from port_call_store import PortCallStore
 
 # Logging
 logging.basicConfig(
@@ -19,20 +21,31 @@ logging.basicConfig(
 load_dotenv()
 api_key = os.getenv("API_KEY")
 
+# Harvest settings: requests per second allowed by our API quota and number of parallel requests
+YEAR = int(os.getenv("PORT_CALLS_YEAR", "2024"))
+RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "5"))
+MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "8"))
+
+# Point at scripts/mock_api.py (e.g. http://localhost:8000/api/v2) to test throughput offline
+BASE_URL = os.getenv("MYSHIPTRACKING_BASE_URL", "https://api.myshiptracking.com/api/v2")
+
 # Configure download directory
 DOWNLOAD_DIR = os.path.abspath("./downloads/port-calls")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
+limiter = TokenBucket(RATE_LIMIT)
+session = make_session(pool_size=MAX_WORKERS, headers={"Authorization": f"Bearer {api_key}"}, limiter=limiter)
+
 def make_request(unloco, fromdate, todate):
-    url = f"https://api.myshiptracking.com/api/v2/port/calls?unloco={unloco}&fromdate={fromdate}&todate={todate}"
+    url = f"{BASE_URL}/port/calls?unloco={unloco}&fromdate={fromdate}&todate={todate}"
 
-    headers = {
-        "Authorization": f"Bearer {api_key}"
-    }
+    limiter.acquire()
     logging.info(f"Making request to {url}")
-    response = requests.get(url, headers=headers)
+    response = session.get(url)
     if not response.ok:
         logging.error(f"Error: {response.status_code}, {response.text}")
+        # Failed windows must not be recorded as fetched in the store
+        response.raise_for_status()
 
     return response.json()
 
@@ -42,24 +55,46 @@ def to_df(json_data):
 
     return new_df
 
-def get_port_data(unloco):
-    combined_df = pd.DataFrame()
-    
-    for month in range(1, 13):
-        month_str = f"{month:02d}"
-        fromdate = f"2024-{month_str}-01T00:00:00Z"
-        todate = f"2024-{month_str}-31T00:00:00Z"
+# (fromdate, todate) covering the whole calendar month
+def month_window(year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    fromdate = f"{year}-{month:02d}-01T00:00:00Z"
+    todate = f"{year}-{month:02d}-{last_day}T23:59:59Z"
+    return fromdate, todate
 
+def get_month_data(unloco, year, month):
+    fromdate, todate = month_window(year, month)
+    with telemetry.span("port_calls_window", port=unloco, month=f"{year}-{month:02d}") as span:
         data = make_request(unloco, fromdate, todate)
-        if data:
-            new_df = to_df(data)
-            combined_df = pd.concat([combined_df, new_df], ignore_index=True)
-        else:
-            logging.warning(f"Port {unloco}: no data for {month_str}.")
-        
-        sleep(1)
-    
-    return combined_df
+        df = to_df(data) if data else pd.DataFrame()
+        span.add_rows(len(df))
+    if not data:
+        logging.warning(f"Port {unloco}: no data for {month:02d}.")
+    return df
+
+# Fetch the given (unloco, year, month) windows in parallel; the token bucket keeps us within the quota.
+# Each finished window is handed to `sink` as soon as it arrives
+def harvest(windows, sink, max_workers=MAX_WORKERS):
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_month_data, unloco, year, month): (unloco, year, month)
+            for unloco, year, month in windows
+        }
+        for future in as_completed(futures):
+            unloco, year, month = futures[future]
+            try:
+                df = future.result()
+            except Exception as e:
+                logging.error(f"Port {unloco}, month {month:02d} failed: {e}")
+                failed.append((unloco, year, month))
+                continue
+
+            sink(unloco, year, month, df)
+            logging.info(f"Port {unloco}, month {month:02d}: {len(df)} calls")
+
+    return failed
 
 ports_dict = {
     "toamasina": "MGTOA",
@@ -92,20 +127,22 @@ ports_dict = {
     "berbera": "SOBBO"
 }
 
-baseline_df = pd.DataFrame()
-
-for unloco in ports_dict.values():
-    logging.info(f"PROCESSING PORT: {unloco}")
-    port_data = get_port_data(unloco)
-    if not port_data.empty:
-        baseline_df = pd.concat([baseline_df, port_data], ignore_index=True)
-        backup_path = os.path.join(DOWNLOAD_DIR, f"backup_{unloco}.csv")
-        baseline_df.to_csv(backup_path, index=False)
-        logging.info(f"Data for port {unloco} added to baseline DataFrame.")
-        logging.info(f"Unique port ids: {baseline_df['port_name'].unique()}")
-    else:
-        logging.warning(f"No data for port {unloco}.")
-
-all_ports_path = os.path.join(DOWNLOAD_DIR, "ALL_ports.csv")
-baseline_df.to_csv(all_ports_path, index=False)
-logging.info(f"All port data saved to {all_ports_path}")
\ No newline at end of file
+def main():
+    telemetry.configure("port_calls")
+    store = PortCallStore(os.path.join(DOWNLOAD_DIR, "store"))
+
+    # Only windows that are missing or stale are fetched, so a rerun after a crash resumes
+    windows = store.pending(ports_dict.values(), YEAR)
+    logging.info(f"{len(windows)} port/month windows to fetch")
+
+    failed = harvest(windows, store.write)
+    if failed:
+        logging.warning(f"{len(failed)} windows failed, rerun to fetch them: {failed}")
+
+    port_calls = store.read()
+    if not port_calls.empty:
+        logging.info(f"Unique port ids: {port_calls['port_name'].unique()}")
+    logging.info(f"All port data is in {store.root} ({len(port_calls)} calls)")
+
+if __name__ == "__main__":
+    main()
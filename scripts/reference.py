@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import hashlib
+import logging
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+MAPPING_DIR = os.path.join(DATA_DIR, "mapping")
+REFERENCE_FILE = os.path.join(DATA_DIR, "cache", "reference.npz")
+
+SOURCES = ["vessel_types.csv", "ais_types.csv", "ports_countries.csv", "assets_dict.csv", "countries.csv"]
+LOOKUPS = ["vessel_group", "ais_group", "flag_region", "port_country", "asset"]
+DENSE_MAX = 1 << 16
+
+
+# key -> value map stored as arrays: the unique keys, the categories of the values and one
+# category code per key (-1 for keys without a value). Small integer keys (AIS types) also get
+# a dense code table, so mapping them is a single take
+class Lookup:
+    def __init__(self, keys, values, categories=None):
+        self.keys = pd.Index(keys)
+        values = pd.Series(values, dtype=object)
+        if categories is None:
+            categories = sorted(values.dropna().unique())
+        self.categories = pd.Index(categories)
+        self.codes = self.categories.get_indexer(values).astype(np.int32)
+        self._build_dense()
+
+    def _build_dense(self):
+        self.dense = None
+        if self.keys.dtype.kind in "iu" and len(self.keys) and self.keys.min() >= 0 and self.keys.max() < DENSE_MAX:
+            self.dense = np.full(self.keys.max() + 1, -1, dtype=np.int32)
+            self.dense[self.keys.to_numpy()] = self.codes
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _codes_of_unique(self, keys):
+        positions = self.keys.get_indexer(keys)
+        return np.where(positions >= 0, self.codes[positions], -1)
+
+    # Category codes of the values of `keys` (-1 where there is no value). Keys are factorized
+    # first, so the hash lookup runs once per distinct key, not once per row
+    def lookup_codes(self, keys):
+        if isinstance(keys, pd.Series):
+            keys = keys.array
+        if isinstance(keys, pd.Categorical):
+            table = np.append(self._codes_of_unique(keys.categories), -1)
+            return table[keys.codes]
+
+        keys = np.asarray(keys)
+        if self.dense is not None and keys.dtype.kind in "iu":
+            valid = (keys >= 0) & (keys < len(self.dense))
+            codes = np.full(len(keys), -1, dtype=np.int32)
+            codes[valid] = self.dense[keys[valid]]
+            return codes
+
+        row_codes, uniques = pd.factorize(keys)
+        table = np.append(self._codes_of_unique(uniques), -1)
+        return table[row_codes]
+
+    def map(self, keys):
+        codes = self.lookup_codes(keys)
+        categorical = pd.Categorical.from_codes(codes, categories=self.categories)
+        if isinstance(keys, pd.Series):
+            return pd.Series(categorical, index=keys.index, name=keys.name)
+        return categorical
+
+    def get(self, key, default=None):
+        position = self.keys.get_indexer([key])[0]
+        if position < 0 or self.codes[position] < 0:
+            return default
+        return self.categories[self.codes[position]]
+
+    def to_dict(self):
+        return {key: self.categories[code] if code >= 0 else np.nan for key, code in zip(self.keys, self.codes)}
+
+    def arrays(self, name):
+        keys = self.keys.to_numpy() if self.keys.dtype.kind in "iu" else self.keys.to_numpy(dtype=str)
+        return {f"{name}_keys": keys, f"{name}_categories": self.categories.to_numpy(dtype=str), f"{name}_codes": self.codes}
+
+    @classmethod
+    def from_arrays(cls, arrays, name):
+        lookup = cls.__new__(cls)
+        keys = arrays[f"{name}_keys"]
+        lookup.keys = pd.Index(keys if keys.dtype.kind in "iu" else keys.astype(object))
+        lookup.categories = pd.Index(arrays[f"{name}_categories"].astype(object))
+        lookup.codes = arrays[f"{name}_codes"]
+        lookup._build_dense()
+        return lookup
+
+
+# All reference maps of data/mapping:
+#   vessel_group: vessel class -> group (vessel_types.csv)
+#   ais_group:    AIS type -> ais_group (ais_types.csv)
+#   flag_region:  ISO alpha-2 flag -> M49 region (countries.csv)
+#   port_country: port name -> country (ports_countries.csv)
+#   asset:        contract prefix -> asset, categories in assets_dict.csv order
+class Reference:
+    def __init__(self, lookups, source_hash=None):
+        self.lookups = lookups
+        self.source_hash = source_hash
+        for name, lookup in lookups.items():
+            setattr(self, name, lookup)
+
+    @classmethod
+    def from_csv(cls, mapping_dir=MAPPING_DIR):
+        vessel_types = pd.read_csv(os.path.join(mapping_dir, "vessel_types.csv"))
+        ais_types = pd.read_csv(os.path.join(mapping_dir, "ais_types.csv"))
+        ports = pd.read_csv(os.path.join(mapping_dir, "ports_countries.csv"))
+        assets = pd.read_csv(os.path.join(mapping_dir, "assets_dict.csv"))
+        # "NA" is Namibia, not a missing value
+        countries = pd.read_csv(
+            os.path.join(mapping_dir, "countries.csv"), sep=";", encoding="utf-8-sig",
+            dtype=str, keep_default_na=False,
+        )
+        countries = countries[countries["ISO-alpha2 Code"] != ""]
+
+        lookups = {
+            "vessel_group": Lookup(vessel_types["Class"], vessel_types["Group"]),
+            "ais_group": Lookup(ais_types["AIS_Type"].astype("int64"), ais_types["ais_group"]),
+            "flag_region": Lookup(countries["ISO-alpha2 Code"], countries["Region Name"].replace("", np.nan)),
+            "port_country": Lookup(ports["port_name"], ports["country_name"]),
+            "asset": Lookup(assets["code"], assets["name"], categories=list(dict.fromkeys(assets["name"]))),
+        }
+        return cls(lookups, source_hash(mapping_dir))
+
+    def save(self, path=REFERENCE_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {"source_hash": np.array(self.source_hash or "")}
+        for name, lookup in self.lookups.items():
+            arrays.update(lookup.arrays(name))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=REFERENCE_FILE):
+        with np.load(path) as data:
+            arrays = dict(data)
+        lookups = {name: Lookup.from_arrays(arrays, name) for name in LOOKUPS}
+        return cls(lookups, str(arrays["source_hash"]))
+
+    # Asset of every contract code (cu2406 -> COPPER), decoded once per distinct contract
+    def contract_assets(self, contracts):
+        codes, uniques = pd.factorize(pd.Series(contracts, dtype=object).str.strip())
+        prefixes = [match.group(0) if match else None for match in map(re.compile(r"^[a-z]+").match, uniques)]
+        table = np.append(self.asset._codes_of_unique(pd.Index(prefixes, dtype=object)), -1)
+        return pd.Categorical.from_codes(table[codes], categories=self.asset.categories)
+
+
+def source_hash(mapping_dir=MAPPING_DIR):
+    digest = hashlib.sha1()
+    for name in SOURCES:
+        with open(os.path.join(mapping_dir, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Reference maps, built once per process. With `cache_file` a prebuilt binary is used while it
+# matches the CSVs and is rebuilt when any of them changes
+@lru_cache(maxsize=None)
+def load_reference(mapping_dir=MAPPING_DIR, cache_file=None):
+    if cache_file and os.path.exists(cache_file):
+        reference = Reference.load(cache_file)
+        if reference.source_hash == source_hash(mapping_dir):
+            return reference
+        logging.info(f"{cache_file} is out of date, rebuilding it")
+
+    reference = Reference.from_csv(mapping_dir)
+    if cache_file:
+        reference.save(cache_file)
+    return reference
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    output_file = sys.argv[1] if len(sys.argv) > 1 else REFERENCE_FILE
+    Reference.from_csv().save(output_file)
+    logging.info(f"Reference maps saved to {output_file}")
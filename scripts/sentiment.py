@@ -0,0 +1,171 @@
+import os
+import re
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from features import DATA_DIR, sentiment_features, week_label
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache", "sentiment")
+OUTPUT_FILE = os.path.join(DATA_DIR, "sentiment.csv")
+BATCH_SIZE = 500
+
+# Small finance lexicons: Chinese terms are matched as substrings (no word boundaries in
+# yicai texts), English ones as whole lowercase words
+POSITIVE_ZH = [
+    "上涨", "上升", "增长", "利好", "回升", "反弹", "走强", "盈利", "突破", "提振", "改善",
+    "复苏", "乐观", "强劲", "超预期", "看好", "创新高", "企稳", "回暖", "增持",
+]
+NEGATIVE_ZH = [
+    "下跌", "下降", "利空", "回落", "走弱", "亏损", "风险", "下滑", "低迷", "萎缩",
+    "违约", "暴跌", "跌破", "悲观", "疲软", "不及预期", "担忧", "收缩", "减持", "创新低",
+]
+POSITIVE_EN = [
+    "gain", "gains", "rise", "rises", "rising", "growth", "grow", "surge", "surges", "rally",
+    "profit", "profits", "strong", "boost", "recovery", "recover", "optimism", "optimistic",
+    "record", "improve", "improves", "improved", "upbeat", "beat", "success", "win", "agreement",
+]
+NEGATIVE_EN = [
+    "fall", "falls", "falling", "drop", "drops", "decline", "declines", "loss", "losses",
+    "crisis", "weak", "slump", "crash", "risk", "risks", "fear", "fears", "recession", "war",
+    "attack", "killed", "dead", "deaths", "protest", "strike", "inflation", "shortage", "collapse",
+]
+
+
+# (positive - negative) / (positive + negative) hits of a lexicon, 0 for texts without hits.
+# Any picklable callable mapping a list of texts to a list of floats can replace it; `key`
+# names the cache, so a different scorer (or lexicon) never reuses another one's scores
+class LexiconScorer:
+    def __init__(self, positive_zh=POSITIVE_ZH, negative_zh=NEGATIVE_ZH, positive_en=POSITIVE_EN, negative_en=NEGATIVE_EN):
+        self.positive_zh = re.compile("|".join(map(re.escape, positive_zh)))
+        self.negative_zh = re.compile("|".join(map(re.escape, negative_zh)))
+        self.positive_en = set(positive_en)
+        self.negative_en = set(negative_en)
+
+        lexicon = "\n".join(["|".join(sorted(words)) for words in (positive_zh, negative_zh, positive_en, negative_en)])
+        self.key = "lexicon-" + hashlib.sha1(lexicon.encode()).hexdigest()[:12]
+
+    def score(self, text):
+        words = re.findall(r"[a-z']+", text.lower())
+        positive = len(self.positive_zh.findall(text)) + sum(word in self.positive_en for word in words)
+        negative = len(self.negative_zh.findall(text)) + sum(word in self.negative_en for word in words)
+        total = positive + negative
+        return (positive - negative) / total if total else 0.0
+
+    def __call__(self, texts):
+        return [self.score(text) for text in texts]
+
+
+def content_hash(texts):
+    return [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+
+
+# Articles of news.py (yicai: title + text) or news_old.py (Mediastack: description) as a
+# frame with naive `datetime` and `text` columns
+def load_articles(path, source):
+    if source == "yicai":
+        df = pd.read_csv(path, usecols=["datetime", "title", "text"], dtype=str)
+        text = df["title"].fillna("") + "\n" + df["text"].fillna("")
+        published = pd.to_datetime(df["datetime"], errors="coerce")
+    elif source == "mediastack":
+        df = pd.read_csv(path, usecols=["published_at", "description"], dtype=str)
+        text = df["description"].fillna("")
+        published = pd.to_datetime(df["published_at"], errors="coerce", utc=True).dt.tz_localize(None)
+    else:
+        raise ValueError(f"Unknown news source: {source}")
+
+    articles = pd.DataFrame({"datetime": published, "text": text})
+    return articles[articles["datetime"].notna() & (articles["text"].str.strip() != "")].reset_index(drop=True)
+
+
+# Scores of already seen texts, keyed by content hash. One Parquet file per scorer
+class ScoreCache:
+    def __init__(self, key, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, f"{key}.parquet")
+        if os.path.exists(self.path):
+            cached = pd.read_parquet(self.path)
+            self.scores = dict(zip(cached["hash"], cached["score"]))
+        else:
+            self.scores = {}
+        self._new = 0
+
+    def missing(self, hashes):
+        return [h for h in dict.fromkeys(hashes) if h not in self.scores]
+
+    def update(self, hashes, scores):
+        self.scores.update(zip(hashes, scores))
+        self._new += len(hashes)
+
+    def get(self, hashes):
+        return np.array([self.scores.get(h, np.nan) for h in hashes], dtype=np.float64)
+
+    def save(self):
+        if not self._new:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        df = pd.DataFrame({"hash": list(self.scores), "score": np.fromiter(self.scores.values(), dtype=np.float64)})
+        tmp_path = self.path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        self._new = 0
+
+
+# Add a `sentiment_score` column to `articles`. Only texts whose hash is not in the cache are
+# scored, in batches across a process pool (small increments are scored in-process)
+def score_articles(articles, scorer=None, cache_dir=CACHE_DIR, batch_size=BATCH_SIZE, max_workers=None):
+    scorer = scorer or LexiconScorer()
+    cache = ScoreCache(scorer.key, cache_dir)
+
+    hashes = content_hash(articles["text"])
+    missing = cache.missing(hashes)
+    if missing:
+        texts = dict(zip(hashes, articles["text"]))
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        logging.info(f"Scoring {len(missing)} new texts in {len(batches)} batches ({len(hashes) - len(missing)} cached)")
+
+        if len(batches) == 1:
+            cache.update(batches[0], scorer([texts[h] for h in batches[0]]))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(scorer, [[texts[h] for h in batch] for batch in batches])
+                for batch, scores in zip(batches, results):
+                    cache.update(batch, scores)
+        cache.save()
+
+    scored = articles.copy()
+    scored["sentiment_score"] = cache.get(hashes)
+    return scored
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Score news articles and aggregate the scores to weekly means")
+    parser.add_argument("--yicai", nargs="*", default=[], help="Article logs written by news.py")
+    parser.add_argument("--mediastack", nargs="*", default=[], help="CSVs written by news_old.py")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Per-article scores (input for features.py --sentiment)")
+    parser.add_argument("--weekly", help="Also write the weekly means to this CSV")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    frames = [load_articles(path, "yicai") for path in args.yicai]
+    frames += [load_articles(path, "mediastack") for path in args.mediastack]
+    if not frames:
+        parser.error("no input files, pass --yicai and/or --mediastack")
+    articles = pd.concat(frames, ignore_index=True)
+
+    scored = score_articles(articles, batch_size=args.batch_size, max_workers=args.workers)
+    scored[["datetime", "sentiment_score"]].to_csv(args.output, index=False)
+    logging.info(f"{len(scored)} article scores saved to {args.output}")
+
+    if args.weekly:
+        weekly = sentiment_features(scored)
+        weekly.insert(0, "week", week_label(weekly.index))
+        weekly.to_csv(args.weekly)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import os
+import glob
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import telemetry
+from vessel_sink import coerce_chunk
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+PORTS_FILE = os.path.join(DATA_DIR, "mapping", "ports_coords.csv")
+OUTPUT_FILE = os.path.join(DATA_DIR, "port_proximity.csv")
+SNAPSHOTS = sorted(glob.glob(os.path.join(DATA_DIR, "vessels", "vessels_[0-9]*.csv"))) + [os.path.join(DATA_DIR, "vessels", "bulk")]
+
+EARTH_RADIUS_NM = 3440.065
+CELL_DEGREES = 1.0
+
+# Defaults of the port features: vessels within RADIUS_NM of the port and vessels whose next port
+# is the port with an ETA within HORIZON_DAYS of the snapshot. Positions reported more than
+# MAX_POSITION_AGE before the snapshot are stale (the vessel is out of AIS coverage)
+RADIUS_NM = 25.0
+HORIZON_DAYS = 7
+MAX_POSITION_AGE = pd.Timedelta(days=3)
+
+# AIS navigational status codes
+AT_ANCHOR, MOORED = 1, 5
+
+# Weeks run Monday to Sunday (features.week_start)
+WEEK_FREQ = "W-SUN"
+
+
+# Great-circle distance in nautical miles; arguments in degrees, broadcast like numpy
+def haversine_nm(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype="float64")) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# Nanoseconds since the epoch of a timestamp in naive UTC
+def utc_ns(value):
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert("UTC").tz_localize(None)
+    return value.as_unit("ns").value
+
+
+# Monitored ports with their coordinates, indexed by UN/LOCODE
+def load_ports(path=PORTS_FILE):
+    return pd.read_csv(path).set_index("unloco")
+
+
+# Points bucketed into CELL_DEGREES x CELL_DEGREES cells and sorted by cell, so each latitude row
+# of a query box is one or two contiguous slices (two when the box crosses the antimeridian).
+# A radius query only computes distances to the points of the cells its circle touches
+class GridIndex:
+    def __init__(self, lat, lng, cell=CELL_DEGREES):
+        lat = np.asarray(lat, dtype="float64")
+        lng = np.asarray(lng, dtype="float64")
+        self.cell = cell
+        self.rows = int(np.ceil(180 / cell))
+        self.cols = int(np.ceil(360 / cell))
+
+        valid = np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) <= 90)
+        positions = np.flatnonzero(valid)
+        lat, lng = lat[valid], (lng[valid] + 180) % 360 - 180
+        cells = self._row(lat) * self.cols + self._col(lng)
+        order = np.argsort(cells, kind="stable")
+
+        self.positions = positions[order]
+        self.cells = cells[order]
+        self.lat = lat[order]
+        self.lng = lng[order]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _row(self, lat):
+        return np.clip(np.floor((lat + 90) / self.cell).astype(np.int64), 0, self.rows - 1)
+
+    def _col(self, lng):
+        return np.clip(np.floor((lng + 180) / self.cell).astype(np.int64), 0, self.cols - 1)
+
+    # Column ranges covering [lng - width, lng + width], split at the antimeridian
+    def _col_ranges(self, lng, width):
+        first = int(np.floor((lng - width + 180) / self.cell))
+        last = int(np.floor((lng + width + 180) / self.cell))
+        if width >= 180 or last - first + 1 >= self.cols:
+            return [(0, self.cols - 1)]
+        if first < 0:
+            return [(first + self.cols, self.cols - 1), (0, last)]
+        if last >= self.cols:
+            return [(first, self.cols - 1), (0, last - self.cols)]
+        return [(first, last)]
+
+    # Sorted slots of the points in the cells around a circle: every point within the radius and
+    # some just outside it
+    def _candidates(self, lat, lng, radius_nm):
+        angle = min(radius_nm / EARTH_RADIUS_NM, np.pi)
+        height = np.degrees(angle)
+        lng = (lng + 180) % 360 - 180
+
+        # Widest longitude extent of a spherical cap; a cap reaching a pole covers every longitude
+        if abs(lat) + height >= 90:
+            width = 180.0
+        else:
+            width = np.degrees(np.arcsin(min(1.0, np.sin(angle) / np.cos(np.radians(lat)))))
+
+        rows = np.arange(self._row(np.array([max(-90.0, lat - height)]))[0], self._row(np.array([min(90.0, lat + height)]))[0] + 1)
+        ranges = np.array(self._col_ranges(lng, width))
+        lo = (rows[:, None] * self.cols + ranges[:, 0]).ravel()
+        hi = (rows[:, None] * self.cols + ranges[:, 1]).ravel()
+        starts = np.searchsorted(self.cells, lo, side="left")
+        ends = np.searchsorted(self.cells, hi, side="right")
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)]) if len(starts) else np.array([], dtype=np.int64)
+
+    # Positions (in the arrays the index was built from) and distances of the points within
+    # `radius_nm` of one location
+    def around(self, lat, lng, radius_nm):
+        slots = self._candidates(lat, lng, radius_nm)
+        distances = haversine_nm(lat, lng, self.lat[slots], self.lng[slots])
+        inside = distances <= radius_nm
+        return self.positions[slots[inside]], distances[inside]
+
+    # Batch radius query: one row per (query, point) pair within `radius_nm`; `radius_nm` is a
+    # scalar or one radius per query
+    def within(self, lat, lng, radius_nm):
+        lat = np.asarray(lat, dtype="float64")
+        lng = np.asarray(lng, dtype="float64")
+        radius_nm = np.broadcast_to(np.asarray(radius_nm, dtype="float64"), lat.shape)
+        queries, points, distances = [], [], []
+        for query, (query_lat, query_lng, radius) in enumerate(zip(lat, lng, radius_nm)):
+            found, distance = self.around(query_lat, query_lng, radius)
+            queries.append(np.full(len(found), query, dtype=np.int64))
+            points.append(found)
+            distances.append(distance)
+        return pd.DataFrame({
+            "query": np.concatenate(queries) if queries else np.array([], dtype=np.int64),
+            "point": np.concatenate(points) if points else np.array([], dtype=np.int64),
+            "distance_nm": np.concatenate(distances) if distances else np.array([]),
+        })
+
+
+# Points sorted by (next port, ETA): the vessels bound for a port with an ETA in a window are one
+# slice found by two binary searches
+class InboundIndex:
+    def __init__(self, ports, etas):
+        codes, self.ports = pd.factorize(pd.Series(ports, dtype="string"))
+        etas = pd.to_datetime(pd.Series(etas), utc=True)
+        valid = (codes >= 0) & etas.notna().to_numpy()
+        positions = np.flatnonzero(valid)
+        eta_ns = etas.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)[valid]
+        order = np.lexsort((eta_ns, codes[valid]))
+
+        self.positions = positions[order]
+        self.codes = codes[valid][order]
+        self.etas = eta_ns[order]
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Positions of the points bound for `port` with start <= ETA < end
+    def arriving(self, port, start, end):
+        code = self.ports.get_indexer([port])[0]
+        if code < 0:
+            return np.array([], dtype=np.int64)
+        first = np.searchsorted(self.codes, code, side="left")
+        last = np.searchsorted(self.codes, code, side="right")
+        etas = self.etas[first:last]
+        lo = first + np.searchsorted(etas, utc_ns(start), side="left")
+        hi = first + np.searchsorted(etas, utc_ns(end), side="left")
+        return self.positions[lo:hi]
+
+    # Batch ETA query: one row per (port, point) pair with an ETA in [start, end)
+    def inbound(self, ports, start, end):
+        ports = list(ports)
+        found = [self.arriving(port, start, end) for port in ports]
+        return pd.DataFrame({
+            "port": np.repeat(np.array(ports, dtype=object), [len(points) for points in found]),
+            "point": np.concatenate(found) if found else np.array([], dtype=np.int64),
+        })
+
+
+# Vessel snapshots from bulk run files (Parquet) and legacy CSV shards; a directory stands for its
+# Parquet files. Every run file is one snapshot, while the legacy CSVs are shards of a single pull
+# (vessels_8.csv holds 90 vessels that are all in vessels_86.csv) and are merged into one snapshot,
+# so partial shards do not count as fleets of their own. A snapshot is taken at its latest
+# position report, and a vessel listed twice keeps its latest report
+def load_snapshots(paths):
+    runs, shards = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            runs.extend(sorted(glob.glob(os.path.join(path, "*.parquet"))))
+        elif not os.path.exists(path):
+            logging.warning(f"{path} does not exist, skipped")
+        elif path.endswith(".parquet"):
+            runs.append(path)
+        else:
+            shards.append(path)
+
+    groups = [(os.path.basename(path), [pd.read_parquet(path)]) for path in runs]
+    if shards:
+        groups.append(("+".join(os.path.basename(path) for path in shards), [pd.read_csv(path) for path in shards]))
+
+    frames = []
+    for name, parts in groups:
+        df = pd.concat([coerce_chunk(part) for part in parts], ignore_index=True)
+        df = df.dropna(subset=["mmsi"]).sort_values("received", kind="stable").drop_duplicates(subset="mmsi", keep="last")
+        if df.empty or df["received"].isna().all():
+            logging.warning(f"{name}: no timed position reports, skipped")
+            continue
+        frames.append(df.assign(snapshot=name, snapshot_time=df["received"].max()))
+    if not frames:
+        return pd.DataFrame(columns=["snapshot", "snapshot_time"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# Per (snapshot, port): vessels within `radius_nm` of the port (fresh positions only), of them at
+# anchor and moored, their mean speed, and vessels bound for the port with an ETA within
+# `horizon_days` of the snapshot together with their mean remaining distance (of those with a
+# fresh position) and hours to ETA
+def proximity_metrics(snapshots, ports, radius_nm=RADIUS_NM, horizon_days=HORIZON_DAYS, max_age=MAX_POSITION_AGE):
+    frames = []
+    horizon = pd.Timedelta(days=horizon_days)
+    for (snapshot, snapshot_time), df in snapshots.groupby(["snapshot", "snapshot_time"], sort=True):
+        df = df.reset_index(drop=True)
+        with telemetry.span("proximity_snapshot") as span:
+            fresh = (df["received"] >= snapshot_time - max_age).to_numpy()
+            lat = np.where(fresh, df["lat"].astype("float64").to_numpy(), np.nan)
+            lng = df["lng"].astype("float64").to_numpy()
+            grid = GridIndex(lat, lng)
+            near = grid.within(ports["lat"], ports["lng"], radius_nm)
+            near["port"] = ports.index.to_numpy()[near["query"]]
+            nav_status = df["nav_status"].astype("float64").to_numpy()[near["point"]]
+            near["anchored"] = nav_status == AT_ANCHOR
+            near["moored"] = nav_status == MOORED
+            near["speed"] = df["speed"].astype("float64").to_numpy()[near["point"]]
+            nearby = near.groupby("port").agg(
+                vessels_nearby=("point", "size"),
+                vessels_anchored=("anchored", "sum"),
+                vessels_moored=("moored", "sum"),
+                mean_speed_nearby=("speed", "mean"),
+            )
+
+            inbound = InboundIndex(df["next_port_unloco"], df["next_port_eta_utc"]).inbound(ports.index, snapshot_time, snapshot_time + horizon)
+            points = inbound["point"].to_numpy()
+            port_rows = ports.loc[inbound["port"]]
+            inbound["distance_nm"] = haversine_nm(lat[points], lng[points], port_rows["lat"], port_rows["lng"])
+            inbound["eta_hours"] = ((df["next_port_eta_utc"].iloc[points] - snapshot_time) / pd.Timedelta(hours=1)).to_numpy()
+            arriving = inbound.groupby("port").agg(
+                vessels_inbound=("point", "size"),
+                mean_inbound_distance_nm=("distance_nm", "mean"),
+                mean_inbound_eta_hours=("eta_hours", "mean"),
+            )
+
+            metrics = nearby.join(arriving, how="outer").reindex(ports.index)
+            metrics.index.name = "port"
+            frames.append(metrics.assign(snapshot=snapshot, snapshot_time=snapshot_time).reset_index())
+            span.set(snapshot=snapshot, vessels=len(df), nearby=len(near), inbound=len(inbound))
+            span.add_rows(len(df))
+
+    if not frames:
+        return pd.DataFrame()
+    out = pd.concat(frames, ignore_index=True)
+    count_columns = ["vessels_nearby", "vessels_anchored", "vessels_moored", "vessels_inbound"]
+    out[count_columns] = out[count_columns].fillna(0).astype("int64")
+    out["week_start"] = out["snapshot_time"].dt.tz_localize(None).dt.to_period(WEEK_FREQ).dt.start_time
+    return out.set_index(["port", "snapshot_time"]).sort_index()
+
+
+# Snapshot metrics averaged per (port, week), in the layout of the dwell metrics
+def port_week_proximity(metrics):
+    columns = [column for column in metrics.columns if column not in ("snapshot", "week_start")]
+    out = metrics.reset_index().groupby(["port", "week_start"])[columns].mean()
+    out["snapshots"] = metrics.reset_index().groupby(["port", "week_start"]).size()
+    return out
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Vessels around and bound for the monitored ports, per vessel snapshot")
+    parser.add_argument("snapshots", nargs="*", default=SNAPSHOTS, help="Bulk run Parquet files, directories of them or legacy vessel CSVs")
+    parser.add_argument("--ports", default=PORTS_FILE, help="Port coordinates (port_name, unloco, lat, lng)")
+    parser.add_argument("--radius", type=float, default=RADIUS_NM, help="Radius around each port in nautical miles")
+    parser.add_argument("--horizon", type=float, default=HORIZON_DAYS, help="Inbound vessels: ETA within this many days")
+    parser.add_argument("--max-age", type=float, default=MAX_POSITION_AGE / pd.Timedelta(hours=1), help="Ignore positions older than this many hours")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Per-port, per-week averages")
+    parser.add_argument("--snapshots-output", help="Also write one row per (port, snapshot)")
+    args = parser.parse_args()
+
+    telemetry.configure("spatial")
+    ports = load_ports(args.ports)
+    snapshots = load_snapshots(args.snapshots)
+    logging.info(f"{len(snapshots)} vessel positions in {snapshots['snapshot'].nunique()} snapshots, {len(ports)} ports")
+
+    metrics = proximity_metrics(snapshots, ports, args.radius, args.horizon, pd.Timedelta(hours=args.max_age))
+    if metrics.empty:
+        logging.warning("No snapshots, nothing to write")
+        return
+
+    weekly = port_week_proximity(metrics)
+    weekly.to_csv(args.output)
+    logging.info(f"{len(weekly)} port-weeks saved to {args.output}")
+    if args.snapshots_output:
+        metrics.to_csv(args.snapshots_output)
+        logging.info(f"{len(metrics)} port snapshots saved to {args.snapshots_output}")
+
+
+if __name__ == "__main__":
+    main()
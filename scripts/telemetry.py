@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Spans and counters shared by the fetchers and parsers. Everything is aggregated in memory
+# (by metric name and labels); a script that calls configure() also gets
+#   <dir>/<job>.jsonl  one line per finished span, with its labels, duration and fields
+#   <dir>/<job>.prom   Prometheus textfile (node_exporter textfile collector), rewritten atomically
+# Labels are low-cardinality dimensions (stage, port, month, endpoint); per-chunk or per-file
+# detail goes into span fields, which only reach the JSON lines
+TELEMETRY_DIR = os.getenv("TELEMETRY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "logs", "telemetry"))
+PREFIX = "bri_"
+FLUSH_INTERVAL = 15.0
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.rows = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def add_rows(self, rows):
+        self.rows = (self.rows or 0) + int(rows)
+
+
+class Telemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.job = None
+        self.instance = None
+        self.directory = None
+        self.events = None
+        self.counters = {}
+        self.timings = {}
+        self.last_flush = time.monotonic()
+
+    def configure(self, job, directory=None, instance=None):
+        with self.lock:
+            if self.events is not None:
+                self.events.close()
+            self.job = job
+            self.instance = instance
+            self.directory = os.path.abspath(directory or TELEMETRY_DIR)
+            os.makedirs(self.directory, exist_ok=True)
+            self.events = open(os.path.join(self.directory, f"{self.file_name}.jsonl"), "a", encoding="utf-8")
+            self.counters = {}
+            self.timings = {}
+
+    @property
+    def file_name(self):
+        return f"{self.job}-{self.instance}" if self.instance else self.job
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Duration summary of `name`: count, sum and max of the observed seconds
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            count, total, peak = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + seconds, max(peak, seconds))
+
+    @contextmanager
+    def span(self, name, **labels):
+        span = Span(name, labels)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield span
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, span.rows, status, span.fields, **labels)
+
+    # A finished span measured elsewhere (e.g. in a worker process that returns its timing)
+    def record(self, name, seconds, rows=None, status="ok", fields=None, **labels):
+        self.observe(f"{name}_seconds", seconds, **labels)
+        self.count(f"{name}_total", 1, status=status, **labels)
+        if rows is not None:
+            self.count(f"{name}_rows_total", rows, **labels)
+        if self.events is None:
+            return
+
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "job": self.job,
+            "span": name,
+            **labels,
+            "seconds": round(seconds, 6),
+            "status": status,
+        }
+        if rows is not None:
+            record["rows"] = rows
+            record["rows_per_second"] = round(rows / seconds, 3) if seconds > 0 else None
+        record.update(fields or {})
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self.lock:
+            self.events.write(line + "\n")
+            self.events.flush()
+            due = time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def prometheus(self):
+        job = {"job": self.job or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"}
+        if self.instance:
+            job["instance"] = self.instance
+
+        def series(name, labels, value):
+            labels = ",".join(f'{label}="{escape(text)}"' for label, text in [*job.items(), *labels])
+            return f"{PREFIX}{name}{{{labels}}} {value if isinstance(value, int) else repr(float(value))}"
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        blocks = {}
+        for (name, labels), value in counters:
+            blocks.setdefault((name, "counter"), []).append(series(name, labels, value))
+        for (name, labels), (count, total, peak) in timings:
+            blocks.setdefault((name, "summary"), []).extend([series(f"{name}_count", labels, count), series(f"{name}_sum", labels, total)])
+            blocks.setdefault((f"{name}_max", "gauge"), []).append(series(f"{name}_max", labels, peak))
+        blocks[("last_update_timestamp_seconds", "gauge")] = [series("last_update_timestamp_seconds", [], time.time())]
+
+        lines = []
+        for (name, kind), block in blocks.items():
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            lines.extend(block)
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{self.file_name}.prom")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write {path}: {e}")
+
+
+telemetry = Telemetry()
+configure = telemetry.configure
+count = telemetry.count
+observe = telemetry.observe
+span = telemetry.span
+record = telemetry.record
+flush = telemetry.flush
+atexit.register(flush)
@@ -0,0 +1,148 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from vessel_sink import coerce_chunk
+
+REGISTRY_FILE = os.path.abspath("../data/vessels/registry.parquet")
+
+# /vessel/bulk accepts at most 100 MMSIs per call
+BULK_SIZE = 100
+
+# Attributes of the hull that practically never change
+STATIC_FIELDS = [
+    "vessel_name", "imo", "vtype", "callsign", "ais_type", "vessel_type",
+    "size_a", "size_b", "size_c", "size_d", "flag", "flag_mid", "gt", "dwt", "built",
+]
+
+# Everything else in the extended response (position, voyage, ports, speeds, weather)
+DYNAMIC_FIELDS = [
+    "lat", "lng", "course", "speed", "nav_status", "received", "draught", "destination", "eta",
+    "current_port", "current_port_id", "current_port_unloco", "current_port_country",
+    "current_port_arr_utc", "current_port_arr_local",
+    "last_port", "last_port_id", "last_port_unloco", "last_port_country",
+    "last_port_dep_utc", "last_port_dep_local",
+    "next_port", "next_port_id", "next_port_unloco", "next_port_country",
+    "next_port_eta_utc", "next_port_eta_local",
+    "avg_sog", "max_sog", "distance_covered",
+    "wind_knots", "wind_direction", "humidity", "pressure", "temperature", "visibility",
+]
+
+DEFAULT_TTLS = {
+    "static": timedelta(days=180),
+    "dynamic": timedelta(days=1),
+}
+
+# Column holding the time a field group was last refreshed
+FETCHED_AT = {
+    "static": "static_fetched_at",
+    "dynamic": "dynamic_fetched_at",
+}
+
+
+def field_group(field):
+    return "static" if field in STATIC_FIELDS else "dynamic"
+
+
+# Registry of the latest known attributes per MMSI. Every field belongs to a group with its
+# own TTL; `field_ttls` overrides the TTL of single fields (e.g. {"avg_sog": timedelta(days=7)})
+class VesselRegistry:
+    def __init__(self, path=REGISTRY_FILE, ttls=None, field_ttls=None):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.field_ttls = field_ttls or {}
+        self.df = self._load()
+        self._pending = []
+
+    def _load(self):
+        if os.path.exists(self.path):
+            df = pd.read_parquet(self.path)
+            logging.info(f"Loaded {len(df)} vessels from {self.path}")
+            return df.set_index("mmsi")
+        return pd.DataFrame(columns=list(FETCHED_AT.values()), index=pd.Index([], name="mmsi", dtype="int64"))
+
+    def __len__(self):
+        self._flush()
+        return len(self.df)
+
+    # Updates are buffered and merged in one go, so upserting chunk by chunk stays linear
+    def _flush(self):
+        if not self._pending:
+            return
+
+        updates = pd.concat(self._pending)
+        updates = updates[~updates.index.duplicated(keep="last")]
+        self._pending = []
+
+        if self.df.empty:
+            self.df = updates
+            return
+
+        # Keep timestamps of field groups that were not refreshed by the update
+        previous = self.df.reindex(updates.index)
+        for column in FETCHED_AT.values():
+            updates[column] = updates[column].fillna(previous[column])
+        self.df = pd.concat([self.df.drop(index=updates.index, errors="ignore"), updates])
+
+    def save(self):
+        self._flush()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        self.df.reset_index().to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        logging.info(f"Registry with {len(self.df)} vessels saved to {self.path}")
+
+    # Shortest TTL among the requested fields, per field group
+    def _group_ttls(self, fields):
+        group_ttls = {}
+        for field in fields:
+            group = field_group(field)
+            ttl = self.field_ttls.get(field, self.ttls[group])
+            group_ttls[group] = min(ttl, group_ttls.get(group, ttl))
+        return group_ttls
+
+    # MMSIs that are unknown or have at least one of `fields` older than its TTL
+    def stale(self, mmsis, fields=None, now=None):
+        self._flush()
+        now = now or datetime.now(timezone.utc)
+        fields = fields or STATIC_FIELDS + DYNAMIC_FIELDS
+        mmsis = pd.Index(pd.unique(pd.Series(mmsis, dtype="int64")))
+
+        known = self.df.reindex(mmsis)
+        expired = pd.Series(False, index=mmsis)
+        for group, ttl in self._group_ttls(fields).items():
+            fetched_at = pd.to_datetime(known[FETCHED_AT[group]], utc=True)
+            expired |= fetched_at.isna() | (fetched_at < now - ttl)
+
+        return expired.index[expired.to_numpy()].tolist()
+
+    # Stale MMSIs packed into full bulk requests
+    def batches(self, mmsis, fields=None, size=BULK_SIZE):
+        stale = self.stale(mmsis, fields=fields)
+        return [stale[i:i + size] for i in range(0, len(stale), size)]
+
+    # Insert or replace vessels from a bulk response; `groups` are the field groups the rows refresh
+    def upsert(self, df, fetched_at=None, groups=("static", "dynamic")):
+        if df.empty:
+            return
+
+        fetched_at = pd.Timestamp(fetched_at or datetime.now(timezone.utc))
+        df = coerce_chunk(df).dropna(subset=["mmsi"]).drop_duplicates(subset="mmsi", keep="last")
+        df["mmsi"] = df["mmsi"].astype("int64")
+        for group, column in FETCHED_AT.items():
+            df[column] = fetched_at if group in groups else pd.NaT
+        self._pending.append(df.set_index("mmsi"))
+
+    # Import a legacy shard (e.g. vessels_86.csv) using the file modification time as fetch time
+    def seed_from_csv(self, path):
+        fetched_at = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+        df = pd.read_csv(path)
+        self.upsert(df, fetched_at=fetched_at)
+        logging.info(f"Seeded {len(df)} vessels from {path}")
+
+    def get(self, mmsis, fields=None):
+        self._flush()
+        df = self.df.reindex(pd.Index(mmsis, dtype="int64", name="mmsi"))
+        if fields is not None:
+            df = df.reindex(columns=fields)
+        return df.reset_index()
@@ -0,0 +1,123 @@
+import os
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Schema of the extended /vessel/bulk response
+VESSEL_SCHEMA = pa.schema([
+    ("vessel_name", pa.string()),
+    ("mmsi", pa.int64()),
+    ("imo", pa.int64()),
+    ("vtype", pa.int16()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("course", pa.float32()),
+    ("speed", pa.float32()),
+    ("nav_status", pa.int16()),
+    ("received", pa.timestamp("s", tz="UTC")),
+    ("callsign", pa.string()),
+    ("ais_type", pa.int16()),
+    ("vessel_type", pa.string()),
+    ("size_a", pa.float32()),
+    ("size_b", pa.float32()),
+    ("size_c", pa.float32()),
+    ("size_d", pa.float32()),
+    ("draught", pa.float32()),
+    ("flag", pa.string()),
+    ("flag_mid", pa.int16()),
+    ("gt", pa.float32()),
+    ("dwt", pa.float32()),
+    ("built", pa.int16()),
+    ("destination", pa.string()),
+    ("eta", pa.timestamp("s", tz="UTC")),
+    ("current_port", pa.string()),
+    ("current_port_id", pa.int32()),
+    ("current_port_unloco", pa.string()),
+    ("current_port_country", pa.string()),
+    ("current_port_arr_utc", pa.timestamp("s", tz="UTC")),
+    ("current_port_arr_local", pa.timestamp("s")),
+    ("last_port", pa.string()),
+    ("last_port_id", pa.int32()),
+    ("last_port_unloco", pa.string()),
+    ("last_port_country", pa.string()),
+    ("last_port_dep_utc", pa.timestamp("s", tz="UTC")),
+    ("last_port_dep_local", pa.timestamp("s")),
+    ("next_port", pa.string()),
+    ("next_port_id", pa.int32()),
+    ("next_port_unloco", pa.string()),
+    ("next_port_country", pa.string()),
+    ("next_port_eta_utc", pa.timestamp("s", tz="UTC")),
+    ("next_port_eta_local", pa.timestamp("s")),
+    ("avg_sog", pa.float32()),
+    ("max_sog", pa.float32()),
+    ("distance_covered", pa.float32()),
+    ("wind_knots", pa.int16()),
+    ("wind_direction", pa.string()),
+    ("humidity", pa.float32()),
+    ("pressure", pa.float32()),
+    ("temperature", pa.float32()),
+    ("visibility", pa.float32()),
+])
+
+
+# Cast a raw chunk (API response or legacy CSV) to the columns and types of VESSEL_SCHEMA.
+# Unknown columns are dropped, missing ones are filled with nulls
+def coerce_chunk(df):
+    extra = set(df.columns) - set(VESSEL_SCHEMA.names)
+    if extra:
+        logging.debug(f"Dropping columns not in the vessel schema: {sorted(extra)}")
+
+    columns = {}
+    for field in VESSEL_SCHEMA:
+        values = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype="object")
+        if pa.types.is_integer(field.type):
+            values = pd.to_numeric(values, errors="coerce").round().astype(f"Int{field.type.bit_width}")
+        elif pa.types.is_floating(field.type):
+            values = pd.to_numeric(values, errors="coerce").astype(f"float{field.type.bit_width}")
+        elif pa.types.is_timestamp(field.type):
+            values = pd.to_datetime(values, errors="coerce", utc=field.type.tz is not None, format="ISO8601")
+            if field.type.tz is None and isinstance(values.dtype, pd.DatetimeTZDtype):
+                values = values.dt.tz_localize(None)
+            values = values.astype("datetime64[s, UTC]" if field.type.tz else "datetime64[s]")
+        else:
+            values = values.astype("string")
+        columns[field.name] = values
+
+    return pd.DataFrame(columns, index=df.index)
+
+
+# Appends every chunk to a single Parquet file as its own row group: each row is written
+# exactly once and only the current chunk is held in memory
+class VesselChunkWriter:
+    def __init__(self, path, schema=VESSEL_SCHEMA):
+        self.path = path
+        self.schema = schema
+        self.rows = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._tmp_path = path + ".tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, schema, compression="zstd")
+
+    def write(self, df):
+        if df.empty:
+            return
+        table = pa.Table.from_pandas(coerce_chunk(df), schema=self.schema, preserve_index=False)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    # The file only appears under its final name once it is complete
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        logging.info(f"{self.rows} vessels written to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    # A run that raised is not published: its rows stay under the temporary name
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        self._writer.close()
+        logging.warning(f"Run failed after {self.rows} vessels, partial file left at {self._tmp_path}")
@@ -0,0 +1,59 @@
+import pandas as pd
+from dedup import NearDuplicateIndex, dedup_file
+
+
+def write_log(path, descriptions):
+    pd.DataFrame({"description": descriptions}).to_csv(path, index=False)
+
+
+def story(i):
+    return f"story number {i}: " + " ".join(f"word{i}x{j}" for j in range(30))
+
+
+# A rerun over an append-only log that grew in between keeps the rows kept before and only
+# checks the new rows against the saved index
+def test_rerun_on_grown_log_keeps_earlier_rows(tmp_path):
+    log = tmp_path / "news.csv"
+    output = tmp_path / "out.csv"
+    index_file = str(tmp_path / "index.npz")
+
+    first = [story(i) for i in range(5)] + [story(0)]
+    write_log(log, first)
+    index = NearDuplicateIndex()
+    dedup_file(index, str(log), "mediastack", str(output))
+    index.save(index_file)
+    assert len(pd.read_csv(output)) == 5
+
+    write_log(log, first + [story(5), story(1), story(6)])
+    index = NearDuplicateIndex.load(index_file)
+    dedup_file(index, str(log), "mediastack", str(output))
+
+    kept = pd.read_csv(output)["description"].tolist()
+    assert kept == [story(i) for i in range(5)] + [story(5), story(6)]
+    assert len(index) == 7
+
+
+# Rows keep their keys when news_old.py inserts refetched articles above them: the old rows
+# stay, and the inserted rows are checked against the index
+def test_rows_inserted_above_existing_rows(tmp_path):
+    log = tmp_path / "news.csv"
+    output = tmp_path / "out.csv"
+    index_file = str(tmp_path / "index.npz")
+
+    def write(rows):
+        pd.DataFrame(rows, columns=["url", "description"]).to_csv(log, index=False)
+
+    old = [(f"https://example.com/{i}", story(i)) for i in range(5)]
+    write(old)
+    index = NearDuplicateIndex()
+    dedup_file(index, str(log), "mediastack", str(output))
+    index.save(index_file)
+
+    inserted = [("https://example.com/new", story(9)), ("https://mirror.example.com/4", story(4))]
+    write(old[:2] + inserted + old[2:])
+    index = NearDuplicateIndex.load(index_file)
+    dedup_file(index, str(log), "mediastack", str(output))
+
+    kept = pd.read_csv(output)["url"].tolist()
+    assert kept == [url for url, _ in old[:2]] + ["https://example.com/new"] + [url for url, _ in old[2:]]
+    assert len(index) == 6
@@ -0,0 +1,25 @@
+import pandas as pd
+from dwell import pair_calls
+
+
+def calls(rows):
+    return pd.DataFrame(rows, columns=["mmsi", "port_name", "event", "time_utc"])
+
+
+# An arrival without a departure is only still in port if the vessel was not seen at another
+# port afterwards; otherwise its departure was lost
+def test_vessel_seen_at_a_later_port_has_left():
+    log = calls([
+        (1, "Durban", "arrival", "2024-03-01T00:00:00Z"),
+        (1, "Cape Town", "arrival", "2024-03-06T00:00:00Z"),
+        (2, "Durban", "arrival", "2024-03-08T00:00:00Z"),
+        (2, "Durban", "departure", "2024-03-09T00:00:00Z"),
+        (3, "Durban", "arrival", "2024-03-09T00:00:00Z"),
+    ])
+    pairs = pair_calls(log, until="2024-03-11")
+    status = pairs.set_index(["mmsi", "port_name"])["status"].astype(str)
+
+    assert status[(1, "Durban")] == "no_departure"
+    assert status[(1, "Cape Town")] == "in_port"
+    assert status[(2, "Durban")] == "complete"
+    assert status[(3, "Durban")] == "in_port"
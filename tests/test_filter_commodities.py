@@ -0,0 +1,25 @@
+from filter_commodities import filter_relevant_rows
+
+REPORT = """Weekly report
+Species,Open,High,Low,Close,Change,OI,OI Change,Settle,Volume,Turnover
+cu2406   ,80020,80380,79410,79580,-1620,30940,-4310,79750,16930,675123.8,
+sc2407   ,598.8,599.0,595.1,597.6,13.7,24795,-2301,597.4,0,31686,1892973.69
+sc2408   ,596.0,597.7,593.8,596.3,13.7,17975,-1592,595.9,,15427,919435.46,
+Subtotal,,,,,,,,,3,
+"""
+
+
+# sc rows have an extra 10th field; Volume and Turnover must not shift into each other
+def test_sc_rows_drop_the_extra_field(tmp_path):
+    path = tmp_path / "2024-06-10--2024-06-16.txt"
+    path.write_text(REPORT)
+    df = filter_relevant_rows(str(path), "2024-06-10", "2024-06-16").set_index("Species")
+
+    assert df.loc["cu2406", "Volume"] == 16930
+    assert df.loc["cu2406", "Turnover"] == 675123.8
+    assert df.loc["sc2407", "Weekly Volume"] == 597.4
+    assert df.loc["sc2407", "Volume"] == 31686
+    assert df.loc["sc2407", "Turnover"] == 1892973.69
+    assert df.loc["sc2408", "Volume"] == 15427
+    assert df.loc["sc2408", "Turnover"] == 919435.46
+    assert list(df.columns[-2:]) == ["Week Start", "Week End"]
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from lags import shift_features
+
+
+# Windows containing a NaN, and the first k-1 rows, are NaN as with pandas rolling(k).mean()
+def test_rolling_means_match_pandas_around_gaps():
+    frame = pd.DataFrame({
+        "a": [1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0],
+        "b": [np.nan, 1.0, 2.0, 3.0, np.nan, np.nan, 8.0],
+    })
+    features = shift_features(frame, lags=(1,), leads=(1,), windows=(1, 3), dtype=np.float64)
+    for k in (1, 3):
+        expected = frame.rolling(k).mean()
+        for column in frame.columns:
+            np.testing.assert_allclose(features[f"{column}_roll{k}"], expected[column])
+    np.testing.assert_allclose(features["a_lag1"], frame["a"].shift(1))
+    np.testing.assert_allclose(features["b_lead1"], frame["b"].shift(-1))
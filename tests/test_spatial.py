@@ -0,0 +1,24 @@
+import pandas as pd
+from spatial import load_snapshots, proximity_metrics, port_week_proximity
+
+PORTS = pd.DataFrame({"unloco": ["ZACPT"], "port_name": ["Cape Town"], "lat": [-33.9], "lng": [18.43]}).set_index("unloco")
+
+
+def write_shard(path, mmsis, received="2025-05-04T11:00:00Z"):
+    pd.DataFrame({
+        "mmsi": mmsis, "lat": -33.9, "lng": 18.43, "speed": 0.5, "nav_status": 5, "received": received,
+    }).to_csv(path, index=False)
+
+
+# Legacy CSVs are shards of one pull: a small shard whose vessels are all in the large one must
+# not count as a second, nearly empty fleet that halves the weekly averages
+def test_legacy_shards_are_one_snapshot(tmp_path):
+    write_shard(tmp_path / "vessels_8.csv", [1, 2], received="2025-05-04T10:00:00Z")
+    write_shard(tmp_path / "vessels_86.csv", [1, 2, 3, 4])
+    snapshots = load_snapshots([str(tmp_path / "vessels_8.csv"), str(tmp_path / "vessels_86.csv")])
+
+    assert snapshots["snapshot"].nunique() == 1
+    assert len(snapshots) == 4
+    weekly = port_week_proximity(proximity_metrics(snapshots, PORTS))
+    assert weekly.loc["ZACPT", "vessels_nearby"].tolist() == [4]
+    assert weekly.loc["ZACPT", "snapshots"].tolist() == [1]